@@ -22,9 +22,9 @@ DAP_PROTOCOL_STRING_LEN  = 5
 DAP_PROTOCOL_STRING      = Cat(C(DAP_PROTOCOL_STRING_LEN+1,8),C(ord('2'),8),C(ord('.'),8),C(ord('1'),8),C(ord('.'),8),C(ord('0'),8),C(0,8)) # Protocol version V2.1.0
 DAP_VERSION_STRING_LEN   = len(get_version().encode('utf-8'))
 DAP_VERSION_STRING       = Cat(C(DAP_VERSION_STRING_LEN+1,8), *(C(c, 8) for c in get_version().encode('utf-8')), C(0,8))
-DAP_CAPABILITIES         = 0x03             # JTAG and SWD Debug
+DAP_CAPABILITIES         = 0x13             # JTAG and SWD Debug, Atomic Commands
 DAP_TD_TIMER_FREQ        = 0x3B9ACA00       # 1uS resolution timer
-DAP_MAX_PACKET_COUNT     = 1                # 1 max packet count
+DAP_MAX_PACKET_COUNT     = 4                # Packets buffered in each direction by the SoC
 DAP_V1_MAX_PACKET_SIZE   = 64
 DAP_V2_MAX_PACKET_SIZE   = 508
 MAX_MSG_LEN              = DAP_V2_MAX_PACKET_SIZE
@@ -117,8 +117,8 @@ ACK_ERROR                = 4
 # DAP_Transfer           : Done (Masking & Match done, not tested)
 # DAP_TransferBlock      : Done
 # DAP_TransferAbort      : Done
-# DAP_ExecuteCommands    : Not Implemented (indicated in config bits)
-# DAP_QueueCommands      : Not Implemented (indicated in config bits)
+# DAP_ExecuteCommands    : Done
+# DAP_QueueCommands      : Done (Executed immediately, as ExecuteCommands)
 
 # This is the RAM used to store responses before they are sent back to the host
 # =============================================================================
@@ -206,14 +206,24 @@ class CMSIS_DAP(Elaboratable):
 
         # Support for DAP_Transfer_Block
         self.tfB_txb        = Signal(4)      # TFR Block State machine index (12 states)
-        self.Bretries       = Signal(16)     # Retry counter for WAIT
-        self.transferBCount = Signal(16)     # Number of transfers 1..65535
+        self.transferBCount = Signal(16)     # Number of transfers 1..65535 still to complete
+        self.transferBIssue = Signal(17)     # Number of transactions still to be queued
         self.readBDelay     = Signal()       # We are doing a posted read
         self.readBIgnore    = Signal()       # Don't swallow this data, we're starting to post
+        self.wdata          = Signal(32)     # Write data collected ahead of the transaction that needs it
+        self.wcount         = Signal(3)      # Number of bytes collected in wdata (0..4)
 
         # Support for RESP_Transfer_Complete
-        self.txb            = Signal(4)      # Transfer complete state machine (8 states)
+        self.txb            = Signal(4)      # Transfer complete state machine (5 states)
         self.transferCCount = Signal(16)     # Number of transfers 1..65535
+        self.txWord         = Signal(32)     # Word being returned
+        self.txByte         = Signal(2)      # Byte of txWord on the stream
+
+        # Support for DAP_ExecuteCommands and DAP_QueueCommands
+        self.batched        = Signal()       # Indicator that this packet is a batch of commands
+        self.cmdCount       = Signal(8)      # Number of commands in the batch still to be started
+        self.lastCmd        = Signal()       # This response is the last one in the packet
+        self.batchLen       = Signal(range(MAX_MSG_LEN))     # Length of responses already returned in this batch
 
         # CMSIS-DAP Configuration info
         self.waitRetry      = Signal(16,reset=4096) # Number of transfer retries after WAIT response
@@ -224,12 +234,26 @@ class CMSIS_DAP(Elaboratable):
     # ----------------------------------------------------------------------------------
     def RESP_Invalid(self, m):
         # Simply transmit an 'invalid' packet back
+        # Anything left in a batch can't be parsed, so this is the last response
         m.d.sync += [
             self.txBlock.word_select(0,8).eq(C(DAP_Invalid,8)),
-            self.txLen.eq(1)
+            self.txLen.eq(1),
+            self.cmdCount.eq(0)
         ]
         m.next = 'RESPOND'
     # ----------------------------------------------------------------------------------
+    def RESP_Finish(self, m):
+        # Move on to the next command in a batch, or close the response packet
+        with m.If(self.cmdCount!=0):
+            m.d.sync += self.batchLen.eq(self.batchLen+self.txedLen)
+            m.next = 'NextCommand'
+        with m.Elif(self.isV2 | (self.batchLen+self.txedLen==DAP_V1_MAX_PACKET_SIZE)):
+            m.next = 'IDLE'
+        with m.Else():
+            # V1 packets are padded to full length, including any earlier responses
+            m.d.sync += self.txedLen.eq(self.batchLen+self.txedLen)
+            m.next = 'V1PACKETFILL'
+    # ----------------------------------------------------------------------------------
     def RESP_Info(self, m):
         # <b:0x00> <b:requestId>
         # Transmit requested information packet back
@@ -252,7 +276,7 @@ class CMSIS_DAP(Elaboratable):
             with m.Case(0xF1): # Get the Test Domain Timer parameter information
                 m.d.sync+=[self.txLen.eq(6), self.txBlock[8:56].eq(Cat(C(8,8),C(DAP_TD_TIMER_FREQ,32)))]
             with m.Case(0xFE): # Get the maximum Packet Count (BYTE)
-                m.d.sync+=[self.txLen.eq(6), self.txBlock[8:24].eq(Cat(C(1,8),C(DAP_MAX_PACKET_COUNT,8)))]
+                m.d.sync+=[self.txLen.eq(3), self.txBlock[8:24].eq(Cat(C(1,8),C(DAP_MAX_PACKET_COUNT,8)))]
             with m.Case(0xFF): # Get the maximum Packet Size (SHORT).
                 with m.If(self.isV2):
                     m.d.sync+=[self.txLen.eq(6), self.txBlock[8:32].eq(Cat(C(2,8),C(DAP_V2_MAX_PACKET_SIZE,16)))]
@@ -325,6 +349,17 @@ class CMSIS_DAP(Elaboratable):
             m.d.sync += self.txBlock.bit_select(8,8).eq(Mux(self.dbgif.perr,0xff,0))
             m.next='RESPOND'
     # ----------------------------------------------------------------------------------
+    def RESP_ExecuteCommands(self, m):
+        # <b:0x7F> <b:NumCommands> n x [ <Command> ]
+        # Return the number of commands, followed by the response to each of them in turn.
+        # QueueCommands is handled identically, responses being in the same format.
+        m.d.sync += [
+            self.txBlock.word_select(0,16).eq(Cat(C(DAP_ExecuteCommands,8),self.rxBlock.word_select(1,8))),
+            self.cmdCount.eq(self.rxBlock.word_select(1,8)),
+            self.batched.eq(1)
+        ]
+        m.next = 'RESPOND'
+    # ----------------------------------------------------------------------------------
     def RESP_Disconnect(self, m):
         # <b:0x03>
         # Perform disconnect
@@ -750,7 +785,7 @@ class CMSIS_DAP(Elaboratable):
                         self.streamIn.payload.eq(self.txBlock.word_select((self.tfr_txb-10).as_unsigned(),8)),
                         self.streamIn.valid.eq(1),
                         self.tfr_txb.eq(self.tfr_txb+1),
-                        self.streamIn.last.eq(self.isV2 & (self.tfr_txb==12) & (self.tfrram.adr==0))
+                        self.streamIn.last.eq(self.isV2 & self.lastCmd & (self.tfr_txb==12) & (self.tfrram.adr==0))
                     ]
 
             # Initial data sent, send any remaining material ------------------------------------------
@@ -770,20 +805,22 @@ class CMSIS_DAP(Elaboratable):
         # Note that a posted read can stretch over multiple calls to this handler, so we have
         # to be careful to maintain posted status, (and reset it when any other call is done).
 
+        # We will not read back the first word immediately if we're in JTAG read
+        # or SWD read of the AP
+        posted = ((self.isJTAG & self.rxBlock.bit_select(33,1)) |
+                  ((~self.isJTAG) & (self.rxBlock.bit_select(32,2)==3)))
+
+        # We only delay the first read if we weren't already in delay mode
+        ignore = (~self.readBDelay) & posted
+
         m.d.sync += [
             # DAP Index is 1 byte in, transfer count is dealt with at the end
             self.dbgif.dev.eq(self.rxBlock.bit_select(8,3)),
             self.tfrram.adr.eq(0),
+            self.wcount.eq(0),
 
-            # We will not read back the first word immediately if we're in JTAG read
-            # or SWD read of the AP
-            self.readBDelay.eq((self.isJTAG & self.rxBlock.bit_select(33,1)) |
-                              ((~self.isJTAG) & (self.rxBlock.bit_select(32,2)==3))),
-
-            # We only delay the first read if we weren't already in delay mode
-            self.readBIgnore.eq((~self.readBDelay) &
-                                ((self.isJTAG & self.rxBlock.bit_select(33,1)) |
-                                 ((~self.isJTAG) & (self.rxBlock.bit_select(32,2)==3)))),
+            self.readBDelay.eq(posted),
+            self.readBIgnore.eq(ignore),
 
             self.dbgif.command.eq(CMD_TRANSACT),
 
@@ -792,18 +829,21 @@ class CMSIS_DAP(Elaboratable):
             self.dbgif.rnw.eq(self.rxBlock.bit_select(33,1)),
             self.dbgif.addr32.eq(self.rxBlock.bit_select(34,2)),
 
+            # WAIT responses are retried by the debug interface, so queued transactions stay in order
+            self.dbgif.retries.eq(self.waitRetry),
+
             # Reset the number of responses sent back
             self.txBlock.bit_select(8,16).eq(C(0,16)),
-            self.Bretries.eq(self.waitRetry),
-
-            # Decide which state to jump to depending on if we have data to collect
-            self.tfB_txb.eq(Mux(self.rxBlock.bit_select(33,1),4,0))
+            self.tfB_txb.eq(0)
         ]
 
         # Filter for case someone tries to send us no transfers to perform
         # in which case we send back a good ack!
         with m.If(self.rxBlock.bit_select(16,16)!=0):
-            m.d.sync += self.transferBCount.eq(self.rxBlock.bit_select(16,16)-1)
+            m.d.sync += [
+                self.transferBCount.eq(self.rxBlock.bit_select(16,16)),
+                self.transferBIssue.eq(self.rxBlock.bit_select(16,16)+ignore)
+            ]
             m.next = 'DAP_TransferBlock_PROCESS'
         with m.Else():
             m.d.sync += [
@@ -815,51 +855,55 @@ class CMSIS_DAP(Elaboratable):
     def RESP_TransferBlock_Process(self, m):
         m.d.comb += self.tfrram.dat_w.eq(self.dbgif.dread)
 
-        with m.Switch(self.tfB_txb):
+        # Transactions are queued with the debug interface as soon as there is room for them, and
+        # their write data has been collected, while the results are taken as they come back.
+        prefetch  = Signal()
+        take      = Signal()
+        wordReady = Signal()
+        word      = Signal(32)
+        issue     = Signal()
 
-            # Collect the 32 bit transfer Data to go with the command ----------------------------------
-            with m.Case(0,1,2,3):
-                with m.If(self.streamOut.ready & self.streamOut.valid):
-                    m.d.sync+=[
-                        self.dbgif.dwrite.word_select(self.tfB_txb,8).eq(self.streamOut.payload),
-                        self.tfB_txb.eq(self.tfB_txb+1),
-                    ]
-                with m.Else():
-                    # If we're showing ~valid then this packet is foreshortened
-                    with m.If(~self.streamOut.valid):
-                        m.next = 'Error'
-                    with m.Else():
-                        m.d.sync +=self.busy.eq(0)
+        m.d.comb += [
+            # Collect while there are writes still to be queued
+            prefetch.eq((~self.dbgif.rnw) & (self.wcount!=4) & (self.transferBIssue!=0) & (self.tfB_txb==0)),
+            take.eq(prefetch & self.streamOut.valid & self.streamOut.ready),
 
-            # We have the command and any needed data, action it ---------------------------------------
-            with m.Case(4):
+            # A whole word is available, including a last byte arriving this cycle
+            wordReady.eq((self.wcount==4) | ((self.wcount==3) & take)),
+            word.eq(Mux(self.wcount==4, self.wdata, Cat(self.wdata.bit_select(0,24), self.streamOut.payload))),
+
+            issue.eq((self.tfB_txb==0) & (self.transferBIssue!=0) & self.dbgif.can_push & (self.dbgif.rnw | wordReady))
+        ]
+
+        with m.If(take):
+            m.d.sync += [
+                self.wdata.word_select(self.wcount.bit_select(0,2),8).eq(self.streamOut.payload),
+                self.wcount.eq(self.wcount+1)
+            ]
+        with m.Elif(prefetch & self.streamOut.valid):
+            m.d.sync += self.busy.eq(0)
+
+        with m.If(issue):
+            m.d.sync += [
+                self.dbgif.push.eq(1),
+                self.transferBIssue.eq(self.transferBIssue-1)
+            ]
+            with m.If(~self.dbgif.rnw):
                 m.d.sync += [
-                    self.dbgif.go.eq(1),
-                    self.Bretries.eq(self.Bretries-1),
-                    self.tfB_txb.eq(5)
+                    self.dbgif.dwrite.eq(word),
+                    self.wcount.eq(0)
                 ]
 
-            # Wait for command to be accepted ----------------------------------------------------------
-            with m.Case(5):
-                with m.If(~self.dbg_done):
-                    m.d.sync += [
-                        self.dbgif.go.eq(0),
-                        self.tfB_txb.eq(6)
-                        ]
+        with m.Switch(self.tfB_txb):
 
-            # We sent a command, wait for it to start being executed -----------------------------------
-            with m.Case(6):
-                with m.If(self.dbg_done==1):
+            # Queue commands and collect their results ------------------------------------------------
+            with m.Case(0):
+                with m.If(self.dbgif.rvalid):
                     # Write return value from this command into return frame
                     m.d.sync += self.txBlock.bit_select(24,8).eq(Cat(self.dbgif.ack,self.dbgif.perr,C(0,4))),
 
-                    # Now lets figure out how to handle this response
-                    # If we're to retry, then let's do it
-                    with m.If(self.dbgif.ack==ACK_WAIT):
-                        m.d.sync += self.tfB_txb.eq(Mux(self.Bretries!=0,4,8))
-
-                    # If we got a bad ACK then give up
-                    with m.Elif((self.dbgif.ack!=ACK_OK) | (self.dbgif.perr)):
+                    # If we got a bad ACK then give up, anything queued behind it is discarded
+                    with m.If((self.dbgif.ack!=ACK_OK) | (self.dbgif.perr)):
                         m.d.sync += self.tfB_txb.eq(8)
 
                     with m.Else():
@@ -872,15 +916,12 @@ class CMSIS_DAP(Elaboratable):
                             with m.If(self.dbgif.rnw):
                                 m.d.sync += self.tfrram.adr.eq(self.tfrram.adr+1)
 
-                        # Keep going if appropriate
-                        with m.If((self.transferBCount!=0) | self.readBIgnore):
-                            m.d.sync += [
-                                self.Bretries.eq(self.waitRetry),
-                                self.tfB_txb.eq(Mux(self.dbgif.rnw,4,0))
-                            ]
+                            with m.If(self.transferBCount==1):
+                                m.d.sync += self.tfB_txb.eq(8)
 
-                        with m.Else():
-                            m.d.sync += self.tfB_txb.eq(8)
+                with m.Elif(prefetch & ~self.streamOut.valid & self.dbg_done):
+                    # If we're showing ~valid with nothing in flight then this packet is foreshortened
+                    m.next = 'Error'
 
             # Transfer completed, start sending data back ---------------------------------------
             with m.Case(8,9,10,11):
@@ -891,7 +932,7 @@ class CMSIS_DAP(Elaboratable):
                         self.streamIn.valid.eq(1),
                         self.tfB_txb.eq(self.tfB_txb+1),
                         # End of transfer if there are no data to return
-                        self.streamIn.last.eq(self.isV2 & (self.tfB_txb==11) & ((self.dbgif.rnw==0) | (self.tfrram.adr==0)))
+                        self.streamIn.last.eq(self.isV2 & self.lastCmd & (self.tfB_txb==11) & ((self.dbgif.rnw==0) | (self.tfrram.adr==0)))
                     ]
 
             # Initial data sent, decide what to do next ----------------------------------------------
@@ -908,7 +949,9 @@ class CMSIS_DAP(Elaboratable):
     def RESP_Transfer_Complete(self, m):
         # Complete the process of returning data collected via either Transfer_Process or
         # TransferBlock_Process. Data count to be transferred is inferred by ram address and
-        # the payload is in the tfrram.
+        # the payload is in the tfrram. The tfrram only holds the data until the header has
+        # been sent; the next word is read while the current one goes out, so the data are
+        # returned at a byte per cycle.
 
         with m.Switch(self.txb):
             # Prepare transfer ------------------------------------------------------------------------
@@ -916,51 +959,57 @@ class CMSIS_DAP(Elaboratable):
                 m.d.sync += [
                     self.transferCCount.eq(self.tfrram.adr),
                     self.tfrram.adr.eq(0),
+                    self.txb.eq(Mux(self.tfrram.adr!=0,1,4))
                 ]
 
-                with m.If(self.tfrram.adr!=0):
-                    m.d.sync += self.txb.eq(1)
-                with m.Else():
-                    m.d.sync += self.txb.eq(7)
-
             # Wait for ram to propagate through -------------------------------------------------------
             with m.Case(1):
                 m.d.sync += self.txb.eq(2)
 
-            # Collect transfer value from RAM store ---------------------------------------------------
+            # Collect first word from RAM store, send its first byte and fetch the next word ----------
             with m.Case(2):
                 m.d.sync += [
-                    self.transferCCount.eq(self.transferCCount-1),
+                    self.txWord.eq(self.tfrram.dat_r),
+                    self.txByte.eq(0),
+                    self.tfrram.adr.eq(self.tfrram.adr+1),
                     self.streamIn.payload.eq(self.tfrram.dat_r.word_select(0,8)),
+                    self.streamIn.last.eq(0),
+                    self.streamIn.valid.eq(1),
                     self.txb.eq(3)
                 ]
 
-            # Send 32 bit value to outgoing stream -------------------------------------------
-            with m.Case(3,4,5,6):
+            # Send each byte as the previous one is accepted -----------------------------------------
+            with m.Case(3):
                 m.d.sync += self.streamIn.valid.eq(1)
                 with m.If(self.streamIn.ready & self.streamIn.valid):
-                    m.d.sync += [
-                        self.txb.eq(self.txb+1),
-                        self.streamIn.payload.eq(self.tfrram.dat_r.word_select((self.txb-2).as_unsigned(),8)),
-                        # 5 because of pipeline
-                        self.streamIn.last.eq(self.isV2 & (~self.transferCCount.bool()) & (self.txb==5)),
-                        self.streamIn.valid.eq(self.txb!=6)
-                    ]
-
-            # Finished this send ---------------------------------------------------------------------
-            with m.Case(7):
-                with m.If(self.streamIn.ready):
-                    with m.If(~self.transferCCount.bool()):
-                        with (m.If(self.isV2)):
-                            m.next = 'IDLE'
-                        with m.Else():
-                            m.next = 'V1PACKETFILL'
+                    with m.If(self.txByte!=3):
+                        m.d.sync += [
+                            self.txByte.eq(self.txByte+1),
+                            self.streamIn.payload.eq(self.txWord.word_select(self.txByte+1,8)),
+                            self.streamIn.last.eq(self.isV2 & self.lastCmd & (self.transferCCount==1) & (self.txByte==2))
+                        ]
+                    with m.Elif(self.transferCCount!=1):
+                        # Move on to the word that has been fetched meanwhile
+                        m.d.sync += [
+                            self.transferCCount.eq(self.transferCCount-1),
+                            self.txWord.eq(self.tfrram.dat_r),
+                            self.txByte.eq(0),
+                            self.tfrram.adr.eq(self.tfrram.adr+1),
+                            self.streamIn.payload.eq(self.tfrram.dat_r.word_select(0,8)),
+                            self.streamIn.last.eq(0)
+                        ]
                     with m.Else():
                         m.d.sync += [
-                            self.txb.eq(1),
-                            self.tfrram.adr.eq(self.tfrram.adr+1)
+                            self.transferCCount.eq(0),
+                            self.streamIn.valid.eq(0),
+                            self.txb.eq(4)
                         ]
 
+            # Finished this send ---------------------------------------------------------------------
+            with m.Case(4):
+                with m.If(self.streamIn.ready):
+                    self.RESP_Finish(m)
+
     # ----------------------------------------------------------------------------------
     # ----------------------------------------------------------------------------------
 
@@ -1118,41 +1167,38 @@ class CMSIS_DAP(Elaboratable):
                 with m.If(self.streamIn.ready):
                     m.d.sync += [
                         self.streamIn.payload.eq(self.seqPendingTX),
-                        self.streamIn.last.eq(self.isV2),
+                        self.streamIn.last.eq(self.isV2 & self.lastCmd),
                         self.streamIn.valid.eq(1),
                         self.seq_txb.eq(8)
                     ]
 
             # ------------- Now decide how to terminate
             with m.Case(8):
-                    with m.If(self.isV2 | (self.txedLen==DAP_V1_MAX_PACKET_SIZE)):
-                        m.next = 'IDLE'
-                    with m.Else():
-                        m.next = 'V1PACKETFILL'
+                self.RESP_Finish(m)
 
     # ----------------------------------------------------------------------------------
     # ----------------------------------------------------------------------------------
 
     def elaborate(self,platform):
-        done_cdc      = Signal(2)
         self.dbg_done = Signal()
 
         m = Module()
         # Reset everything before we start
 
         m.d.sync += self.streamIn.valid.eq(0)
+        m.d.sync += self.dbgif.push.eq(0)
         m.d.comb += self.streamOut.ready.eq(~self.busy)
 
         m.submodules.tfrram = self.tfrram = WideRam()
 
         m.d.comb += self.dbgif.is_jtag.eq(self.isJTAG)
+        m.d.comb += self.lastCmd.eq(self.cmdCount==0)
 
-        # Organise the CDC from the debug interface
-        m.d.sync += done_cdc.eq(Cat(done_cdc[1],self.dbgif.done))
-        m.d.comb += self.dbg_done.eq(done_cdc==0b11)
+        # The debug interface presents done in this domain, so no CDC is needed
+        m.d.comb += self.dbg_done.eq(self.dbgif.done)
 
-        # Latch the read data at the rising edge of done signal
-        m.d.comb += self.tfrram.we.eq(done_cdc==0b10)
+        # Latch the read data as each result is returned
+        m.d.comb += self.tfrram.we.eq(self.dbgif.rvalid)
 
         # By default we are busy unless overridden
         m.d.sync += self.busy.eq(1)
@@ -1174,6 +1220,14 @@ class CMSIS_DAP(Elaboratable):
                     # Grab incoming from usb
                     self.rxedLen.eq(1),
                     self.rxBlock.word_select(0,8).eq(self.streamOut.payload),
+
+                    # Not in a batch until we're told otherwise
+                    self.batched.eq(0),
+                    self.cmdCount.eq(0),
+                    self.batchLen.eq(0),
+
+                    # Only queued block transfers are retried by the debug interface
+                    self.dbgif.retries.eq(0),
                 ]
 
                 # Only process if this is the start of a packet (i.e. it's not overrrun or similar)
@@ -1182,6 +1236,34 @@ class CMSIS_DAP(Elaboratable):
                 with m.Else():
                     m.d.sync += self.busy.eq(0)
 
+    #########################################################################################
+
+            # Collect the next packet type identifier in a batch
+            # --------------------------------------------------
+            with m.State('NextCommand'):
+                m.d.sync += [
+                    self.txedLen.eq(0),
+                    self.txBlock.word_select(0,16).eq(Cat(self.streamOut.payload,C(0,8))),
+                    self.txLen.eq(2),
+                    self.rxedLen.eq(1),
+                    self.rxBlock.word_select(0,8).eq(self.streamOut.payload),
+                    self.dbgif.retries.eq(0),
+                ]
+
+                # The start of the next packet means this batch is foreshortened; leave it for IDLE
+                with m.If(self.streamOut.valid & self.streamOut.first):
+                    m.d.comb += self.streamOut.ready.eq(0)
+                    m.next = 'Error'
+                with m.Elif(self.streamOut.valid & self.streamOut.ready):
+                    m.d.sync += self.cmdCount.eq(self.cmdCount-1)
+                    m.next = 'PacketSwitch'
+                with m.Else():
+                    # If we're showing ~valid then this packet is foreshortened
+                    with m.If(~self.streamOut.valid):
+                        m.next = 'Error'
+                    with m.Else():
+                        m.d.sync += self.busy.eq(0)
+
     #########################################################################################
 
             # Have a packet type, decide how to handle it
@@ -1216,7 +1298,12 @@ class CMSIS_DAP(Elaboratable):
                         m.next = 'RxParams'
 
                     with m.Case(DAP_ExecuteCommands,DAP_QueueCommands):
-                        m.next = 'Error'
+                        # Batches can't be nested
+                        with m.If(self.batched):
+                            m.next = 'Error'
+                        with m.Else():
+                            m.d.sync+=self.rxLen.eq(2)
+                            m.next = 'RxParams'
 
                     with m.Default():
                         m.next = 'Error'
@@ -1320,6 +1407,11 @@ class CMSIS_DAP(Elaboratable):
                     with m.Case(DAP_TransferBlock):
                         self.RESP_TransferBlock_Setup(m)
 
+                    # Batch Commands
+                    # ==============
+                    with m.Case(DAP_ExecuteCommands, DAP_QueueCommands):
+                        self.RESP_ExecuteCommands(m)
+
                     # AOB
                     # ===
                     with m.Default():
@@ -1380,7 +1472,7 @@ class CMSIS_DAP(Elaboratable):
                     self.streamIn.payload.eq(self.txBlock.word_select(self.txedLen,8)),
 
                     # This is the end of the packet if we've filled the length and it's v2
-                    self.streamIn.last.eq(self.isV2 & (self.txedLen==self.txLen-1))
+                    self.streamIn.last.eq(self.isV2 & self.lastCmd & (self.txedLen==self.txLen-1))
                     ]
 
                 with m.If(self.streamIn.ready & self.streamIn.valid):
@@ -1390,11 +1482,8 @@ class CMSIS_DAP(Elaboratable):
                     ]
 
                 with m.If(self.txedLen==self.txLen):
-                    with m.If(self.isV2 | (self.txedLen==DAP_V1_MAX_PACKET_SIZE)):
-                        # Everything is transmitted, return to idle condition
-                        m.next = 'IDLE'
-                    with m.Else():
-                        m.next = 'V1PACKETFILL'
+                    # Everything is transmitted, move on
+                    self.RESP_Finish(m)
 
             with m.State('V1PACKETFILL'):
                 m.d.sync += [
@@ -82,10 +82,11 @@ tdests = (
     ( "Target Device Name",         b"\x00\x06",                    b"\x00\x00"                 ),
     ( "FW version",                 b"\x00\x04",                    b"\x00\x06\x32\x2e\x31\x2e\x30" ),
     ( "Illegal command",            b"\x42",                        b"\xff"                     ),
-    ( "Request CAPABILITIES",       b"\x00\xf0",                    b"\x00\x01\x03"             ),
+    ( "Request CAPABILITIES",       b"\x00\xf0",                    b"\x00\x01\x13"             ),
+    ( "ExecuteCommands",            b"\x7f\x02\x01\x00\x01\x03",   b"\x7f\x02\x01\x00\x03\x00" ),
     ( "Request TEST DOMAIN TIMER",  b"\x00\xf1",                    b"\x00\x08\x00\xca\x9a\x3b" ),
     ( "Request SWO Trace Buffer Size", b"\x00\xfd",                 b"\xff"                     ),
-    ( "Request Packet Count",       b"\x00\xFE",                    b"\x00\x01\x01"             ),
+    ( "Request Packet Count",       b"\x00\xFE",                    b"\x00\x01\x04"             ),
     ( "Request Packet Size",        b"\x00\xff",                    b"\x00\x02\xfc\x01"         ),
     ( "Set connect led",            b"\x01\x00\x01",                b"\x01\x00"                 ),
     ( "Set running led",            b"\x01\x01\x01",                b"\x01\x00"                 ),
@@ -1,23 +1,197 @@
 from amaranth                  import *
+from amaranth.lib              import data
+
+from ..stream                  import AsyncFIFOBuffered
+from .cmsis_dap               import CMD_TRANSACT, ACK_OK, ACK_WAIT
+
+# Commands are passed to dbgIF, and its results returned, through a pair of FIFOs between the
+# sync and debug domains, so several transactions can be queued and run back to back.
+#
+# A single command is issued by taking 'go' true, as for dbgIF itself; 'done' is generated here
+# in the sync domain and goes true again once nothing is outstanding. Queued commands are issued
+# by strobing 'push' while 'can_push' is set, and each result is returned with a strobe on 'rvalid'.
+#
+# WAIT acks for CMD_TRANSACT are retried up to 'retries' times on the debug side, so a queue stays
+# in order. Any other failure discards the commands queued behind it, which are never returned.
+
+DBGIFCommand = data.StructLayout({
+    'command':      5,
+    'addr32':       2,
+    'rnw':          1,
+    'apndp':        1,
+    'dev':          3,
+    'dwrite':       32,
+    'pinsin':       16,
+    'retries':      16,
+    'epoch':        1,
+})
+
+DBGIFResult = data.StructLayout({
+    'dread':        32,
+    'ack':          3,
+    'perr':         1,
+    'pinsout':      8,
+    'failed':       1,
+    'skipped':      1,
+})
 
 class DBGIF(Elaboratable):
-    def __init__(self, dbgif, wrapper):
-        self.addr32       = wrapper.from_migen(dbgif.addr32)
-        self.rnw          = wrapper.from_migen(dbgif.rnw)
-        self.apndp        = wrapper.from_migen(dbgif.apndp)
-        self.dwrite       = wrapper.from_migen(dbgif.dwrite)
-        self.dread        = wrapper.from_migen(dbgif.dread)
-        self.perr         = wrapper.from_migen(dbgif.perr)
-        self.go           = wrapper.from_migen(dbgif.go)
-        self.done         = wrapper.from_migen(dbgif.done)
-        self.ack          = wrapper.from_migen(dbgif.ack)
-        self.pinsin       = wrapper.from_migen(dbgif.pinsin)
-        self.pinsout      = wrapper.from_migen(dbgif.pinsout)
-        self.command      = wrapper.from_migen(dbgif.command)
-        self.dev          = wrapper.from_migen(dbgif.dev)
+    def __init__(self, dbgif, wrapper, depth = 8):
+        # Interface to the command controller, in the sync domain
+        self.addr32       = Signal(2)
+        self.rnw          = Signal()
+        self.apndp        = Signal()
+        self.dwrite       = Signal(32)
+        self.dread        = Signal(32)
+        self.perr         = Signal()
+        self.go           = Signal()
+        self.done         = Signal()
+        self.ack          = Signal(3)
+        self.pinsin       = Signal(16)
+        self.pinsout      = Signal(8)
+        self.command      = Signal(5)
+        self.dev          = Signal(3)
         self.is_jtag      = wrapper.from_migen(dbgif.is_jtag)
 
+        self.retries      = Signal(16)     # WAIT retries for CMD_TRANSACT
+        self.push         = Signal()       # Queue the command in the registers above
+        self.can_push     = Signal()       # There is room to queue a command
+        self.rvalid       = Signal()       # A result has been loaded into dread, ack, perr and pinsout
+
+        # Interface to dbgIF itself, in the debug domain
+        self.dbg_addr32   = wrapper.from_migen(dbgif.addr32)
+        self.dbg_rnw      = wrapper.from_migen(dbgif.rnw)
+        self.dbg_apndp    = wrapper.from_migen(dbgif.apndp)
+        self.dbg_dwrite   = wrapper.from_migen(dbgif.dwrite)
+        self.dbg_dread    = wrapper.from_migen(dbgif.dread)
+        self.dbg_perr     = wrapper.from_migen(dbgif.perr)
+        self.dbg_go       = wrapper.from_migen(dbgif.go)
+        self.dbg_done     = wrapper.from_migen(dbgif.done)
+        self.dbg_ack      = wrapper.from_migen(dbgif.ack)
+        self.dbg_pinsin   = wrapper.from_migen(dbgif.pinsin)
+        self.dbg_pinsout  = wrapper.from_migen(dbgif.pinsout)
+        self.dbg_command  = wrapper.from_migen(dbgif.command)
+        self.dbg_dev      = wrapper.from_migen(dbgif.dev)
+
+        self.depth        = depth
+
     def elaborate(self, platform):
         m = Module()
 
+        m.submodules.cmd_fifo = cmd_fifo = DomainRenamer({'write': 'sync', 'read': 'debug'})(AsyncFIFOBuffered(DBGIFCommand, self.depth))
+        m.submodules.res_fifo = res_fifo = DomainRenamer({'write': 'debug', 'read': 'sync'})(AsyncFIFOBuffered(DBGIFResult, self.depth))
+
+        # Sync side -------------------------------------------------------------------------------
+        go_prev     = Signal()
+        outstanding = Signal(range(self.depth + 1))
+        epoch       = Signal()
+
+        issue = Signal()
+        collect = Signal()
+
+        m.d.sync += go_prev.eq(self.go)
+
+        m.d.comb += [
+            issue.eq((self.go & ~go_prev) | self.push),
+            collect.eq(res_fifo.output.valid),
+
+            # Nothing is outstanding or about to be
+            self.done.eq((outstanding == 0) & ~self.go & ~self.push),
+            self.can_push.eq(outstanding + self.push < self.depth),
+
+            cmd_fifo.input.payload.command.eq(self.command),
+            cmd_fifo.input.payload.addr32.eq(self.addr32),
+            cmd_fifo.input.payload.rnw.eq(self.rnw),
+            cmd_fifo.input.payload.apndp.eq(self.apndp),
+            cmd_fifo.input.payload.dev.eq(self.dev),
+            cmd_fifo.input.payload.dwrite.eq(self.dwrite),
+            cmd_fifo.input.payload.pinsin.eq(self.pinsin),
+            cmd_fifo.input.payload.retries.eq(self.retries),
+            cmd_fifo.input.payload.epoch.eq(epoch),
+            cmd_fifo.input.valid.eq(issue),
+
+            res_fifo.output.ready.eq(1),
+        ]
+
+        m.d.sync += [
+            outstanding.eq(outstanding + issue - collect),
+            self.rvalid.eq(0),
+        ]
+
+        with m.If(collect & ~res_fifo.output.payload.skipped):
+            m.d.sync += [
+                self.dread.eq(res_fifo.output.payload.dread),
+                self.ack.eq(res_fifo.output.payload.ack),
+                self.perr.eq(res_fifo.output.payload.perr),
+                self.pinsout.eq(res_fifo.output.payload.pinsout),
+                self.rvalid.eq(1),
+            ]
+
+            # Anything queued after a failure is discarded, new commands start a new epoch
+            with m.If(res_fifo.output.payload.failed):
+                m.d.sync += epoch.eq(~epoch)
+
+        # Debug side ------------------------------------------------------------------------------
+        retries = Signal(16)
+        skipping = Signal()
+        skip_epoch = Signal()
+
+        failed = Signal()
+        m.d.comb += failed.eq(self.dbg_perr | ((self.dbg_command == CMD_TRANSACT) & (self.dbg_ack != ACK_OK)))
+
+        with m.FSM(domain = 'debug'):
+            with m.State('IDLE'):
+                m.d.comb += cmd_fifo.output.ready.eq(self.dbg_done)
+
+                with m.If(cmd_fifo.output.valid & cmd_fifo.output.ready):
+                    with m.If(skipping & (cmd_fifo.output.payload.epoch == skip_epoch)):
+                        m.d.comb += [
+                            res_fifo.input.payload.skipped.eq(1),
+                            res_fifo.input.valid.eq(1),
+                        ]
+
+                    with m.Else():
+                        m.d.debug += [
+                            self.dbg_command.eq(cmd_fifo.output.payload.command),
+                            self.dbg_addr32.eq(cmd_fifo.output.payload.addr32),
+                            self.dbg_rnw.eq(cmd_fifo.output.payload.rnw),
+                            self.dbg_apndp.eq(cmd_fifo.output.payload.apndp),
+                            self.dbg_dev.eq(cmd_fifo.output.payload.dev),
+                            self.dbg_dwrite.eq(cmd_fifo.output.payload.dwrite),
+                            self.dbg_pinsin.eq(cmd_fifo.output.payload.pinsin),
+                            self.dbg_go.eq(1),
+                            retries.eq(cmd_fifo.output.payload.retries),
+                            skip_epoch.eq(cmd_fifo.output.payload.epoch),
+                            skipping.eq(0),
+                        ]
+                        m.next = 'START'
+
+            # Wait for dbgIF to take the command
+            with m.State('START'):
+                with m.If(~self.dbg_done):
+                    m.d.debug += self.dbg_go.eq(0)
+                    m.next = 'RUN'
+
+            # Wait for it to complete, then retry it or return the result
+            with m.State('RUN'):
+                with m.If(self.dbg_done):
+                    with m.If((self.dbg_command == CMD_TRANSACT) & (self.dbg_ack == ACK_WAIT) & ~self.dbg_perr & (retries != 0)):
+                        m.d.debug += [
+                            retries.eq(retries - 1),
+                            self.dbg_go.eq(1),
+                        ]
+                        m.next = 'START'
+
+                    with m.Else():
+                        m.d.comb += [
+                            res_fifo.input.payload.dread.eq(self.dbg_dread),
+                            res_fifo.input.payload.ack.eq(self.dbg_ack),
+                            res_fifo.input.payload.perr.eq(self.dbg_perr),
+                            res_fifo.input.payload.pinsout.eq(self.dbg_pinsout),
+                            res_fifo.input.payload.failed.eq(failed),
+                            res_fifo.input.valid.eq(1),
+                        ]
+                        m.d.debug += skipping.eq(failed)
+                        m.next = 'IDLE'
+
         return m
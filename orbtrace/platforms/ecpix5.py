@@ -83,5 +83,10 @@ class Platform(lambdaconcept_ecpix5.Platform):
     @classmethod
     def get_profile(cls, profile):
         return {
-            'default': {},
+            # Plenty of spare block RAM to ride out longer host stalls.
+            'default': {
+                'trace_input_fifo_depth': 64,
+                'trace_history_depth': 16384,
+                'trace_output_fifo_depth': 65536,
+            },
         }[profile]
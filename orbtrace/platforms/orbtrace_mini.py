@@ -188,12 +188,18 @@ class Platform(LatticePlatform):
 
         pads = self.request('hyperram')
 
-        soc.submodules.hyperram = cdr(HyperRAM(pads))
+        devices = [soc.trace_buffer] if hasattr(soc, 'trace_buffer') else []
+
+        soc.submodules.hyperram = cdr(HyperRAM(pads, devices))
         soc.add_csr('hyperram')
         soc.bus.add_slave('hyperram', soc.hyperram.bus, SoCRegion(origin = soc.mem_map.get('hyperram', 0x20000000), size = 0x800000))
 
         soc.comb += pads.rst_n.eq(1)
 
+    def get_trace_buffer_region(self, soc):
+        # Upper half of the HyperRAM.
+        return soc.mem_map.get('hyperram', 0x20000000) + 0x400000, 0x400000
+
     def create_programmer(self):
         return OpenFPGALoader('ecpix5')
 
@@ -1,12 +1,13 @@
 from orbtrace.usb_serialnumber import USBSerialNumberHandler
 from orbtrace.test_io import TestIO
 from migen import *
-from migen.genlib.cdc import PulseSynchronizer
+from migen.genlib.cdc import PulseSynchronizer, BusSynchronizer
 
 from litex.soc.integration.soc_core import SoCCore
 from litex.soc.integration.soc import SoCRegion
 
 from .trace.glue import TraceCore
+from .trace.buffer import TraceBuffer
 from .trace.usb_handler import TraceUSBHandler
 
 from .power.usb_handler import PowerUSBHandler
@@ -15,6 +16,7 @@ from .amaranth_glue.wrapper import Wrapper
 from .amaranth_glue.luna import USBDevice, USBStreamOutEndpoint, USBStreamInEndpoint, USBMultibyteStreamInEndpoint
 from .amaranth_glue.usb_mem_bridge import MemRequestHandler
 from .debug import DBGIF, CMSIS_DAP
+from .debug.cmsis_dap import DAP_MAX_PACKET_COUNT
 from .amaranth_glue.dfu import DFUHandler
 
 from .usb_serialnumber import USBSerialNumberHandler
@@ -45,7 +47,7 @@ from litespi import LiteSPI
 from .usb_allocator import USBAllocator
 
 class OrbSoC(SoCCore):
-    def __init__(self, platform, sys_clk_freq, with_debug, with_trace, with_target_power, with_dfu, with_reset_csr, with_test_io, usb_vid, usb_pid, led_default, bootloader_auto_reset, **kwargs):
+    def __init__(self, platform, sys_clk_freq, with_debug, with_trace, with_target_power, with_dfu, with_reset_csr, with_test_io, usb_vid, usb_pid, led_default, bootloader_auto_reset, trace_byte_width = 1, with_trace_buffer = False, trace_fifo_depths = None, **kwargs):
 
         # SoCCore
         SoCCore.__init__(self, platform, sys_clk_freq,
@@ -88,7 +90,7 @@ class OrbSoC(SoCCore):
 
         # Trace
         if with_trace:
-            self.add_trace()
+            self.add_trace(trace_byte_width, with_trace_buffer, trace_fifo_depths)
 
         # Debug
         if with_debug:
@@ -343,14 +345,16 @@ class OrbSoC(SoCCore):
             )
             self.usb.add_endpoint(out_ep_v2)
 
-        # Stream CDC.
+        # Stream CDC. Each direction buffers DAP_MAX_PACKET_COUNT full packets, so the host can
+        # queue requests while an earlier one is executing, without waiting for its response.
         stream_desc = [('data', 8)]
+        buffer_depth = DAP_MAX_PACKET_COUNT * 512
 
         in_stream = Endpoint(stream_desc)
         out_stream = Endpoint(stream_desc)
 
-        in_cdc = ClockDomainCrossing(stream_desc, 'sys', 'usb')
-        out_cdc = ClockDomainCrossing(stream_desc, 'usb', 'sys')
+        in_cdc = ClockDomainCrossing(stream_desc, 'sys', 'usb', depth = buffer_depth, buffered = True)
+        out_cdc = ClockDomainCrossing(stream_desc, 'usb', 'sys', depth = buffer_depth, buffered = True)
 
         pipeline = Pipeline(out_stream, out_cdc, self.cmsis_dap, in_cdc, in_stream)
 
@@ -406,9 +410,22 @@ class OrbSoC(SoCCore):
                 is_v2.eq(1),
             ]
 
-    def add_trace(self):
+    def add_trace(self, byte_width = 1, with_buffer = False, fifo_depths = None):
         # Trace core.
-        self.submodules.trace = TraceCore(self.platform, self.wrapper)
+        self.submodules.trace = TraceCore(self.platform, self.wrapper, byte_width = byte_width, fifo_depths = fifo_depths)
+        self.add_csr('trace')
+
+        # Trace buffer. The bus is connected by the platform.
+        if with_buffer:
+            if not hasattr(self.platform, 'get_trace_buffer_region'):
+                raise ValueError(f'Platform {self.platform.name} has no memory for a trace buffer.')
+
+            if byte_width != 4:
+                raise ValueError('Trace buffer requires a 4 byte wide trace datapath.')
+
+            base, size = self.platform.get_trace_buffer_region(self)
+            self.submodules.trace_buffer = TraceBuffer(base, size)
+            self.add_csr('trace_buffer')
 
         # LEDs
         if hasattr(self, 'led_trace'):
@@ -427,18 +444,20 @@ class OrbSoC(SoCCore):
         if_num = self.usb_alloc.interface(guid_discriminator=0x00_54)
         ep_num = self.usb_alloc.in_ep()
 
-        # USB descriptors.
-        with self.usb_conf_desc.InterfaceDescriptor() as i:
-            i.bInterfaceNumber   = if_num
-            i.bInterfaceClass    = 0xff
-            i.bInterfaceSubclass = 0x54
-            i.bInterfaceProtocol = 0x10
+        # USB descriptors. Alternate setting 0 is orbflow, 1 is raw TPIU frames.
+        for alt, protocol in [(0, 0x10), (1, 0x01)]:
+            with self.usb_conf_desc.InterfaceDescriptor() as i:
+                i.bInterfaceNumber   = if_num
+                i.bAlternateSetting  = alt
+                i.bInterfaceClass    = 0xff
+                i.bInterfaceSubclass = 0x54
+                i.bInterfaceProtocol = protocol
 
-            i.iInterface = 'Trace'
+                i.iInterface = 'Trace'
 
-            with i.EndpointDescriptor() as e:
-                e.bEndpointAddress = 0x80 | ep_num
-                e.wMaxPacketSize   = 512
+                with i.EndpointDescriptor() as e:
+                    e.bEndpointAddress = 0x80 | ep_num
+                    e.wMaxPacketSize   = 512
 
         # Control proxy interface.
         proxy_if_num = self.usb_alloc.interface(guid_discriminator=0x00_58)
@@ -463,6 +482,21 @@ class OrbSoC(SoCCore):
             self.trace.input_format_strobe.eq(self.input_format_ps.o),
         ]
 
+        self.comb += self.trace.output_format.eq(self.wrapper.from_amaranth(handler.output_format))
+        self.comb += self.trace.timestamp_enable.eq(self.wrapper.from_amaranth(handler.timestamp_enable))
+        self.comb += self.trace.compression_enable.eq(self.wrapper.from_amaranth(handler.compression_enable))
+
+        # Multi-word registers are taken into the sys domain together once the handler has written one.
+        self.submodules.register_ps = PulseSynchronizer('usb', 'sys')
+        self.comb += self.register_ps.i.eq(self.wrapper.from_amaranth(handler.register_strobe))
+        self.sync += If(self.register_ps.o,
+            self.trace.channel_mask.eq(self.wrapper.from_amaranth(handler.channel_mask)),
+            self.trace.framing.eq(self.wrapper.from_amaranth(handler.framing.as_value())),
+            self.trace.packetizer.eq(self.wrapper.from_amaranth(handler.packetizer.as_value())),
+            self.trace.trigger.eq(self.wrapper.from_amaranth(handler.trigger.as_value())),
+            self.trace.itm_filter.eq(self.wrapper.from_amaranth(handler.itm_filter.as_value())),
+        )
+
         self.submodules.async_baudrate_ps = PulseSynchronizer('usb', 'sys')
         self.comb += [
             self.trace.async_baudrate.eq(self.wrapper.from_amaranth(handler.async_baudrate)),
@@ -470,16 +504,32 @@ class OrbSoC(SoCCore):
             self.trace.async_baudrate_strobe.eq(self.async_baudrate_ps.o),
         ]
 
+        self.submodules.stats_bs = BusSynchronizer(len(self.trace.stats), 'sys', 'usb')
+        self.comb += [
+            self.stats_bs.i.eq(self.trace.stats),
+            self.wrapper.from_amaranth(handler.stats).eq(self.stats_bs.o),
+        ]
+
         # Endpoint handler.
-        ep = USBStreamInEndpoint(
-            endpoint_number = ep_num,
-            max_packet_size = 512,
-        )
+        if byte_width == 1:
+            ep = USBStreamInEndpoint(
+                endpoint_number = ep_num,
+                max_packet_size = 512,
+            )
+        else:
+            ep = USBMultibyteStreamInEndpoint(
+                endpoint_number = ep_num,
+                byte_width = byte_width,
+                max_packet_size = 512,
+            )
         self.usb.add_endpoint(ep)
 
         cdc = ClockDomainCrossing(ep.sink.description, 'sys', 'usb', depth = 8)
-        
-        pipeline = Pipeline(self.trace, cdc, ep)
+
+        if with_buffer:
+            pipeline = Pipeline(self.trace, self.trace_buffer, cdc, ep)
+        else:
+            pipeline = Pipeline(self.trace, cdc, ep)
         self.submodules += cdc, pipeline
 
     def add_test_io(self):
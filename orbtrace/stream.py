@@ -2,23 +2,29 @@ from amaranth import *
 from amaranth.lib import stream, data, wiring, fifo
 
 class Packet(data.StructLayout):
-    def __init__(self, element_shape = 8, *, has_first = False, has_last = False):
+    def __init__(self, element_shape = 8, *, has_first = False, has_last = False, has_count = False):
         assert has_first or has_last
         layout = {'data': element_shape}
         if has_first:
             layout['first'] = 1
         if has_last:
             layout['last'] = 1
+        if has_count:
+            # Number of valid elements, only meaningful for partially filled words.
+            assert isinstance(element_shape, data.ArrayLayout)
+            layout['count'] = range(element_shape.length + 1)
         super().__init__(layout)
 
         self.has_first = has_first
         self.has_last = has_last
+        self.has_count = has_count
 
 class SyncFIFOBuffered(wiring.Component):
     def __init__(self, shape, depth):
         super().__init__({
             'input': wiring.In(stream.Signature(shape)),
             'output': wiring.Out(stream.Signature(shape)),
+            'level': wiring.Out(range(depth + 1)),
         })
         self.width = Shape.cast(shape).width
         self.depth = depth
@@ -27,6 +33,8 @@ class SyncFIFOBuffered(wiring.Component):
         m = Module()
         m.submodules.fifo = _fifo = fifo.SyncFIFOBuffered(width = self.width, depth = self.depth)
 
+        m.d.comb += self.level.eq(_fifo.level)
+
         m.d.comb += [
             # Input
             self.input.ready.eq(_fifo.w_rdy),
@@ -69,15 +77,21 @@ class AsyncFIFOBuffered(wiring.Component):
         return m
 
 class Serializer(wiring.Component):
-    def __init__(self, shape: data.ArrayLayout):
+    def __init__(self, shape: data.ArrayLayout, *, has_last = False):
         assert isinstance(shape, data.ArrayLayout)
 
+        if has_last:
+            output_shape = Packet(shape.elem_shape, has_last = True)
+        else:
+            output_shape = shape.elem_shape
+
         super().__init__({
             'input': wiring.In(stream.Signature(shape)),
-            'output': wiring.Out(stream.Signature(shape.elem_shape)),
+            'output': wiring.Out(stream.Signature(output_shape)),
         })
 
         self.shape = shape
+        self.has_last = has_last
 
     def elaborate(self, platform):
         m = Module()
@@ -87,9 +101,16 @@ class Serializer(wiring.Component):
         m.d.comb += [
             self.input.ready.eq(self.output.ready & (idx == self.shape.length - 1)),
             self.output.valid.eq(self.input.valid),
-            self.output.payload.eq(self.input.payload[idx]),
         ]
 
+        if self.has_last:
+            m.d.comb += [
+                self.output.payload.data.eq(self.input.payload[idx]),
+                self.output.payload.last.eq(idx == self.shape.length - 1),
+            ]
+        else:
+            m.d.comb += self.output.payload.eq(self.input.payload[idx])
+
         with m.If(self.output.valid & self.output.ready):
             m.d.sync += idx.eq(idx + 1)
 
@@ -97,3 +118,146 @@ class Serializer(wiring.Component):
                 m.d.sync += idx.eq(0)
 
         return m
+
+class Packer(wiring.Component):
+    def __init__(self, shape: data.ArrayLayout, *, pad = 0, has_count = False):
+        assert isinstance(shape, data.ArrayLayout)
+
+        super().__init__({
+            'input': wiring.In(stream.Signature(Packet(shape.elem_shape, has_last = True))),
+            'output': wiring.Out(stream.Signature(Packet(shape, has_last = True, has_count = has_count))),
+        })
+
+        self.shape = shape
+        self.pad = pad
+
+    def elaborate(self, platform):
+        m = Module()
+
+        idx = Signal(range(self.shape.length))
+        buf = Signal(self.shape)
+        last = Signal()
+        full = Signal()
+        count = Signal(range(self.shape.length + 1))
+
+        m.d.comb += [
+            self.input.ready.eq(~full | self.output.ready),
+            self.output.valid.eq(full),
+            self.output.payload.data.eq(buf),
+            self.output.payload.last.eq(last),
+        ]
+
+        if self.output.payload.shape().has_count:
+            m.d.comb += self.output.payload.count.eq(count)
+
+        with m.If(self.output.valid & self.output.ready):
+            m.d.sync += full.eq(0)
+
+        with m.If(self.input.valid & self.input.ready):
+            # Pad the remainder of the word when starting a new one.
+            with m.If(idx == 0):
+                m.d.sync += buf.eq(Cat(C(self.pad, Shape.cast(self.shape.elem_shape).width) for _ in range(self.shape.length)))
+
+            m.d.sync += [
+                buf[idx].eq(self.input.payload.data),
+                idx.eq(idx + 1),
+            ]
+
+            with m.If((idx == self.shape.length - 1) | self.input.payload.last):
+                m.d.sync += [
+                    full.eq(1),
+                    last.eq(self.input.payload.last),
+                    count.eq(idx + 1),
+                    idx.eq(0),
+                ]
+
+        return m
+
+class PacketArbiter(wiring.Component):
+    def __init__(self, shape: Packet, n):
+        assert isinstance(shape, Packet) and shape.has_last
+
+        super().__init__({
+            'input': wiring.In(stream.Signature(shape)).array(n),
+            'output': wiring.Out(stream.Signature(shape)),
+        })
+
+        self.n = n
+
+    def elaborate(self, platform):
+        m = Module()
+
+        sel = Signal(range(self.n))
+        locked = Signal()
+
+        # Round robin between inputs, switching only at packet boundaries.
+        with m.If(~locked):
+            for i in reversed(range(self.n)):
+                with m.If(self.input[i].valid):
+                    m.d.sync += sel.eq(i)
+            for i in reversed(range(self.n)):
+                with m.If(self.input[i].valid & (i > sel)):
+                    m.d.sync += sel.eq(i)
+
+        with m.Switch(sel):
+            for i in range(self.n):
+                with m.Case(i):
+                    m.d.comb += [
+                        self.output.valid.eq(self.input[i].valid & locked),
+                        self.output.payload.eq(self.input[i].payload),
+                        self.input[i].ready.eq(self.output.ready & locked),
+                    ]
+
+        with m.If(~locked):
+            m.d.sync += locked.eq(Cat(input.valid for input in self.input).any())
+
+        with m.If(self.output.valid & self.output.ready & self.output.payload.last):
+            m.d.sync += locked.eq(0)
+
+        return m
+
+class PacketFIFO(wiring.Component):
+    # Store and forward; packets are only offered once complete, so a slow packet can't hold up an arbiter behind this.
+    # Packets larger than the FIFO are passed on as they come once it fills up.
+    def __init__(self, shape: Packet, depth):
+        assert isinstance(shape, Packet) and shape.has_last
+
+        super().__init__({
+            'input': wiring.In(stream.Signature(shape)),
+            'output': wiring.Out(stream.Signature(shape)),
+            'level': wiring.Out(range(depth + 1)),
+        })
+        self.shape = shape
+        self.depth = depth
+
+    def elaborate(self, platform):
+        m = Module()
+        m.submodules.fifo = _fifo = SyncFIFOBuffered(self.shape, self.depth)
+
+        packets = Signal(range(self.depth + 1))
+        release = Signal()
+
+        m.d.comb += [
+            self.level.eq(_fifo.level),
+            release.eq((packets != 0) | (_fifo.level == self.depth)),
+
+            # Input
+            self.input.ready.eq(_fifo.input.ready),
+            _fifo.input.valid.eq(self.input.valid),
+            _fifo.input.payload.eq(self.input.payload),
+
+            # Output
+            self.output.valid.eq(_fifo.output.valid & release),
+            self.output.payload.eq(_fifo.output.payload),
+            _fifo.output.ready.eq(self.output.ready & release),
+        ]
+
+        packet_in = self.input.valid & self.input.ready & self.input.payload.last
+        packet_out = self.output.valid & self.output.ready & self.output.payload.last & (packets != 0)
+
+        with m.If(packet_in & ~packet_out):
+            m.d.sync += packets.eq(packets + 1)
+        with m.Elif(packet_out & ~packet_in):
+            m.d.sync += packets.eq(packets - 1)
+
+        return m
@@ -0,0 +1,150 @@
+from migen import *
+
+from litex.soc.interconnect import stream, wishbone
+from litex.soc.interconnect.csr import AutoCSR, CSRStatus
+
+# Ring buffer in external memory for the trace output stream.
+# Words are passed straight through while the host keeps up. Once the output FIFO fills up,
+# incoming words are spilled to memory in bursts and read back in order as the host catches up.
+#
+# Memory is used in records of burst_len words followed by a word with their last flags,
+# so transfer boundaries survive a spill.
+class TraceBuffer(Module, AutoCSR):
+    def __init__(self, base, size, fifo_depth = 16, burst_len = 32):
+        assert size & (size - 1) == 0
+        assert burst_len <= 32
+
+        self.sink = sink = stream.Endpoint([('data', 32)])
+        self.source = source = stream.Endpoint([('data', 32)])
+
+        self.bus = bus = wishbone.Interface()
+
+        self.level = CSRStatus(32, name = 'level')
+        self.max_level = CSRStatus(32, name = 'max_level')
+
+        record_len = burst_len + 1
+        records = (size // 4) // record_len
+        base_adr = base // 4
+
+        # Incoming words wait here until they can go to the output or fill a record.
+        self.submodules.input_fifo = input_fifo = stream.SyncFIFO([('data', 32)], 2 * burst_len)
+        self.comb += sink.connect(input_fifo.sink)
+
+        # Records read back wait here until their last flags have arrived.
+        self.submodules.read_fifo = read_fifo = stream.SyncFIFO([('data', 32)], 2 * burst_len)
+        self.submodules.flags_fifo = flags_fifo = stream.SyncFIFO([('data', burst_len)], 2)
+
+        self.submodules.output_fifo = output_fifo = stream.SyncFIFO([('data', 32)], fifo_depth)
+        self.comb += output_fifo.source.connect(source)
+
+        level = Signal(max = records + 1)
+        max_level = Signal(max = records + 1)
+        wr_ptr = Signal(max = records)
+        rd_ptr = Signal(max = records)
+
+        beat = Signal(max = record_len)
+        flags = Signal(burst_len)
+        unload_idx = Signal(max = burst_len)
+
+        # Alternate between reading and writing when both are possible.
+        prefer_read = Signal()
+
+        # Nothing older than the words in input_fifo is held anywhere else.
+        drained = Signal()
+
+        can_write = Signal()
+        can_read = Signal()
+
+        self.comb += [
+            self.level.status.eq(level * burst_len),
+            self.max_level.status.eq(max_level * burst_len),
+
+            drained.eq((level == 0) & ~read_fifo.source.valid & ~flags_fifo.source.valid),
+            can_write.eq((input_fifo.level >= burst_len) & (level < records)),
+            can_read.eq((level > 0) & (read_fifo.level <= read_fifo.depth - burst_len) & flags_fifo.sink.ready),
+
+            bus.sel.eq(0xf),
+            bus.bte.eq(0),
+            bus.cti.eq(Mux(beat == record_len - 1, 0b111, 0b010)),
+        ]
+
+        self.sync += If(level > max_level,
+            max_level.eq(level),
+        )
+
+        # Records read back are passed on with their last flags.
+        self.comb += If(flags_fifo.source.valid,
+            output_fifo.sink.valid.eq(read_fifo.source.valid),
+            output_fifo.sink.data.eq(read_fifo.source.data),
+            output_fifo.sink.last.eq(Array(flags_fifo.source.data[i] for i in range(burst_len))[unload_idx]),
+            read_fifo.source.ready.eq(output_fifo.sink.ready),
+        )
+
+        self.sync += If(read_fifo.source.valid & read_fifo.source.ready,
+            unload_idx.eq(unload_idx + 1),
+            If(unload_idx == burst_len - 1,
+                unload_idx.eq(0),
+            ),
+        )
+
+        self.comb += flags_fifo.source.ready.eq(read_fifo.source.valid & read_fifo.source.ready & (unload_idx == burst_len - 1))
+
+        self.submodules.fsm = fsm = FSM()
+
+        fsm.act('IDLE',
+            NextValue(beat, 0),
+            NextValue(flags, 0),
+
+            If(drained & output_fifo.sink.ready,
+                # Nothing spilled, pass straight through.
+                input_fifo.source.connect(output_fifo.sink),
+            ).Elif(can_write & ~(prefer_read & can_read),
+                NextState('WRITE'),
+            ).Elif(can_read,
+                NextState('READ'),
+            ),
+        )
+
+        fsm.act('WRITE',
+            bus.cyc.eq(1),
+            bus.stb.eq(1),
+            bus.we.eq(1),
+            bus.adr.eq(base_adr + wr_ptr * record_len + beat),
+            bus.dat_w.eq(Mux(beat == burst_len, flags, input_fifo.source.data)),
+
+            If(bus.ack,
+                NextValue(beat, beat + 1),
+
+                If(beat == burst_len,
+                    NextValue(wr_ptr, Mux(wr_ptr == records - 1, 0, wr_ptr + 1)),
+                    NextValue(level, level + 1),
+                    NextValue(prefer_read, 1),
+                    NextState('IDLE'),
+                ).Else(
+                    input_fifo.source.ready.eq(1),
+                    NextValue(flags, Cat(flags[1:], input_fifo.source.last)),
+                ),
+            ),
+        )
+
+        fsm.act('READ',
+            bus.cyc.eq(1),
+            bus.stb.eq(1),
+            bus.adr.eq(base_adr + rd_ptr * record_len + beat),
+
+            If(bus.ack,
+                NextValue(beat, beat + 1),
+
+                If(beat == burst_len,
+                    flags_fifo.sink.valid.eq(1),
+                    flags_fifo.sink.data.eq(bus.dat_r),
+                    NextValue(rd_ptr, Mux(rd_ptr == records - 1, 0, rd_ptr + 1)),
+                    NextValue(level, level - 1),
+                    NextValue(prefer_read, 0),
+                    NextState('IDLE'),
+                ).Else(
+                    read_fifo.sink.valid.eq(1),
+                    read_fifo.sink.data.eq(bus.dat_r),
+                ),
+            ),
+        )
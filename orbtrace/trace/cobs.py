@@ -1,5 +1,5 @@
 from amaranth import *
-from amaranth.lib import wiring, stream
+from amaranth.lib import wiring, stream, data
 
 from ..stream import Packet, SyncFIFOBuffered
 
@@ -169,3 +169,274 @@ class COBSEncoder(wiring.Component):
         m.d.sync += Signal().eq(1)
 
         return m
+
+def _segment_layout(lanes):
+    # A word of encoder output in progress. Encoding inserts at most two bytes per input word:
+    # the leading code byte or one forced after 254 non-delimiter bytes, and the appended delimiter.
+    return data.StructLayout({
+        'data': data.ArrayLayout(8, lanes + 2),
+        'count': range(lanes + 3),
+        'pending': 1,
+        'pending_lane': range(lanes + 2),
+        'last': 1,
+    })
+
+class WideGroupSplitter(wiring.Component):
+    def __init__(self, lanes, delimiter = 0):
+        super().__init__({
+            'input': wiring.In(stream.Signature(Packet(data.ArrayLayout(8, lanes), has_last = True, has_count = True))),
+            'output_len': wiring.Out(stream.Signature(8)),
+            'output_data': wiring.Out(stream.Signature(_segment_layout(lanes))),
+        })
+        self.lanes = lanes
+        self.delimiter = delimiter
+
+    def header(self, cnt):
+        return Mux(cnt >= self.delimiter, cnt + 1, cnt)[:8]
+
+    def elaborate(self, platform):
+        m = Module()
+
+        lanes = self.lanes
+        width = lanes + 2
+        prev = width # Sentinel lane number for a code byte belonging to an earlier word.
+
+        cnt = Signal(8)
+        first = Signal(init = 1)
+
+        out = self.output_data.payload
+        payload = self.input.payload
+
+        m.d.comb += [
+            self.input.ready.eq(self.output_data.ready & self.output_len.ready),
+            self.output_data.valid.eq(self.input.valid & self.input.ready),
+            out.last.eq(payload.last),
+        ]
+
+        # Walk the lanes in order, tracking the output position, the run length and the lane of
+        # the code byte that is still waiting for its run to end.
+        pos = Signal(range(width + 1), name = 'pos_start')
+        open_lane = Signal(range(width + 1), name = 'open_start')
+        run = Signal(8, name = 'run_start')
+        m.d.comb += [
+            pos.eq(first),
+            open_lane.eq(Mux(first, 0, prev)),
+            run.eq(cnt),
+        ]
+
+        def close(cond, code):
+            # Resolve the open code byte, either in place or through the length stream.
+            for lane in range(width):
+                with m.If(cond & (open_lane == lane)):
+                    m.d.comb += out.data[lane].eq(code)
+            with m.If(cond & (open_lane == prev)):
+                m.d.comb += [
+                    self.output_len.valid.eq(self.input.valid & self.input.ready),
+                    self.output_len.payload.eq(code),
+                ]
+
+        def write(cond, value):
+            for lane in range(width):
+                with m.If(cond & (pos == lane)):
+                    m.d.comb += out.data[lane].eq(value)
+
+        for i in range(lanes):
+            byte = payload.data[i]
+            valid = i < payload.count
+            is_delimiter = valid & (byte == self.delimiter)
+            is_data = valid & (byte != self.delimiter)
+
+            close(is_delimiter, self.header(run))
+            write(is_data, byte)
+
+            data_pos = Signal(range(width + 1), name = f'pos_{i}')
+            data_run = Signal(8, name = f'run_{i}')
+            data_open = Signal(range(width + 1), name = f'open_{i}')
+            m.d.comb += [
+                data_pos.eq(Mux(valid, pos + 1, pos)),
+                data_run.eq(Mux(is_data, run + 1, Mux(is_delimiter, 0, run))),
+                data_open.eq(Mux(is_delimiter, pos, open_lane)),
+            ]
+
+            # A full run of 254 forces a new code byte if more data follows.
+            more = ~payload.last | (i + 1 < payload.count)
+            split = is_data & (data_run == 254) & more
+
+            close(split, self.header(data_run))
+
+            pos, run, open_lane = data_pos, data_run, data_open
+
+            next_pos = Signal(range(width + 1), name = f'pos_{i}_split')
+            next_run = Signal(8, name = f'run_{i}_split')
+            next_open = Signal(range(width + 1), name = f'open_{i}_split')
+            m.d.comb += [
+                next_pos.eq(Mux(split, pos + 1, pos)),
+                next_run.eq(Mux(split, 0, run)),
+                next_open.eq(Mux(split, pos, open_lane)),
+            ]
+
+            pos, run, open_lane = next_pos, next_run, next_open
+
+        close(payload.last, self.header(run))
+        write(payload.last, self.delimiter)
+
+        m.d.comb += [
+            out.count.eq(Mux(payload.last, pos + 1, pos)),
+            out.pending.eq(~payload.last & (open_lane != prev)),
+            out.pending_lane.eq(open_lane),
+        ]
+
+        with m.If(self.input.valid & self.input.ready):
+            m.d.sync += [
+                cnt.eq(run),
+                first.eq(payload.last),
+            ]
+
+            with m.If(payload.last):
+                m.d.sync += cnt.eq(0)
+
+        return m
+
+class WideGroupCombiner(wiring.Component):
+    def __init__(self, lanes):
+        super().__init__({
+            'input_data': wiring.In(stream.Signature(_segment_layout(lanes))),
+            'input_len': wiring.In(stream.Signature(8)),
+            'output': wiring.Out(stream.Signature(_segment_layout(lanes))),
+        })
+        self.lanes = lanes
+
+    def elaborate(self, platform):
+        m = Module()
+
+        segment = self.input_data.payload
+        ready = self.input_len.valid | ~segment.pending
+
+        m.d.comb += [
+            self.output.valid.eq(self.input_data.valid & ready),
+            self.input_data.ready.eq(self.output.ready & ready),
+            self.input_len.ready.eq(self.output.ready & self.input_data.valid & segment.pending),
+            self.output.payload.eq(segment),
+        ]
+
+        with m.If(segment.pending):
+            m.d.comb += self.output.payload.data[segment.pending_lane].eq(self.input_len.payload)
+
+        return m
+
+class WideRealigner(wiring.Component):
+    def __init__(self, lanes, delimiter = 0):
+        super().__init__({
+            'input': wiring.In(stream.Signature(_segment_layout(lanes))),
+            'output': wiring.Out(stream.Signature(Packet(data.ArrayLayout(8, lanes), has_last = True))),
+        })
+        self.lanes = lanes
+        self.delimiter = delimiter
+
+    def elaborate(self, platform):
+        m = Module()
+
+        lanes = self.lanes
+
+        buf = Signal(8 * (2 * lanes + 1))
+        level = Signal(range(2 * lanes + 2))
+
+        # Buffered bytes end on a packet boundary.
+        boundary = Signal()
+
+        combined = Signal.like(buf)
+        total = Signal.like(level)
+        m.d.comb += [
+            combined.eq(buf | (self.input.payload.data.as_value() << (level * 8))),
+            total.eq(level + self.input.payload.count),
+        ]
+
+        padding = Signal(8 * lanes)
+        for lane in range(lanes):
+            m.d.comb += padding[lane * 8:lane * 8 + 8].eq(Mux(lane < level, buf[lane * 8:lane * 8 + 8], self.delimiter))
+
+        with m.If(level >= lanes):
+            # More than a full word is buffered, drain it before accepting more.
+            m.d.comb += [
+                self.output.valid.eq(1),
+                self.output.payload.data.eq(buf),
+                self.output.payload.last.eq((level == lanes) & boundary),
+            ]
+
+            with m.If(self.output.ready):
+                m.d.sync += [
+                    buf.eq(buf >> (8 * lanes)),
+                    level.eq(level - lanes),
+                ]
+
+        with m.Elif(self.input.valid):
+            with m.If(total >= lanes):
+                m.d.comb += [
+                    self.output.valid.eq(1),
+                    self.output.payload.data.eq(combined),
+                    self.output.payload.last.eq((total == lanes) & self.input.payload.last),
+                    self.input.ready.eq(self.output.ready),
+                ]
+
+                with m.If(self.output.ready):
+                    m.d.sync += [
+                        buf.eq(combined >> (8 * lanes)),
+                        level.eq(total - lanes),
+                        boundary.eq(self.input.payload.last),
+                    ]
+
+            with m.Else():
+                m.d.comb += self.input.ready.eq(1)
+                m.d.sync += [
+                    buf.eq(combined),
+                    level.eq(total),
+                    boundary.eq(self.input.payload.last),
+                ]
+
+        with m.Elif((level > 0) & boundary):
+            # Input is idle at a packet boundary; flush the partial word padded with delimiters,
+            # which the host sees as empty frames.
+            m.d.comb += [
+                self.output.valid.eq(1),
+                self.output.payload.data.eq(padding),
+                self.output.payload.last.eq(1),
+            ]
+
+            with m.If(self.output.ready):
+                m.d.sync += [
+                    buf.eq(0),
+                    level.eq(0),
+                ]
+
+        return m
+
+class WideCOBSEncoder(wiring.Component):
+    def __init__(self, lanes = 4, *, delimiter = 0):
+        super().__init__({
+            'input': wiring.In(stream.Signature(Packet(data.ArrayLayout(8, lanes), has_last = True, has_count = True))),
+            'output': wiring.Out(stream.Signature(Packet(data.ArrayLayout(8, lanes), has_last = True))),
+        })
+        self.lanes = lanes
+        self.delimiter = delimiter
+
+    def elaborate(self, platform):
+        m = Module()
+
+        # Deep enough to hold the words spanned by a full 254 byte group.
+        depth = 2 * (256 // self.lanes)
+
+        m.submodules.group_splitter = group_splitter = WideGroupSplitter(self.lanes, self.delimiter)
+        m.submodules.fifo_len = fifo_len = SyncFIFOBuffered(8, depth)
+        m.submodules.fifo_data = fifo_data = SyncFIFOBuffered(_segment_layout(self.lanes), depth)
+        m.submodules.group_combiner = group_combiner = WideGroupCombiner(self.lanes)
+        m.submodules.realigner = realigner = WideRealigner(self.lanes, self.delimiter)
+
+        wiring.connect(m, wiring.flipped(self.input), group_splitter.input)
+        wiring.connect(m, group_splitter.output_len, fifo_len.input)
+        wiring.connect(m, group_splitter.output_data, fifo_data.input)
+        wiring.connect(m, fifo_len.output, group_combiner.input_len)
+        wiring.connect(m, fifo_data.output, group_combiner.input_data)
+        wiring.connect(m, group_combiner.output, realigner.input)
+        wiring.connect(m, realigner.output, wiring.flipped(self.output))
+
+        return m
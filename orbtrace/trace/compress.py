@@ -0,0 +1,248 @@
+from amaranth import *
+from amaranth.lib import wiring, stream
+
+from ..stream import Packet
+from .tpiu import FLAG_COMPRESSED
+
+# Compressed packets are marked with FLAG_COMPRESSED, adding the flags byte if there isn't one.
+# After the header, data is passed through except for escapes:
+#  [ESCAPE, 0]            literal ESCAPE
+#  [ESCAPE, dist, count]  repeat count bytes starting dist bytes back, copies may overlap
+# Matches are searched in the last window bytes of the packet, and only taken after MIN_RUN
+# matching bytes have been sent as literals. Bytes extending a match are held back until
+# the match ends, which is at most 255 bytes or the end of the packet.
+ESCAPE = 0xa5
+MIN_RUN = 4
+
+class Compressor(wiring.Component):
+    input: wiring.In(stream.Signature(Packet(has_last = True)))
+    output: wiring.Out(stream.Signature(Packet(has_last = True)))
+
+    enable: wiring.In(1)
+
+    def __init__(self, window = 32):
+        assert 1 <= window <= 255
+        super().__init__()
+        self.window = window
+
+    def elaborate(self, platform):
+        m = Module()
+
+        data = self.input.payload.data
+        accept = self.input.valid & self.input.ready
+
+        history = Signal(8 * self.window)
+        filled = Signal(range(self.window + 1))
+        runs = [Signal(range(MIN_RUN + 1), name = f'run_{d}') for d in range(1, self.window + 1)]
+        matches = Signal(self.window)
+
+        dist = Signal(range(1, self.window + 1), init = 1)
+        count = Signal(8)
+        token_idx = Signal(2)
+        token_last = Signal()
+
+        update = Signal()
+        reset_runs = Signal()
+
+        # Shortest distance that has matched MIN_RUN bytes in a row, including this one.
+        found = Signal()
+        found_dist = Signal(range(1, self.window + 1))
+
+        for d in reversed(range(1, self.window + 1)):
+            m.d.comb += matches[d - 1].eq((data == history.word_select(d - 1, 8)) & (filled >= d))
+
+            with m.If(matches[d - 1] & (runs[d - 1] >= MIN_RUN - 1)):
+                m.d.comb += [
+                    found.eq(1),
+                    found_dist.eq(d),
+                ]
+
+        with m.If(update & accept):
+            m.d.sync += history.eq(Cat(data, history[:-8]))
+
+            with m.If(filled < self.window):
+                m.d.sync += filled.eq(filled + 1)
+
+            for d in range(1, self.window + 1):
+                with m.If(~matches[d - 1]):
+                    m.d.sync += runs[d - 1].eq(0)
+                with m.Elif(runs[d - 1] < MIN_RUN):
+                    m.d.sync += runs[d - 1].eq(runs[d - 1] + 1)
+
+        with m.If(reset_runs):
+            m.d.sync += [run.eq(0) for run in runs]
+
+        def next_literal():
+            with m.If(self.input.payload.last):
+                m.next = 'HEADER'
+            with m.Elif(found):
+                m.d.sync += [
+                    dist.eq(found_dist),
+                    count.eq(0),
+                ]
+                m.next = 'MATCH'
+            with m.Else():
+                m.next = 'LITERAL'
+
+        with m.FSM():
+            with m.State('HEADER'):
+                wiring.connect(m, wiring.flipped(self.input), wiring.flipped(self.output))
+
+                compress = self.enable & ~self.input.payload.last
+
+                with m.If(compress):
+                    m.d.comb += self.output.payload.data[7].eq(1)
+
+                with m.If(accept):
+                    m.d.sync += [
+                        filled.eq(0),
+                        [run.eq(0) for run in runs],
+                    ]
+
+                    with m.If(~self.input.payload.last):
+                        m.next = 'PASS'
+
+                    with m.If(compress & data[7]):
+                        m.next = 'FLAGS'
+                    with m.Elif(compress):
+                        m.next = 'ADD_FLAGS'
+
+            with m.State('FLAGS'):
+                wiring.connect(m, wiring.flipped(self.input), wiring.flipped(self.output))
+                m.d.comb += self.output.payload.data.eq(data | FLAG_COMPRESSED)
+
+                with m.If(accept):
+                    m.next = 'LITERAL'
+
+                    with m.If(self.input.payload.last):
+                        m.next = 'HEADER'
+
+            with m.State('ADD_FLAGS'):
+                m.d.comb += [
+                    self.output.valid.eq(1),
+                    self.output.payload.data.eq(FLAG_COMPRESSED),
+                ]
+
+                with m.If(self.output.ready):
+                    m.next = 'LITERAL'
+
+            with m.State('PASS'):
+                wiring.connect(m, wiring.flipped(self.input), wiring.flipped(self.output))
+
+                with m.If(accept & self.input.payload.last):
+                    m.next = 'HEADER'
+
+            with m.State('LITERAL'):
+                with m.If(data == ESCAPE):
+                    m.d.comb += [
+                        self.output.valid.eq(self.input.valid),
+                        self.output.payload.data.eq(ESCAPE),
+                    ]
+
+                    with m.If(self.input.valid & self.output.ready):
+                        m.next = 'ESCAPE'
+
+                with m.Else():
+                    wiring.connect(m, wiring.flipped(self.input), wiring.flipped(self.output))
+                    m.d.comb += update.eq(1)
+
+                    with m.If(accept):
+                        next_literal()
+
+            with m.State('ESCAPE'):
+                m.d.comb += [
+                    self.output.valid.eq(self.input.valid),
+                    self.output.payload.data.eq(0),
+                    self.output.payload.last.eq(self.input.payload.last),
+                    self.input.ready.eq(self.output.ready),
+                    update.eq(1),
+                ]
+
+                with m.If(accept):
+                    next_literal()
+
+            with m.State('MATCH'):
+                cont = Cat(C(0, 1), matches).bit_select(dist, 1) & (count < 255)
+
+                m.d.comb += [
+                    self.input.ready.eq(cont),
+                    update.eq(1),
+                ]
+
+                with m.If(accept):
+                    m.d.sync += count.eq(count + 1)
+
+                    with m.If(self.input.payload.last):
+                        m.d.sync += [
+                            token_idx.eq(0),
+                            token_last.eq(1),
+                        ]
+                        m.next = 'TOKEN'
+
+                with m.Elif(self.input.valid):
+                    # Nothing matched beyond the literals already sent.
+                    with m.If(count == 0):
+                        m.d.comb += reset_runs.eq(1)
+                        m.next = 'LITERAL'
+
+                    with m.Else():
+                        m.d.sync += [
+                            token_idx.eq(0),
+                            token_last.eq(0),
+                        ]
+                        m.next = 'TOKEN'
+
+            with m.State('TOKEN'):
+                m.d.comb += [
+                    self.output.valid.eq(1),
+                    self.output.payload.data.eq(Cat(C(ESCAPE, 8), dist, C(0, 8 - len(dist)), count).word_select(token_idx, 8)),
+                    self.output.payload.last.eq(token_last & (token_idx == 2)),
+                ]
+
+                with m.If(self.output.ready):
+                    m.d.sync += token_idx.eq(token_idx + 1)
+
+                    with m.If(token_idx == 2):
+                        m.d.comb += reset_runs.eq(1)
+                        m.next = 'LITERAL'
+
+                        with m.If(token_last):
+                            m.next = 'HEADER'
+
+        return m
+
+def decompress(packet):
+    if not (packet[0] & 0x80 and packet[1] & FLAG_COMPRESSED):
+        return bytes(packet)
+
+    # Restore the header as it was before compression.
+    flags = packet[1] & ~FLAG_COMPRESSED
+
+    if flags:
+        out = bytearray([packet[0], flags])
+    else:
+        out = bytearray([packet[0] & 0x7f])
+
+    start = len(out)
+    i = 2
+
+    while i < len(packet):
+        b = packet[i]
+
+        if b != ESCAPE:
+            out.append(b)
+            i += 1
+
+        elif packet[i + 1] == 0:
+            out.append(ESCAPE)
+            i += 2
+
+        else:
+            dist, count = packet[i + 1], packet[i + 2]
+            assert dist <= len(out) - start
+
+            for _ in range(count):
+                out.append(out[-dist])
+            i += 3
+
+    return bytes(out)
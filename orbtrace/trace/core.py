@@ -1,13 +1,70 @@
 from amaranth import *
-from amaranth.lib import wiring, stream
-
-from ..stream import Packet, SyncFIFOBuffered, AsyncFIFOBuffered
-
-from . import swo, tpiu, cobs, orbflow, util
+from amaranth.lib import wiring, stream, data
+
+from ..stream import Packet, SyncFIFOBuffered, AsyncFIFOBuffered, Packer, Serializer, PacketArbiter, PacketFIFO
+
+from . import swo, tpiu, cobs, orbflow, util, compress
+from .orbflow import TriggerConfig
+from .tpiu import ITMFilterConfig, itm_filter_default
+
+# Superframe flush policy; interval and idle are in cycles, threshold in bytes.
+FramingConfig = data.StructLayout({
+    'interval': 32,
+    'threshold': 32,
+    'idle': 32,
+})
+
+framing_default = {
+    'interval': 7_500_000,
+    'threshold': 65536,
+    'idle': 75_000,
+}
+
+# Demux packet framing; max_size is in bytes and timeout in cycles.
+PacketizerConfig = data.StructLayout({
+    'max_size': 32,
+    'timeout': 32,
+})
+
+packetizer_default = {
+    'max_size': 1024,
+    'timeout': 7_500_000,
+}
+
+# Buffer depths; demux, output and trigger are in bytes, the rest in entries.
+fifo_depths_default = {
+    'swo2x': 8,
+    'swo': 16,
+    'trace': 16,
+    'demux': 2048,
+    'trigger': 4096,
+    'output': 8192,
+}
+
+def ebr_estimate(width, depth):
+    # ECP5 DP16KD blocks in their best aspect ratio; shallow memories go in distributed RAM instead.
+    if depth <= 32:
+        return 0
+
+    return min(-(-width // w) * -(-depth // d) for w, d in [(1, 16384), (2, 8192), (4, 4096), (9, 2048), (18, 1024), (36, 512)])
+
+TraceStats = data.StructLayout({
+    'trace_frames': 32,
+    'trace_frames_lost': 32,
+    'swo_bytes': 32,
+    'swo_bytes_lost': 32,
+    'sync_losses': 32,
+    'packets': 32,
+    'output_bytes': 64,
+    'fifo_max_level': 32,
+    'fifo_depth': 32,
+    'async_bitlen': 32,
+})
 
 class TraceIF(wiring.Component):
     output: wiring.Out(stream.Signature(tpiu.TPIURawFrame))
 
+    # 0 and 1 are 1-bit, 2 is 2-bit and 3 is 4-bit.
     width: wiring.In(2)
 
     trace_a: wiring.In(4)
@@ -16,89 +73,251 @@ class TraceIF(wiring.Component):
     def elaborate(self, platform):
         m = Module()
 
+        # Incoming bits are shifted in from the top, rising edge first.
+        construct = Signal(36)
+
+        with m.Switch(self.width):
+            with m.Case(3):
+                m.d.sync += construct.eq(Cat(construct[8:], self.trace_a, self.trace_b))
+            with m.Case(2):
+                m.d.sync += construct.eq(Cat(construct[4:], self.trace_a[:2], self.trace_b[:2]))
+            with m.Default():
+                m.d.sync += construct.eq(Cat(construct[2:], self.trace_a[0], self.trace_b[0]))
+
+        # A full sync can end on either clock edge; the edge it was seen on sets where words are taken from.
+        re_aligned = Signal()
+        re_sync = construct[4:36] == 0x7fffffff
+        fe_sync = Signal()
+        word = Signal(16)
+        word_clocks = Signal(3)
+
+        with m.Switch(self.width):
+            with m.Case(3):
+                m.d.comb += [
+                    fe_sync.eq(construct[0:32] == 0x7fffffff),
+                    word.eq(construct[16:32]),
+                    word_clocks.eq(1),
+                ]
+            with m.Case(2):
+                m.d.comb += [
+                    fe_sync.eq(construct[2:34] == 0x7fffffff),
+                    word.eq(construct[18:34]),
+                    word_clocks.eq(3),
+                ]
+            with m.Default():
+                m.d.comb += [
+                    fe_sync.eq(construct[3:35] == 0x7fffffff),
+                    word.eq(construct[19:35]),
+                    word_clocks.eq(7),
+                ]
+
+        with m.If(re_aligned):
+            m.d.comb += word.eq(construct[20:36])
+
+        with m.If(re_sync):
+            m.d.sync += re_aligned.eq(1)
+        with m.If(fe_sync):
+            m.d.sync += re_aligned.eq(0)
+
+        # Frames are collected as eight 16-bit words, first word in the top bits.
+        synced = Signal()
+        remaining = Signal(3)
+        idx = Signal(3)
+        partial = Signal(112)
         frame = Signal(128)
-        fravail = Signal()
-        fravail_last = Signal()
+        frame_valid = Signal()
+
+        word_bytes = Cat(word[8:], word[:8])
+
+        m.d.sync += frame_valid.eq(0)
+
+        with m.If(re_sync | fe_sync):
+            # Drop any partial frame.
+            m.d.sync += [
+                synced.eq(1),
+                remaining.eq(word_clocks),
+                idx.eq(7),
+            ]
+        with m.Elif(remaining != 0):
+            m.d.sync += remaining.eq(remaining - 1)
+        with m.Else():
+            m.d.sync += remaining.eq(word_clocks)
+
+            # Half syncs are padding.
+            with m.If(synced & (word != 0x7fff)):
+                m.d.sync += idx.eq(idx - 1)
+
+                with m.Switch(idx):
+                    for i in range(1, 8):
+                        with m.Case(i):
+                            m.d.sync += partial[(i - 1) * 16:i * 16].eq(word_bytes)
+                    with m.Case(0):
+                        m.d.sync += [
+                            frame.eq(Cat(word_bytes, partial)),
+                            frame_valid.eq(1),
+                        ]
 
         for byte, bit in zip(range(16), reversed(range(0, 128, 8))):
             m.d.comb += self.output.payload[byte].eq(frame[bit:bit + 8])
 
-        m.d.sync += fravail_last.eq(fravail)
-        m.d.comb += self.output.valid.eq(fravail != fravail_last)
-
-        m.submodules.traceif = Instance('traceIF',
-            i_traceClkin = ClockSignal(),
-            i_rst = ResetSignal(),
-            i_traceDina = self.trace_a,
-            i_traceDinb = self.trace_b,
-            i_width = self.width,
-
-            o_Frame = frame,
-            o_FrAvail = fravail,
-            #o_edgeOutput = edgeOutput,
-        )
+        # The FIFO behind this is written in the trace domain, so frames are never held back.
+        m.d.comb += self.output.valid.eq(frame_valid)
 
         return m
 
 class TraceCore(wiring.Component):
-    output: wiring.Out(stream.Signature(Packet(has_last = True)))
+    def __init__(self, byte_width = 1, fifo_depths = None):
+        if byte_width == 1:
+            output_shape = Packet(has_last = True)
+        else:
+            output_shape = Packet(data.ArrayLayout(8, byte_width), has_last = True)
 
-    output_compat_data: wiring.Out(8)
-    output_compat_last: wiring.Out(1)
+        super().__init__({
+            'output': wiring.Out(stream.Signature(output_shape)),
 
-    input_format: wiring.In(8)
-    input_format_strobe: wiring.In(1)
+            'output_compat_data': wiring.Out(8 * byte_width),
+            'output_compat_last': wiring.Out(1),
 
-    async_baudrate: wiring.In(32)
-    async_baudrate_strobe: wiring.In(1)
+            'input_format': wiring.In(8),
+            'input_format_strobe': wiring.In(1),
 
-    trace_a: wiring.In(4)
-    trace_b: wiring.In(4)
+            'output_format': wiring.In(8),
+
+            'channel_mask': wiring.In(128, init = 2**128 - 1),
+            'itm_filter': wiring.In(ITMFilterConfig, init = itm_filter_default),
 
-    swo: wiring.In(2)
+            'timestamp_enable': wiring.In(1),
+            'compression_enable': wiring.In(1),
 
-    led_overrun: wiring.Out(1)
-    led_data: wiring.Out(1)
-    led_clk: wiring.Out(1)
+            'framing': wiring.In(FramingConfig, init = framing_default),
+            'packetizer': wiring.In(PacketizerConfig, init = packetizer_default),
+            'trigger': wiring.In(TriggerConfig),
+
+            'async_baudrate': wiring.In(32),
+            'async_baudrate_strobe': wiring.In(1),
+
+            'trace_a': wiring.In(4),
+            'trace_b': wiring.In(4),
+
+            'swo': wiring.In(2),
+
+            'stats': wiring.Out(TraceStats),
+
+            'led_overrun': wiring.Out(1),
+            'led_data': wiring.Out(1),
+            'led_clk': wiring.Out(1),
+        })
+
+        self.byte_width = byte_width
+        self.fifo_depths = fifo_depths_default | (fifo_depths or {})
+
+    def fifo_usage(self):
+        depths = self.fifo_depths
+        output_shape = self.output.payload.shape()
+
+        if self.byte_width == 1:
+            cobs_fifos = [('cobs_len', 9, 256), ('cobs_data', 8, 256)]
+        else:
+            depth = 2 * (256 // self.byte_width)
+            cobs_fifos = [('cobs_len', 8, depth), ('cobs_data', Shape.cast(cobs._segment_layout(self.byte_width)).width, depth)]
+
+        fifos = [
+            ('swo2x', Shape.cast(swo.PulseLength).width, depths['swo2x']),
+            ('swo', 8, depths['swo']),
+            ('trace', Shape.cast(tpiu.TPIURawFrame).width, depths['trace']),
+            ('demux_trace', 9, depths['demux']),
+            ('demux_swo', 9, depths['demux']),
+            ('trigger', 9, depths['trigger']),
+            *cobs_fifos,
+            ('output', Shape.cast(output_shape).width, depths['output'] // self.byte_width),
+        ]
+
+        return [(name, width, depth, ebr_estimate(width, depth)) for name, width, depth in fifos]
 
     def elaborate(self, platform):
         m = Module()
 
         m.submodules.pulse_length_capture = pulse_length_capture = DomainRenamer('swo2x')(swo.PulseLengthCapture())
-        m.submodules.swo2x_fifo = swo2x_fifo = DomainRenamer({'write': 'swo2x', 'read': 'swo'})(AsyncFIFOBuffered(swo.PulseLength, 8))
+        m.submodules.swo2x_fifo = swo2x_fifo = DomainRenamer({'write': 'swo2x', 'read': 'swo'})(AsyncFIFOBuffered(swo.PulseLength, self.fifo_depths['swo2x']))
 
         m.submodules.manchester_decoder = manchester_decoder = DomainRenamer('swo')(swo.ManchesterDecoder())
         m.submodules.bits_to_bytes = bits_to_bytes = DomainRenamer('swo')(swo.BitsToBytes())
 
         m.submodules.nrz_decoder = nrz_decoder = DomainRenamer('swo')(swo.NRZDecoder())
         m.submodules.uart_decoder = uart_decoder = DomainRenamer('swo')(swo.UARTDecoder())
+        m.submodules.auto_baud = auto_baud = DomainRenamer('swo')(swo.AutoBaud())
 
-        m.submodules.swo_fifo = swo_fifo = DomainRenamer({'write': 'swo', 'read': 'sync'})(AsyncFIFOBuffered(8, 16))
+        m.submodules.swo_fifo = swo_fifo = DomainRenamer({'write': 'swo', 'read': 'sync'})(AsyncFIFOBuffered(8, self.fifo_depths['swo']))
 
         m.submodules.traceif = traceif = DomainRenamer('trace')(TraceIF())
-        m.submodules.trace_fifo = trace_fifo = DomainRenamer({'write': 'trace', 'read': 'sync'})(AsyncFIFOBuffered(tpiu.TPIURawFrame, 4))
+        m.submodules.trace_fifo = trace_fifo = DomainRenamer({'write': 'trace', 'read': 'sync'})(AsyncFIFOBuffered(tpiu.TPIURawFrame, self.fifo_depths['trace']))
 
         m.submodules.tpiu_sync = tpiu_sync = tpiu.TPIUSync()
         m.submodules.tpiu_demux = tpiu_demux = tpiu.TPIUDemux()
+        m.submodules.swo_demux = swo_demux = tpiu.TPIUDemux(channel_offset = 0x40)
+        m.submodules.trace_demux_fifo = trace_demux_fifo = PacketFIFO(Packet(has_last = True), self.fifo_depths['demux'])
+        m.submodules.swo_demux_fifo = swo_demux_fifo = PacketFIFO(Packet(has_last = True), self.fifo_depths['demux'])
+        m.submodules.demux_arbiter = demux_arbiter = PacketArbiter(Packet(has_last = True), 2)
+        m.submodules.trigger = trigger = orbflow.Trigger(self.fifo_depths['trigger'])
+        m.submodules.loss_reporter = loss_reporter = orbflow.LossReporter()
+        m.submodules.compressor = compressor = compress.Compressor()
         m.submodules.checksum_appender = checksum_appender = orbflow.ChecksumAppender()
-        m.submodules.cobs_encoder = cobs_encoder = cobs.COBSEncoder(append_delimiter = True)
-        m.submodules.superframer = superframer = orbflow.SuperFramer(7_500_000, 65536)
-        m.submodules.fifo = fifo = SyncFIFOBuffered(Packet(has_last = True), 8192)
+        if self.byte_width == 1:
+            m.submodules.cobs_encoder = cobs_encoder = cobs.COBSEncoder(append_delimiter = True)
+        else:
+            m.submodules.packer = packer = Packer(data.ArrayLayout(8, self.byte_width), has_count = True)
+            m.submodules.cobs_encoder = cobs_encoder = cobs.WideCOBSEncoder(self.byte_width)
+
+        # Raw TPIU frames, split into bytes or words with each frame forming a packet.
+        tpiu_frames = stream.Signature(tpiu.TPIURawFrame).flip().create()
+        frame_shape = data.ArrayLayout(self.output.payload.shape()['data'].shape, 16 // self.byte_width)
+        m.submodules.tpiu_serializer = tpiu_serializer = Serializer(frame_shape, has_last = True)
+
+        m.d.comb += [
+            tpiu_serializer.input.valid.eq(tpiu_frames.valid),
+            tpiu_serializer.input.payload.eq(tpiu_frames.payload.as_value()),
+            tpiu_frames.ready.eq(tpiu_serializer.input.ready),
+        ]
+
+        m.submodules.superframer = superframer = orbflow.SuperFramer(framing_default['interval'], framing_default['threshold'] // self.byte_width, self.output.payload.shape(), framing_default['idle'])
+        m.submodules.fifo = fifo = SyncFIFOBuffered(self.output.payload.shape(), self.fifo_depths['output'] // self.byte_width)
 
-        m.submodules.baudrate_divider = baudrate_divider = util.Divider(8_000_000_000, 32, 16)
+        # Bit length in 1/16 samples at 500 MHz.
+        m.submodules.baudrate_divider = baudrate_divider = util.Divider(34, 32, 20)
 
         m.d.comb += [
+            baudrate_divider.num.eq(8_000_000_000),
             baudrate_divider.den.eq(self.async_baudrate),
             baudrate_divider.start.eq(self.async_baudrate_strobe),
-            nrz_decoder.bitlen.eq(baudrate_divider.res),
         ]
 
+        # A baudrate of 0 selects auto-baud, measured from the pulse lengths seen by the NRZ decoder.
+        m.d.comb += [
+            auto_baud.input.valid.eq(swo2x_fifo.output.valid & swo2x_fifo.output.ready),
+            auto_baud.input.payload.eq(swo2x_fifo.output.payload),
+        ]
+
+        with m.If((self.async_baudrate == 0) & auto_baud.locked):
+            m.d.comb += nrz_decoder.bitlen.eq(auto_baud.bitlen)
+        with m.Else():
+            m.d.comb += nrz_decoder.bitlen.eq(baudrate_divider.res)
+
         m.d.comb += pulse_length_capture.input.eq(self.swo)
         wiring.connect(m, pulse_length_capture.output, swo2x_fifo.input)
         wiring.connect(m, manchester_decoder.output, bits_to_bytes.input)
         wiring.connect(m, nrz_decoder.output, uart_decoder.input)
 
-        with m.Switch(self.input_format):
+        # Combined formats are 0b0100ssww, capturing parallel trace of width ww concurrently with SWO format 0x10 | ss.
+        # SWO channels are then moved up by 0x40 so they don't collide with the parallel ones.
+        combined = self.input_format[4:] == 0x4
+        swo_format = Signal(8)
+
+        with m.If(combined):
+            m.d.comb += swo_format.eq(0x10 | self.input_format[2:4])
+        with m.Else():
+            m.d.comb += swo_format.eq(self.input_format)
+
+        with m.Switch(swo_format):
             with m.Case(0x10, 0x11):
                 wiring.connect(m, swo2x_fifo.output, manchester_decoder.input)
                 wiring.connect(m, bits_to_bytes.output, swo_fifo.input)
@@ -111,22 +330,117 @@ class TraceCore(wiring.Component):
         m.d.comb += traceif.trace_b.eq(self.trace_b)
         wiring.connect(m, traceif.output, trace_fifo.input)
 
+        tpiu_output = self.output_format == 0x01
+
         with m.Switch(self.input_format):
             with m.Case(0x01, 0x02, 0x03):
-                wiring.connect(m, trace_fifo.output, tpiu_demux.input)
+                with m.If(tpiu_output):
+                    wiring.connect(m, trace_fifo.output, tpiu_frames)
+                with m.Else():
+                    wiring.connect(m, trace_fifo.output, tpiu_demux.input)
                 m.d.comb += traceif.width.eq(self.input_format)
 
             with m.Case(0x11, 0x13):
                 wiring.connect(m, swo_fifo.output, tpiu_sync.input)
-                wiring.connect(m, tpiu_sync.output, tpiu_demux.input)
+                with m.If(tpiu_output):
+                    wiring.connect(m, tpiu_sync.output, tpiu_frames)
+                with m.Else():
+                    wiring.connect(m, tpiu_sync.output, tpiu_demux.input)
 
             with m.Case(0x10, 0x12):
                 wiring.connect(m, swo_fifo.output, tpiu_demux.input_bypass)
                 m.d.comb += tpiu_demux.bypass.eq(1)
 
-        wiring.connect(m, tpiu_demux.output, checksum_appender.input)
-        wiring.connect(m, checksum_appender.output, cobs_encoder.input)
-        wiring.connect(m, cobs_encoder.output, superframer.input)
+            # Raw TPIU output only carries the parallel frames in combined mode.
+            with m.Case('0100----'):
+                with m.If(tpiu_output):
+                    wiring.connect(m, trace_fifo.output, tpiu_frames)
+                with m.Else():
+                    wiring.connect(m, trace_fifo.output, tpiu_demux.input)
+                m.d.comb += traceif.width.eq(self.input_format[:2])
+
+                with m.Switch(swo_format):
+                    with m.Case(0x11, 0x13):
+                        wiring.connect(m, swo_fifo.output, tpiu_sync.input)
+                        wiring.connect(m, tpiu_sync.output, swo_demux.input)
+
+                    with m.Case(0x10, 0x12):
+                        wiring.connect(m, swo_fifo.output, swo_demux.input_bypass)
+                        m.d.comb += swo_demux.bypass.eq(1)
+
+        timestamp = Signal(32)
+        m.d.sync += timestamp.eq(timestamp + 1)
+
+        # In combined mode, packets are limited to what fits in the demux FIFOs with a channel byte, flags and timestamp,
+        # so a packet that takes a while to complete never holds up the other side.
+        # While the trigger is enabled, packets are likewise limited to what fits in the trigger history,
+        # since the trigger can only keep whole packets.
+        max_size = Signal(32)
+        max_size_limit = Signal(32, init = 2**32 - 1)
+        demux_limit = self.fifo_depths['demux'] - 6
+        trigger_limit = self.fifo_depths['trigger'] - 6
+
+        with m.If(combined & self.trigger.enable):
+            m.d.comb += max_size_limit.eq(min(demux_limit, trigger_limit))
+        with m.Elif(combined):
+            m.d.comb += max_size_limit.eq(demux_limit)
+        with m.Elif(self.trigger.enable):
+            m.d.comb += max_size_limit.eq(trigger_limit)
+
+        with m.If(self.packetizer.max_size > max_size_limit):
+            m.d.comb += max_size.eq(max_size_limit)
+        with m.Else():
+            m.d.comb += max_size.eq(self.packetizer.max_size)
+
+        m.d.comb += [
+            tpiu_demux.channel_mask.eq(self.channel_mask),
+            tpiu_demux.itm_filter.eq(self.itm_filter),
+            tpiu_demux.timestamp.eq(timestamp),
+            tpiu_demux.timestamp_enable.eq(self.timestamp_enable),
+            tpiu_demux.max_size.eq(max_size),
+            tpiu_demux.timeout.eq(self.packetizer.timeout),
+
+            swo_demux.channel_mask.eq(self.channel_mask[0x40:]),
+            swo_demux.itm_filter.eq(self.itm_filter),
+            swo_demux.timestamp.eq(timestamp),
+            swo_demux.timestamp_enable.eq(self.timestamp_enable),
+            swo_demux.max_size.eq(max_size),
+            swo_demux.timeout.eq(self.packetizer.timeout),
+        ]
+
+        wiring.connect(m, tpiu_demux.output, trace_demux_fifo.input)
+        wiring.connect(m, swo_demux.output, swo_demux_fifo.input)
+        wiring.connect(m, trace_demux_fifo.output, demux_arbiter.input[0])
+        wiring.connect(m, swo_demux_fifo.output, demux_arbiter.input[1])
+        wiring.connect(m, demux_arbiter.output, trigger.input)
+        wiring.connect(m, trigger.output, loss_reporter.input)
+
+        m.d.comb += trigger.config.eq(self.trigger)
+        wiring.connect(m, loss_reporter.output, compressor.input)
+        wiring.connect(m, compressor.output, checksum_appender.input)
+
+        m.d.comb += compressor.enable.eq(self.compression_enable)
+
+        # The wide encoder takes packets packed into words and emits full words, padding with
+        # delimiters only when idle at a packet boundary; the host sees those as empty frames.
+        if self.byte_width == 1:
+            wiring.connect(m, checksum_appender.output, cobs_encoder.input)
+        else:
+            wiring.connect(m, checksum_appender.output, packer.input)
+            wiring.connect(m, packer.output, cobs_encoder.input)
+
+        with m.If(tpiu_output):
+            wiring.connect(m, tpiu_serializer.output, superframer.input)
+        with m.Else():
+            wiring.connect(m, cobs_encoder.output, superframer.input)
+
+        m.d.comb += [
+            superframer.interval.eq(self.framing.interval),
+            superframer.threshold.eq(self.framing.threshold // self.byte_width),
+            superframer.idle.eq(self.framing.idle),
+            superframer.downstream_empty.eq(fifo.level == 0),
+        ]
+
         wiring.connect(m, superframer.output, fifo.input)
         wiring.connect(m, fifo.output, wiring.flipped(self.output))
 
@@ -137,8 +451,31 @@ class TraceCore(wiring.Component):
             self.output_compat_last.eq(self.output.payload.last),
         ]
 
-        m.submodules.trace_monitor = trace_monitor = util.Monitor(trace_fifo.input, 'trace')
-        m.submodules.swo_monitor = swo_monitor = util.Monitor(swo_fifo.input, 'swo')
+        m.submodules.trace_monitor = trace_monitor = util.Monitor(trace_fifo.input, 'trace', 32)
+        m.submodules.swo_monitor = swo_monitor = util.Monitor(swo_fifo.input, 'swo', 32)
+
+        m.d.comb += loss_reporter.lost.eq(trace_monitor.lost * 16 + swo_monitor.lost)
+
+        m.d.comb += [
+            self.stats.trace_frames.eq(trace_monitor.total),
+            self.stats.trace_frames_lost.eq(trace_monitor.lost),
+            self.stats.swo_bytes.eq(swo_monitor.total),
+            self.stats.swo_bytes_lost.eq(swo_monitor.lost),
+            self.stats.fifo_depth.eq(fifo.depth),
+            self.stats.async_bitlen.eq(nrz_decoder.bitlen),
+        ]
+
+        with m.If(tpiu_sync.sync_lost):
+            m.d.sync += self.stats.sync_losses.eq(self.stats.sync_losses + 1)
+
+        with m.If(superframer.input.valid & superframer.input.ready & superframer.input.payload.last):
+            m.d.sync += self.stats.packets.eq(self.stats.packets + 1)
+
+        with m.If(self.output.valid & self.output.ready):
+            m.d.sync += self.stats.output_bytes.eq(self.stats.output_bytes + self.byte_width)
+
+        with m.If(fifo.level > self.stats.fifo_max_level):
+            m.d.sync += self.stats.fifo_max_level.eq(fifo.level)
 
         m.submodules.trace_overrun_indicator = trace_overrun_indicator = util.Indicator(trace_monitor.lost, 7_500_000)
         m.submodules.trace_data_indicator = trace_data_indicator = util.Indicator(trace_monitor.total, 7_500_000)
@@ -161,4 +498,11 @@ class TraceCore(wiring.Component):
                     self.led_data.eq(swo_data_indicator.output),
                 ]
 
+            with m.Case('0100----'):
+                m.d.comb += [
+                    self.led_overrun.eq(trace_overrun_indicator.output | swo_overrun_indicator.output),
+                    self.led_data.eq(trace_data_indicator.output | swo_data_indicator.output),
+                    self.led_clk.eq(trace_clk_indicator.output),
+                ]
+
         return m
@@ -1,6 +1,7 @@
 from migen import *
 
 from litex.soc.interconnect.stream import Endpoint
+from litex.soc.interconnect.csr import AutoCSR, CSRStatus
 from litex.build.io import DDRInput
 
 from . import core
@@ -28,16 +29,30 @@ class TraceIO(Module):
 
         self.comb += ClockSignal().eq(traceclk)
 
-class TraceCore(Module):
-    def __init__(self, platform, wrapper):
-        self.source = source = Endpoint([('data', 8)])
+class TraceCore(Module, AutoCSR):
+    def __init__(self, platform, wrapper, byte_width = 1, fifo_depths = None):
+        self.source = source = Endpoint([('data', 8 * byte_width)])
 
         self.input_format = Signal(8)
         self.input_format_strobe = Signal()
 
+        self.output_format = Signal(8)
+
+        self.channel_mask = Signal(128, reset = 2**128 - 1)
+
+        self.timestamp_enable = Signal()
+        self.compression_enable = Signal()
+
+        self.framing = Signal(core.FramingConfig.size, reset = core.FramingConfig.const(core.framing_default).as_bits())
+        self.packetizer = Signal(core.PacketizerConfig.size, reset = core.PacketizerConfig.const(core.packetizer_default).as_bits())
+        self.trigger = Signal(core.TriggerConfig.size)
+        self.itm_filter = Signal(core.ITMFilterConfig.size, reset = core.ITMFilterConfig.const(core.itm_filter_default).as_bits())
+
         self.async_baudrate = Signal(32)
         self.async_baudrate_strobe = Signal()
 
+        self.stats = Signal(core.TraceStats.size)
+
         self.led_overrun = Signal()
         self.led_data = Signal()
         self.led_clk = Signal()
@@ -50,9 +65,11 @@ class TraceCore(Module):
         self.submodules.trace_io = trace_io = ClockDomainsRenamer('trace')(TraceIO(trace_pads))
 
 
-        core_am = core.TraceCore()
+        core_am = core.TraceCore(byte_width = byte_width, fifo_depths = fifo_depths)
         wrapper.m.submodules += core_am
 
+        self.fifo_usage = core_am.fifo_usage()
+
         wrapper.connect_domain('trace')
         wrapper.connect_domain('swo2x')
         wrapper.connect_domain('swo')
@@ -64,6 +81,18 @@ class TraceCore(Module):
         wrapper.connect(self.input_format, core_am.input_format)
         wrapper.connect(self.input_format_strobe, core_am.input_format_strobe)
 
+        wrapper.connect(self.output_format, core_am.output_format)
+
+        wrapper.connect(self.channel_mask, core_am.channel_mask)
+
+        wrapper.connect(self.timestamp_enable, core_am.timestamp_enable)
+        wrapper.connect(self.compression_enable, core_am.compression_enable)
+
+        wrapper.connect(self.framing, core_am.framing.as_value())
+        wrapper.connect(self.packetizer, core_am.packetizer.as_value())
+        wrapper.connect(self.trigger, core_am.trigger.as_value())
+        wrapper.connect(self.itm_filter, core_am.itm_filter.as_value())
+
         wrapper.connect(self.async_baudrate, core_am.async_baudrate)
         wrapper.connect(self.async_baudrate_strobe, core_am.async_baudrate_strobe)
 
@@ -72,8 +101,14 @@ class TraceCore(Module):
         wrapper.connect(source.data, core_am.output_compat_data),
         wrapper.connect(source.last, core_am.output_compat_last),
 
+        wrapper.connect(self.stats, core_am.stats.as_value())
+
+        for name, field in core.TraceStats:
+            csr = CSRStatus(field.width, name = name)
+            setattr(self, name, csr)
+            self.comb += csr.status.eq(self.stats[field.offset:field.offset + field.width])
+
         wrapper.connect(self.led_overrun, core_am.led_overrun)
         wrapper.connect(self.led_data, core_am.led_data)
         wrapper.connect(self.led_clk, core_am.led_clk)
 
-        platform.add_source('verilog/traceIF.v')
@@ -1,7 +1,22 @@
 from amaranth import *
-from amaranth.lib import wiring, stream
+from amaranth.lib import wiring, stream, data
 
-from ..stream import Packet
+from ..stream import Packet, SyncFIFOBuffered
+
+# Patterns are matched against the last four payload bytes of a packet on the given channel,
+# with the most recent byte in the top byte. Flags and timestamp bytes are skipped.
+TriggerConfig = data.StructLayout({
+    'enable': 1,
+    'rearm': 1,
+    'reserved': 14,
+    'start_channel': 8,
+    'stop_channel': 8,
+    'start_pattern': 32,
+    'start_mask': 32,
+    'stop_pattern': 32,
+    'stop_mask': 32,
+    'post': 32,
+})
 
 class ChecksumAppender(wiring.Component):
     input: wiring.In(stream.Signature(Packet(has_last = True)))
@@ -39,41 +54,104 @@ class ChecksumAppender(wiring.Component):
 
         return m
 
-class SuperFramer(wiring.Component):
+class LossReporter(wiring.Component):
     input: wiring.In(stream.Signature(Packet(has_last = True)))
     output: wiring.Out(stream.Signature(Packet(has_last = True)))
 
-    def __init__(self, interval, threshold):
-        super().__init__()
-        self.interval = interval
-        self.threshold = threshold
+    # Free running count of lost bytes.
+    lost: wiring.In(32)
 
     def elaborate(self, platform):
         m = Module()
 
-        interval_cnt = Signal(range(self.interval + 1))
-        byte_cnt = Signal(range(self.threshold + 1))
+        reported = Signal(32)
+        delta = Signal(32)
+        idx = Signal(range(5))
+        in_packet = Signal()
+
+        with m.FSM() as fsm:
+            with m.State('PASS'):
+                # Between packets, report any new loss before passing on the next packet.
+                with m.If(~in_packet & (self.lost != reported)):
+                    m.d.sync += [
+                        delta.eq(self.lost - reported),
+                        reported.eq(self.lost),
+                        idx.eq(0),
+                    ]
+                    m.next = 'REPORT'
+
+                with m.Else():
+                    wiring.connect(m, wiring.flipped(self.input), wiring.flipped(self.output))
+
+                    with m.If(self.input.valid & self.input.ready):
+                        m.d.sync += in_packet.eq(~self.input.payload.last)
+
+            with m.State('REPORT'):
+                # Channel 0 is never forwarded from TPIU, so it carries [0x00, lost bytes as 32-bit little endian].
+                m.d.comb += [
+                    self.output.valid.eq(1),
+                    self.output.payload.data.eq(Cat(C(0, 8), delta).word_select(idx, 8)),
+                    self.output.payload.last.eq(idx == 4),
+                ]
+
+                with m.If(self.output.ready):
+                    m.d.sync += idx.eq(idx + 1)
+
+                    with m.If(idx == 4):
+                        m.next = 'PASS'
+
+        return m
+
+class SuperFramer(wiring.Component):
+    def __init__(self, interval, threshold, shape = Packet(has_last = True), idle = 75_000):
+        super().__init__({
+            'input': wiring.In(stream.Signature(shape)),
+            'output': wiring.Out(stream.Signature(shape)),
+
+            'interval': wiring.In(32, init = interval),
+            'threshold': wiring.In(32, init = threshold),
+            'idle': wiring.In(32, init = idle),
+
+            'downstream_empty': wiring.In(1, init = 1),
+        })
+
+    def elaborate(self, platform):
+        m = Module()
+
+        interval_cnt = Signal(32)
+        byte_cnt = Signal(32)
+        idle_cnt = Signal(32)
 
         flush = Signal()
 
-        data = Signal(8)
-        last = Signal()
+        payload = Signal.like(self.input.payload)
         valid = Signal()
 
         m.d.comb += [
             self.input.ready.eq(~valid | (self.output.ready & self.output.valid)),
 
-            self.output.payload.data.eq(data),
-            self.output.payload.last.eq(last & flush),
+            self.output.payload.eq(payload),
+            self.output.payload.last.eq(payload.last & flush),
             self.output.valid.eq(valid & (self.input.valid | flush)),
         ]
 
+        # Flush early when the input goes quiet at a packet boundary and the host has caught up,
+        # so low rate traffic isn't held back for the whole interval. While there's a backlog
+        # downstream, keep building the transfer since flushing wouldn't get data out any sooner.
+        with m.If(self.input.valid):
+            m.d.sync += idle_cnt.eq(0)
+        with m.Elif(valid & (idle_cnt < self.idle)):
+            m.d.sync += idle_cnt.eq(idle_cnt + 1)
+
+        with m.If(valid & payload.last & (idle_cnt >= self.idle) & self.downstream_empty):
+            m.d.sync += flush.eq(1)
+
         with m.If(self.output.ready & self.output.valid):
             m.d.sync += [
                 valid.eq(0),
             ]
 
-            with m.If(last & flush):
+            with m.If(payload.last & flush):
                 m.d.sync += flush.eq(0)
 
             with m.If(byte_cnt < self.threshold):
@@ -81,15 +159,14 @@ class SuperFramer(wiring.Component):
 
         with m.If(self.input.ready & self.input.valid):
             m.d.sync += [
-                data.eq(self.input.payload.data),
-                last.eq(self.input.payload.last),
+                payload.eq(self.input.payload),
                 valid.eq(1),
             ]
 
         with m.If(valid & (interval_cnt < self.interval)):
             m.d.sync += interval_cnt.eq(interval_cnt + 1)
 
-        with m.If(interval_cnt == self.interval):
+        with m.If(interval_cnt >= self.interval):
             m.d.sync += [
                 byte_cnt.eq(0),
                 interval_cnt.eq(0),
@@ -99,3 +176,176 @@ class SuperFramer(wiring.Component):
                 m.d.sync += flush.eq(1)
 
         return m
+
+class Trigger(wiring.Component):
+    def __init__(self, history = 4096):
+        super().__init__({
+            'input': wiring.In(stream.Signature(Packet(has_last = True))),
+            'output': wiring.Out(stream.Signature(Packet(has_last = True))),
+
+            'config': wiring.In(TriggerConfig),
+
+            'triggered': wiring.Out(1),
+        })
+
+        self.history = history
+
+    def elaborate(self, platform):
+        m = Module()
+
+        # Pre-trigger history; once full, the oldest packets are discarded.
+        m.submodules.fifo = fifo = SyncFIFOBuffered(Packet(has_last = True), self.history)
+
+        write = self.input.valid & self.input.ready
+        read = fifo.output.valid & fifo.output.ready
+
+        # Bytes in the FIFO that are cleared for output. Releases always end at a packet boundary.
+        released = Signal(range(self.history + 2))
+        release_level = Signal()
+        release_write = Signal()
+        discarding = Signal()
+
+        in_packet = Signal()
+        channel = Signal(7)
+        skip = Signal(3)
+        window = Signal(32)
+        window_valid = Signal(4)
+
+        window_next = Cat(window[8:], self.input.payload.data)
+        window_valid_next = Cat(window_valid[1:], C(1, 1))
+        is_data = in_packet & (skip == 0)
+
+        def match(ch, pattern, mask):
+            return (is_data & (channel == ch) &
+                (((window_next ^ pattern) & mask) == 0) &
+                Cat((window_valid_next[i] | (mask.word_select(i, 8) == 0)) for i in range(4)).all())
+
+        start_match = match(self.config.start_channel, self.config.start_pattern, self.config.start_mask)
+        stop_match = match(self.config.stop_channel, self.config.stop_pattern, self.config.stop_mask) | (self.config.stop_mask == 0)
+
+        post_cnt = Signal(32)
+        post_done = post_cnt >= self.config.post
+
+        config = Signal(TriggerConfig)
+        restart = Signal()
+
+        m.d.comb += [
+            self.input.ready.eq(fifo.input.ready),
+            fifo.input.valid.eq(self.input.valid),
+            fifo.input.payload.eq(self.input.payload),
+
+            self.output.payload.eq(fifo.output.payload),
+        ]
+
+        with m.If(discarding):
+            m.d.comb += fifo.output.ready.eq(1)
+        with m.Else():
+            m.d.comb += [
+                self.output.valid.eq(fifo.output.valid & (released != 0)),
+                fifo.output.ready.eq(self.output.ready & (released != 0)),
+            ]
+
+        # Releasing the level covers everything in the FIFO, including bytes that were already released.
+        m.d.sync += released.eq(Mux(release_level, fifo.level, released)
+            + (write & (release_write | release_level) & ~(restart & self.config.enable))
+            - (read & (released != 0)))
+
+        with m.If(read & fifo.output.payload.last):
+            m.d.sync += discarding.eq(0)
+
+        # Restart when the configuration changes, at a packet boundary so nothing is cut short.
+        with m.If(self.config.as_value() != config.as_value()):
+            m.d.comb += restart.eq(~in_packet)
+
+        with m.If(restart):
+            m.d.sync += config.eq(self.config)
+
+        with m.If(write):
+            m.d.sync += in_packet.eq(~self.input.payload.last)
+
+            with m.If(~in_packet):
+                m.d.sync += [
+                    channel.eq(self.input.payload.data[:7]),
+                    # Only timestamps are flagged ahead of the compressor.
+                    skip.eq(Mux(self.input.payload.data[7], 5, 0)),
+                    window_valid.eq(0),
+                ]
+            with m.Elif(skip != 0):
+                m.d.sync += skip.eq(skip - 1)
+            with m.Else():
+                m.d.sync += [
+                    window.eq(window_next),
+                    window_valid.eq(window_valid_next),
+                ]
+
+        def handle_restart(capturing):
+            with m.If(restart):
+                with m.If(self.config.enable):
+                    m.next = 'ARMED'
+                with m.Else():
+                    m.next = 'PASS'
+
+                    # Release the history when switching to pass through.
+                    if not capturing:
+                        m.d.comb += release_level.eq(1)
+
+        with m.FSM():
+            with m.State('PASS'):
+                m.d.comb += release_write.eq(1)
+
+                with m.If(restart & self.config.enable):
+                    m.next = 'ARMED'
+
+            with m.State('ARMED'):
+                # Make room by dropping the oldest packet.
+                with m.If(~fifo.input.ready & (released == 0)):
+                    m.d.sync += discarding.eq(1)
+
+                with m.If(write & start_match):
+                    m.d.comb += [
+                        release_level.eq(1),
+                        release_write.eq(1),
+                    ]
+                    m.d.sync += post_cnt.eq(0)
+                    m.next = 'TRIGGERED'
+
+                    with m.If(stop_match):
+                        m.next = 'POST'
+
+                handle_restart(False)
+
+            with m.State('TRIGGERED'):
+                m.d.comb += [
+                    self.triggered.eq(1),
+                    release_write.eq(1),
+                ]
+
+                with m.If(write & stop_match):
+                    m.next = 'POST'
+
+                handle_restart(True)
+
+            with m.State('POST'):
+                m.d.comb += self.triggered.eq(1)
+
+                with m.If(post_done & ~in_packet):
+                    m.next = 'STOPPED'
+
+                    with m.If(self.config.rearm):
+                        m.next = 'ARMED'
+
+                with m.Else():
+                    m.d.comb += release_write.eq(1)
+
+                    with m.If(write):
+                        m.d.sync += post_cnt.eq(post_cnt + 1)
+
+                handle_restart(True)
+
+            with m.State('STOPPED'):
+                with m.If(~fifo.input.ready & (released == 0)):
+                    m.d.sync += discarding.eq(1)
+
+                handle_restart(False)
+
+        return m
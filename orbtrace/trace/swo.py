@@ -78,10 +78,19 @@ class ManchesterDecoder(wiring.Component):
     def elaborate(self, platform):
         m = Module()
 
-        short_threshold = Signal(16) # 3/4 bit time
-        long_threshold = Signal(16)  # 5/4 bit time
+        half_bit = Signal(20)        # Half bit time in 1/16 samples
+        short_threshold = Signal(21) # 3/4 bit time
+        long_threshold = Signal(22)  # 5/4 bit time
         edge_counter = Signal(8)     # Maximum number of edges before we force a reset (8 bytes, max 2 edges = 128 count)
 
+        count = Signal(20)
+
+        m.d.comb += [
+            count.eq(self.input.payload.count << 4),
+            short_threshold.eq(half_bit + (half_bit >> 1)),
+            long_threshold.eq((half_bit << 1) + (half_bit >> 1)),
+        ]
+
         with m.If(self.output.ready & self.output.valid):
             m.d.sync += [
                 self.output.payload.first.eq(0),
@@ -96,8 +105,8 @@ class ManchesterDecoder(wiring.Component):
         capture = Signal()
 
         m.d.comb += [
-            short.eq(self.input.payload.count <= short_threshold),
-            extra_long.eq(self.input.payload.count > long_threshold),
+            short.eq(count <= short_threshold),
+            extra_long.eq(count > long_threshold),
             long.eq(~short & ~extra_long),
             frame_reset.eq(edge_counter[-1]),
         ]
@@ -114,18 +123,14 @@ class ManchesterDecoder(wiring.Component):
                         edge_counter.eq(0),
                     ]
 
-                    # Icky fix to 'lock' 41.66MHz & 48MHz operation. This slides towards the
-                    # end of a bit at 48MHz but does work OK. It does _not_ work at 49MHz!!
+                    # The sync pulse gives the first estimate of the half bit time. Pulses of six samples
+                    # or less (above about 36MHz) are too coarse for that, so start from fixed thresholds
+                    # instead and leave it to the tracking below to converge on the line rate.
                     with m.If(self.input.payload.count > 6):
-                        m.d.sync += [
-                            short_threshold.eq(self.input.payload.count + (self.input.payload.count >> 1)),
-                            long_threshold.eq((self.input.payload.count << 1) + (self.input.payload.count >> 1)),
-                        ]
+                        m.d.sync += half_bit.eq(count)
                     with m.Else():
-                        m.d.sync += [
-                            short_threshold.eq(8),
-                            long_threshold.eq(14),
-                        ]
+                        # Thresholds of 8 and 14 samples.
+                        m.d.sync += half_bit.eq(90)
 
             with m.State('CENTER'):
                 m.d.comb += self.input.ready.eq(1)
@@ -162,6 +167,18 @@ class ManchesterDecoder(wiring.Component):
                 with m.If(frame_reset):
                     m.next = 'IDLE'
 
+        # Refine the half bit time from every half and full bit pulse in a frame, so the thresholds
+        # aren't limited by the quantization of the first pulse at high line rates.
+        error = Signal(signed(21))
+
+        with m.If(short):
+            m.d.comb += error.eq(count - half_bit)
+        with m.Else():
+            m.d.comb += error.eq((count >> 1) - half_bit)
+
+        with m.If(self.input.valid & ~extra_long & ~fsm.ongoing('IDLE')):
+            m.d.sync += half_bit.eq(half_bit + (error >> 3))
+
         with m.If(capture):
             m.d.comb += [
                 self.output.payload.data.eq(self.input.payload.level),
@@ -200,7 +217,7 @@ class NRZDecoder(wiring.Component):
     input: wiring.In(stream.Signature(PulseLength))
     output: wiring.Out(stream.Signature(1))
 
-    bitlen: wiring.In(16, init = 8000)
+    bitlen: wiring.In(20, init = 8000)
 
     def elaborate(self, platform):
         m = Module()
@@ -261,3 +278,72 @@ class UARTDecoder(wiring.Component):
             m.d.sync += sr.eq(0x200)
 
         return m
+
+class AutoBaud(wiring.Component):
+    input: wiring.In(stream.Signature(PulseLength))
+    bitlen: wiring.Out(20)
+    locked: wiring.Out(1)
+
+    def __init__(self, window = 256):
+        super().__init__()
+        self.window = window
+
+    def elaborate(self, platform):
+        m = Module()
+
+        count = self.input.payload.count
+
+        # Pulses shorter than two samples are glitches, and saturated counts are idle line.
+        usable = self.input.valid & (count >= 2) & ~count[-1]
+
+        min_count = Signal(16, init = 0xffff)
+        threshold = Signal(17)
+        pulse_cnt = Signal(range(self.window + 1))
+        acc = Signal(20)
+        acc_cnt = Signal(5)
+
+        m.d.comb += self.input.ready.eq(1)
+
+        with m.FSM() as fsm:
+            # Find the shortest pulse over a window; that's a single bit.
+            with m.State('MIN'):
+                with m.If(usable):
+                    m.d.sync += pulse_cnt.eq(pulse_cnt + 1)
+
+                    with m.If(count < min_count):
+                        m.d.sync += min_count.eq(count)
+
+                with m.If(pulse_cnt == self.window):
+                    m.d.sync += [
+                        pulse_cnt.eq(0),
+                        threshold.eq(min_count + (min_count >> 1)),
+                        acc.eq(0),
+                        acc_cnt.eq(0),
+                    ]
+                    m.next = 'SUM'
+
+            # Average 16 single bit pulses; bitlen is in 1/16 samples so the sum is the result.
+            with m.State('SUM'):
+                with m.If(usable):
+                    m.d.sync += pulse_cnt.eq(pulse_cnt + 1)
+
+                    with m.If(count <= threshold):
+                        m.d.sync += [
+                            acc.eq(acc + count),
+                            acc_cnt.eq(acc_cnt + 1),
+                        ]
+
+                with m.If(acc_cnt == 16):
+                    m.d.sync += [
+                        self.bitlen.eq(acc),
+                        self.locked.eq(1),
+                    ]
+
+                with m.If((acc_cnt == 16) | (pulse_cnt == self.window)):
+                    m.d.sync += [
+                        pulse_cnt.eq(0),
+                        min_count.eq(0xffff),
+                    ]
+                    m.next = 'MIN'
+
+        return m
@@ -10,39 +10,68 @@ TPIUUnmangledFrame = data.ArrayLayout(TPIUUnmangledByte, 15)
 
 MuxedByte = data.StructLayout({'data': 8, 'channel': 7})
 
+# Orbflow packets with bit 7 of the channel byte set have a byte of these flags following it.
+FLAG_TIMESTAMP = 0x01   # Followed by a 32-bit little endian timestamp.
+FLAG_COMPRESSED = 0x02  # The rest of the packet is compressed, see compress.py.
+
 class TPIUSync(wiring.Component):
     input: wiring.In(stream.Signature(8))
     output: wiring.Out(stream.Signature(TPIURawFrame))
     reset_sync: wiring.In(1)
+    sync_lost: wiring.Out(1)
 
     def elaborate(self, platform):
         m = Module()
 
+        # Frame is assembled in buf behind a marker bit and moved to frame once complete,
+        # so the next byte can be taken in the same cycle and input never stalls while
+        # the output keeps up.
         buf = Signal(129, init = 1)
+        frame = Signal(128)
+        frame_valid = Signal()
         synced = Signal()
 
+        full = buf[128]
+        can_move = ~frame_valid | self.output.ready
+
+        # What the next byte is shifted into; a full buffer is either moved out or, while unsynced, dropped.
+        base = Signal(129)
+
         m.d.comb += [
-            self.output.payload.eq(buf),
-            self.output.valid.eq(buf[128] & synced),
-            self.input.ready.eq(~self.output.valid),
+            self.output.valid.eq(frame_valid),
+            self.input.ready.eq(~full | can_move | ~synced),
+            base.eq(buf),
         ]
 
         for byte, bit in zip(range(16), reversed(range(0, 128, 8))):
-            m.d.comb += self.output.payload[byte].eq(buf[bit:bit + 8])
+            m.d.comb += self.output.payload[byte].eq(frame[bit:bit + 8])
 
         with m.If(self.output.valid & self.output.ready):
+            m.d.sync += frame_valid.eq(0)
+
+        with m.If(full & (can_move | ~synced)):
+            m.d.comb += base.eq(1)
             m.d.sync += buf.eq(1)
 
+            with m.If(synced):
+                m.d.sync += [
+                    frame.eq(buf[:128]),
+                    frame_valid.eq(1),
+                ]
+
         with m.If(self.input.valid & self.input.ready):
             with m.If(Cat(self.input.payload, buf)[:32] == 0xffffff7f):
+                # An aligned full sync has the frame marker right above the three 0xff bytes.
+                m.d.comb += self.sync_lost.eq(synced & (buf[24:] != 1))
                 m.d.sync += [
                     synced.eq(1),
                     buf.eq(1),
                 ]
-            with m.Elif(Cat(self.input.payload, buf)[:16] == 0xff7f):
+            # Half syncs are 16-bit aligned and never straddle a frame boundary.
+            with m.Elif(~full & (Cat(self.input.payload, buf)[:16] == 0xff7f)):
                 m.d.sync += buf.eq(buf[8:])
             with m.Else():
-                m.d.sync += buf.eq(Cat(self.input.payload, buf))
+                m.d.sync += buf.eq(Cat(self.input.payload, base))
 
         with m.If(self.reset_sync):
             m.d.sync += synced.eq(0)
@@ -105,41 +134,167 @@ class TrackStream(wiring.Component):
 
         return m
 
-class StripChannelZero(wiring.Component):
+class ChannelFilter(wiring.Component):
     input: wiring.In(stream.Signature(MuxedByte))
     output: wiring.Out(stream.Signature(MuxedByte))
 
+    # One enable bit per channel. Channel 0 is padding and always dropped.
+    mask: wiring.In(128, init = 2**128 - 1)
+
     def elaborate(self, platform):
         m = Module()
 
+        enabled = self.mask.bit_select(self.input.payload.channel, 1) & (self.input.payload.channel != 0)
+
         m.d.comb += [
-            self.input.ready.eq(self.output.ready),
-            self.output.valid.eq(self.input.valid & (self.input.payload.channel != 0)),
+            self.input.ready.eq(self.output.ready | ~enabled),
+            self.output.valid.eq(self.input.valid & enabled),
             self.output.payload.eq(self.input.payload),
         ]
 
         return m
 
-class Packetizer(wiring.Component):
+# Packet types that can be dropped, as bits of ITMFilterConfig.types.
+ITM_HARDWARE = 0
+ITM_LOCAL_TIMESTAMP = 1
+ITM_GLOBAL_TIMESTAMP = 2
+ITM_EXTENSION = 3
+ITM_OVERFLOW = 4
+ITM_SYNC = 5
+
+# Stimulus ports and packet types are enabled by their bit in ports and types.
+ITMFilterConfig = data.StructLayout({
+    'channel': 8,
+    'types': 8,
+    'reserved': 16,
+    'ports': 32,
+})
+
+itm_filter_default = {
+    'channel': 1,
+    'types': 0xff,
+    'ports': 0xffffffff,
+}
+
+class ITMFilter(wiring.Component):
     input: wiring.In(stream.Signature(MuxedByte))
-    output: wiring.Out(stream.Signature(Packet(has_last = True)))
+    output: wiring.Out(stream.Signature(MuxedByte))
+
+    config: wiring.In(ITMFilterConfig, init = itm_filter_default)
+
+    def elaborate(self, platform):
+        m = Module()
+
+        header = self.input.payload.data
+        is_itm = self.input.payload.channel == self.config.channel[:7]
+
+        # Payload bytes left of the current packet; variable length packets continue while bit 7 is set.
+        remaining = Signal(3)
+        cont = Signal()
+        keep_packet = Signal(init = 1)
+
+        keep = Signal()
+        length = Signal(3)
+        variable = Signal()
+        packet_type = Signal(range(8), init = 7)
+
+        size = header[:2]
+
+        with m.If(size != 0):
+            # Source packet with 1, 2 or 4 payload bytes; software sources are stimulus ports.
+            m.d.comb += length.eq(Mux(size == 3, 4, size))
+
+            with m.If(header[2]):
+                m.d.comb += packet_type.eq(ITM_HARDWARE)
+        with m.Elif((header == 0x00) | (header == 0x80)):
+            m.d.comb += packet_type.eq(ITM_SYNC)
+        with m.Elif(header == 0x70):
+            m.d.comb += packet_type.eq(ITM_OVERFLOW)
+        with m.Elif(header[:4] == 0b0000):
+            m.d.comb += [
+                packet_type.eq(ITM_LOCAL_TIMESTAMP),
+                variable.eq(header[7]),
+            ]
+        with m.Elif(header[:4] == 0b0100):
+            m.d.comb += [
+                packet_type.eq(ITM_GLOBAL_TIMESTAMP),
+                variable.eq(header[7]),
+            ]
+        with m.Elif((header[:2] == 0) & header[3]):
+            m.d.comb += [
+                packet_type.eq(ITM_EXTENSION),
+                variable.eq(header[7]),
+            ]
+
+        with m.If(~is_itm):
+            m.d.comb += keep.eq(1)
+        with m.Elif((remaining != 0) | cont):
+            m.d.comb += keep.eq(keep_packet)
+        with m.Elif((size != 0) & ~header[2]):
+            m.d.comb += keep.eq(self.config.ports.bit_select(header[3:], 1))
+        with m.Elif(packet_type == 7):
+            m.d.comb += keep.eq(1)
+        with m.Else():
+            m.d.comb += keep.eq(self.config.types.bit_select(packet_type, 1))
+
+        m.d.comb += [
+            self.input.ready.eq(self.output.ready | ~keep),
+            self.output.valid.eq(self.input.valid & keep),
+            self.output.payload.eq(self.input.payload),
+        ]
+
+        with m.If(self.input.valid & self.input.ready & is_itm):
+            with m.If(remaining != 0):
+                m.d.sync += remaining.eq(remaining - 1)
+            with m.Elif(cont):
+                m.d.sync += cont.eq(header[7])
+            with m.Else():
+                m.d.sync += [
+                    remaining.eq(length),
+                    cont.eq(variable),
+                    keep_packet.eq(keep),
+                ]
 
-    def __init__(self, timeout = 7_500_000):
-        super().__init__()
-        self.timeout = timeout
+        return m
+
+class Packetizer(wiring.Component):
+    # When timestamps are enabled, the channel byte has bit 7 set and is followed by FLAG_TIMESTAMP and a
+    # 32-bit little endian timestamp, latched when the first data byte of the packet is accepted.
+    def __init__(self, timeout = 7_500_000, max_size = 1024, max_size_limit = 16384):
+        super().__init__({
+            'input': wiring.In(stream.Signature(MuxedByte)),
+            'output': wiring.Out(stream.Signature(Packet(has_last = True))),
+
+            'timestamp': wiring.In(32),
+            'timestamp_enable': wiring.In(1),
+
+            'max_size': wiring.In(32, init = max_size),
+            'timeout': wiring.In(32, init = timeout),
+        })
+        self.max_size_limit = max_size_limit
 
     def elaborate(self, platform):
         m = Module()
 
-        max_size = 1024
+        max_size = Signal(range(1, self.max_size_limit + 1))
+
+        with m.If(self.max_size > self.max_size_limit):
+            m.d.comb += max_size.eq(self.max_size_limit)
+        with m.Elif(self.max_size == 0):
+            m.d.comb += max_size.eq(1)
+        with m.Else():
+            m.d.comb += max_size.eq(self.max_size)
 
         channel = Signal(7)
         data = Signal(8)
-        byte_cnt = Signal(range(max_size))
-        timeout_cnt = Signal(range(self.timeout + 1))
+        byte_cnt = Signal(range(self.max_size_limit))
+        timeout_cnt = Signal(32)
 
         start_new_packet = Signal()
 
+        timestamp = Signal(32)
+        timestamp_idx = Signal(2)
+
         m.d.comb += start_new_packet.eq(
             (self.input.valid & (self.input.payload.channel != channel)) |
             (byte_cnt >= max_size - 1) |
@@ -151,7 +306,7 @@ class Packetizer(wiring.Component):
         with m.FSM() as fsm:
             with m.State('HEADER'):
                 m.d.comb += [
-                    self.output.payload.data.eq(self.input.payload.channel),
+                    self.output.payload.data.eq(Cat(self.input.payload.channel, self.timestamp_enable)),
                     #self.output.payload.first.eq(1),
                     self.output.valid.eq(self.input.valid),
                     self.input.ready.eq(self.output.ready),
@@ -164,8 +319,34 @@ class Packetizer(wiring.Component):
                         byte_cnt.eq(0),
                         data.eq(self.input.payload.data),
                         timeout_cnt.eq(self.timeout),
+                        timestamp.eq(self.timestamp),
+                        timestamp_idx.eq(0),
                     ]
 
+                    with m.If(self.timestamp_enable):
+                        m.next = 'FLAGS'
+
+            with m.State('FLAGS'):
+                m.d.comb += [
+                    self.output.payload.data.eq(FLAG_TIMESTAMP),
+                    self.output.valid.eq(1),
+                ]
+
+                with m.If(self.output.ready):
+                    m.next = 'TIMESTAMP'
+
+            with m.State('TIMESTAMP'):
+                m.d.comb += [
+                    self.output.payload.data.eq(timestamp.word_select(timestamp_idx, 8)),
+                    self.output.valid.eq(1),
+                ]
+
+                with m.If(self.output.ready):
+                    m.d.sync += timestamp_idx.eq(timestamp_idx + 1)
+
+                    with m.If(timestamp_idx == 3):
+                        m.next = 'DATA'
+
             with m.State('DATA'):
                 m.d.comb += [
                     self.output.payload.data.eq(data),
@@ -199,15 +380,27 @@ class Packetizer(wiring.Component):
         return m
 
 class TPIUDemux(wiring.Component):
-    input: wiring.In(stream.Signature(TPIURawFrame))
-    input_bypass: wiring.In(stream.Signature(8))
-    output: wiring.Out(stream.Signature(Packet(has_last = True)))
-
-    bypass: wiring.In(1)
-
-    def __init__(self, timeout = 7_500_000):
-        super().__init__()
-        self.timeout = timeout
+    # Channels are offset by channel_offset on output, so several demuxes can share an orbflow stream.
+    # The mask is indexed by the channel before the offset is applied. Channels that would end up
+    # above 0x7f after the offset are dropped.
+    def __init__(self, timeout = 7_500_000, max_size = 1024, max_size_limit = 16384, channel_offset = 0):
+        super().__init__({
+            'input': wiring.In(stream.Signature(TPIURawFrame)),
+            'input_bypass': wiring.In(stream.Signature(8)),
+            'output': wiring.Out(stream.Signature(Packet(has_last = True))),
+
+            'bypass': wiring.In(1),
+            'channel_mask': wiring.In(128, init = 2**128 - 1),
+            'itm_filter': wiring.In(ITMFilterConfig, init = itm_filter_default),
+
+            'timestamp': wiring.In(32),
+            'timestamp_enable': wiring.In(1),
+
+            'max_size': wiring.In(32, init = max_size),
+            'timeout': wiring.In(32, init = timeout),
+        })
+        self.max_size_limit = max_size_limit
+        self.channel_offset = channel_offset
 
     def elaborate(self, platform):
         m = Module()
@@ -215,23 +408,41 @@ class TPIUDemux(wiring.Component):
         m.submodules.unmangle = unmangle = Unmangle()
         m.submodules.serializer = serializer = Serializer(TPIUUnmangledFrame)
         m.submodules.track_stream = track_stream = TrackStream()
-        m.submodules.strip_channel_zero = strip_channel_zero = StripChannelZero()
-        m.submodules.packetizer = packetizer = Packetizer(timeout = self.timeout)
+        m.submodules.channel_filter = channel_filter = ChannelFilter()
+        m.submodules.itm_filter = itm_filter = ITMFilter()
+        m.submodules.packetizer = packetizer = Packetizer(max_size_limit = self.max_size_limit)
 
         wiring.connect(m, wiring.flipped(self.input), unmangle.input)
         wiring.connect(m, unmangle.output, serializer.input)
         wiring.connect(m, serializer.output, track_stream.input)
-        wiring.connect(m, track_stream.output, strip_channel_zero.input)
+        wiring.connect(m, track_stream.output, channel_filter.input)
+
+        m.d.comb += channel_filter.mask.eq(self.channel_mask[:0x80 - self.channel_offset])
+        m.d.comb += itm_filter.config.eq(self.itm_filter)
+
+        m.d.comb += [
+            packetizer.timestamp.eq(self.timestamp),
+            packetizer.timestamp_enable.eq(self.timestamp_enable),
+            packetizer.max_size.eq(self.max_size),
+            packetizer.timeout.eq(self.timeout),
+        ]
 
         with m.If(self.bypass):
             m.d.comb += [
-                self.input_bypass.ready.eq(packetizer.input.ready),
-                packetizer.input.valid.eq(self.input_bypass.valid),
-                packetizer.input.payload.data.eq(self.input_bypass.payload),
-                packetizer.input.payload.channel.eq(1),
+                self.input_bypass.ready.eq(itm_filter.input.ready),
+                itm_filter.input.valid.eq(self.input_bypass.valid),
+                itm_filter.input.payload.data.eq(self.input_bypass.payload),
+                itm_filter.input.payload.channel.eq(1),
             ]
         with m.Else():
-            wiring.connect(m, strip_channel_zero.output, packetizer.input)
+            wiring.connect(m, channel_filter.output, itm_filter.input)
+
+        m.d.comb += [
+            itm_filter.output.ready.eq(packetizer.input.ready),
+            packetizer.input.valid.eq(itm_filter.output.valid),
+            packetizer.input.payload.data.eq(itm_filter.output.payload.data),
+            packetizer.input.payload.channel.eq(itm_filter.output.payload.channel + self.channel_offset),
+        ]
 
         wiring.connect(m, packetizer.output, wiring.flipped(self.output))
 
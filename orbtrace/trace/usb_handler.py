@@ -1,6 +1,10 @@
 from amaranth import *
 from usb_protocol.types import USBRequestType, USBStandardRequests, USBRequestRecipient
 from luna.gateware.usb.usb2.request import USBRequestHandler
+from luna.gateware.usb.stream import USBInStreamInterface
+from luna.gateware.stream.generator import StreamSerializer
+
+from .core import TraceStats, FramingConfig, framing_default, PacketizerConfig, packetizer_default, TriggerConfig, ITMFilterConfig, itm_filter_default
 
 class TraceUSBHandler(USBRequestHandler):
     def __init__(self, if_num, proxy_if_num):
@@ -11,18 +15,51 @@ class TraceUSBHandler(USBRequestHandler):
 
         self.input_format = Signal(8)
         self.input_format_strobe = Signal()
+        self.output_format = Signal(8)
         self.async_baudrate = Signal(32)
         self.async_baudrate_strobe = Signal()
+        self.channel_mask = Signal(128, init = 2**128 - 1)
+
+        self._channel_mask = Signal(128)
+
+        self.timestamp_enable = Signal()
+        self.compression_enable = Signal()
+
+        self.framing = Signal(FramingConfig, init = framing_default)
+        self._framing = Signal(FramingConfig.size)
+
+        self.packetizer = Signal(PacketizerConfig, init = packetizer_default)
+        self._packetizer = Signal(PacketizerConfig.size)
+
+        self.trigger = Signal(TriggerConfig)
+        self._trigger = Signal(TriggerConfig.size)
+
+        self.itm_filter = Signal(ITMFilterConfig, init = itm_filter_default)
+        self._itm_filter = Signal(ITMFilterConfig.size)
+
+        # Pulses when one of the registers above is written, so another domain can take the new values together.
+        self.register_strobe = Signal()
+
+        self.stats = Signal(TraceStats.size)
 
         self.idx = Signal(16)
 
         self.request_done = Signal()
 
     def handle_set_interface(self, m):
-        # TODO: Select trace output format based on self.interface.setup.value.
+        setup = self.interface.setup
+
+        # Alternate setting selects output format; 0 is orbflow and 1 is raw TPIU frames.
+        ok = setup.value < 2
+
+        with m.If(ok & (setup.index[:8] == self.if_num)):
+            m.d.usb += self.output_format.eq(setup.value)
 
         with m.If(self.interface.status_requested):
-            m.d.comb += self.send_zlp()
+            with m.If(ok):
+                m.d.comb += self.send_zlp()
+            with m.Else():
+                m.d.comb += self.interface.handshakes_out.stall.eq(1)
             m.d.comb += self.request_done.eq(1)
 
     def handle_set_input_format(self, m):
@@ -57,6 +94,66 @@ class TraceUSBHandler(USBRequestHandler):
             m.d.comb += self.send_zlp()
             m.d.comb += self.request_done.eq(1)
 
+    def handle_set_register(self, m, register, staging):
+        rx = self.interface.rx
+
+        # Only whole values are accepted.
+        ok = self.interface.setup.length == len(staging) // 8
+
+        # Collect the value over the current one and apply it in the status stage.
+        with m.If(rx.next & rx.valid):
+            m.d.usb += self.idx.eq(self.idx + 1)
+
+            with m.Switch(self.idx):
+                for i in range(len(staging) // 8):
+                    with m.Case(i):
+                        m.d.usb += staging.word_select(i, 8).eq(rx.payload)
+
+        with m.If(self.interface.rx_ready_for_response):
+            with m.If(ok):
+                m.d.comb += self.interface.handshakes_out.ack.eq(1)
+            with m.Else():
+                m.d.comb += self.interface.handshakes_out.stall.eq(1)
+                m.d.comb += self.request_done.eq(1)
+
+        with m.If(self.interface.status_requested):
+            with m.If(ok):
+                m.d.usb += register.eq(staging)
+                m.d.comb += self.register_strobe.eq(1)
+                m.d.comb += self.send_zlp()
+            with m.Else():
+                m.d.comb += self.interface.handshakes_out.stall.eq(1)
+            m.d.comb += self.request_done.eq(1)
+
+    def handle_set_timestamp_enable(self, m):
+        m.d.usb += self.timestamp_enable.eq(self.interface.setup.value != 0)
+
+        with m.If(self.interface.status_requested):
+            m.d.comb += self.send_zlp()
+            m.d.comb += self.request_done.eq(1)
+
+    def handle_set_compression_enable(self, m):
+        m.d.usb += self.compression_enable.eq(self.interface.setup.value != 0)
+
+        with m.If(self.interface.status_requested):
+            m.d.comb += self.send_zlp()
+            m.d.comb += self.request_done.eq(1)
+
+    def handle_get_stats(self, m):
+        setup = self.interface.setup
+
+        m.d.comb += [
+            self.transmitter.stream.attach(self.interface.tx),
+            self.transmitter.max_length.eq(setup.length),
+        ]
+
+        with m.If(self.interface.data_requested):
+            m.d.comb += self.transmitter.start.eq(1)
+
+        with m.If(self.interface.status_requested):
+            m.d.comb += self.interface.handshakes_out.ack.eq(1)
+            m.d.comb += self.request_done.eq(1)
+
     def handle_unhandled(self, m):
         interface = self.interface
 
@@ -80,6 +177,8 @@ class TraceUSBHandler(USBRequestHandler):
     def elaborate(self, platform):
         m = Module()
 
+        m.submodules.transmitter = self.transmitter = StreamSerializer(data_length = TraceStats.size // 8, domain = 'usb', stream_type = USBInStreamInterface, max_length_width = 16)
+
         setup = self.interface.setup
 
         m.d.comb += self.interface.claim.eq((setup.recipient == USBRequestRecipient.INTERFACE) & ((setup.index[:8] == self.if_num) | (setup.index[:8] == self.proxy_if_num)))
@@ -107,6 +206,53 @@ class TraceUSBHandler(USBRequestHandler):
                     with m.Switch(setup.request):
                         with m.Case(0x02):
                             m.next = 'SET_ASYNC_BAUDRATE'
+
+                with m.If(setup.type == USBRequestType.VENDOR):
+                    with m.Switch(setup.request):
+                        with m.Case(0x03):
+                            m.d.usb += self._channel_mask.eq(self.channel_mask)
+                            m.next = 'SET_CHANNEL_MASK'
+
+                with m.If(setup.type == USBRequestType.VENDOR):
+                    with m.Switch(setup.request):
+                        with m.Case(0x04):
+                            # Snapshot the counters so the response is consistent.
+                            m.d.usb += Cat(self.transmitter.data).eq(self.stats)
+                            m.next = 'GET_STATS'
+
+                with m.If(setup.type == USBRequestType.VENDOR):
+                    with m.Switch(setup.request):
+                        with m.Case(0x05):
+                            m.next = 'SET_TIMESTAMP_ENABLE'
+
+                with m.If(setup.type == USBRequestType.VENDOR):
+                    with m.Switch(setup.request):
+                        with m.Case(0x06):
+                            m.d.usb += self._framing.eq(self.framing)
+                            m.next = 'SET_FRAMING'
+
+                with m.If(setup.type == USBRequestType.VENDOR):
+                    with m.Switch(setup.request):
+                        with m.Case(0x07):
+                            m.d.usb += self._packetizer.eq(self.packetizer)
+                            m.next = 'SET_PACKETIZER'
+
+                with m.If(setup.type == USBRequestType.VENDOR):
+                    with m.Switch(setup.request):
+                        with m.Case(0x08):
+                            m.d.usb += self._trigger.eq(self.trigger)
+                            m.next = 'SET_TRIGGER'
+
+                with m.If(setup.type == USBRequestType.VENDOR):
+                    with m.Switch(setup.request):
+                        with m.Case(0x09):
+                            m.d.usb += self._itm_filter.eq(self.itm_filter)
+                            m.next = 'SET_ITM_FILTER'
+
+                with m.If(setup.type == USBRequestType.VENDOR):
+                    with m.Switch(setup.request):
+                        with m.Case(0x0a):
+                            m.next = 'SET_COMPRESSION_ENABLE'
             
             with m.State('SET_INTERFACE'):
                 self.handle_set_interface(m)
@@ -120,6 +266,38 @@ class TraceUSBHandler(USBRequestHandler):
                 self.handle_set_async_baudrate(m)
                 self.transition(m)
             
+            with m.State('SET_CHANNEL_MASK'):
+                self.handle_set_register(m, self.channel_mask, self._channel_mask)
+                self.transition(m)
+            
+            with m.State('GET_STATS'):
+                self.handle_get_stats(m)
+                self.transition(m)
+            
+            with m.State('SET_TIMESTAMP_ENABLE'):
+                self.handle_set_timestamp_enable(m)
+                self.transition(m)
+            
+            with m.State('SET_FRAMING'):
+                self.handle_set_register(m, self.framing, self._framing)
+                self.transition(m)
+            
+            with m.State('SET_PACKETIZER'):
+                self.handle_set_register(m, self.packetizer, self._packetizer)
+                self.transition(m)
+            
+            with m.State('SET_TRIGGER'):
+                self.handle_set_register(m, self.trigger, self._trigger)
+                self.transition(m)
+            
+            with m.State('SET_ITM_FILTER'):
+                self.handle_set_register(m, self.itm_filter, self._itm_filter)
+                self.transition(m)
+            
+            with m.State('SET_COMPRESSION_ENABLE'):
+                self.handle_set_compression_enable(m)
+                self.transition(m)
+            
             with m.State('UNHANDLED'):
                 self.handle_unhandled(m)
                 self.transition(m)
@@ -2,20 +2,21 @@ from amaranth import *
 from amaranth.lib import wiring, cdc
 
 class Monitor(wiring.Component):
-    total: wiring.Out(2)
-    lost: wiring.Out(2)
-    clk: wiring.Out(2)
-
-    def __init__(self, stream, cd):
-        super().__init__()
+    def __init__(self, stream, cd, width = 2):
+        super().__init__({
+            'total': wiring.Out(width),
+            'lost': wiring.Out(width),
+            'clk': wiring.Out(2),
+        })
         self._stream = stream
         self._cd = cd
+        self._width = width
 
     def elaborate(self, platform):
         m = Module()
 
-        total = Signal(2)
-        lost = Signal(2)
+        total = Signal(self._width)
+        lost = Signal(self._width)
         clk = Signal(2)
 
         with m.If(self._stream.valid):
@@ -26,11 +27,16 @@ class Monitor(wiring.Component):
 
         m.d[self._cd] += clk.eq(clk + 1)
 
-        m.submodules += [
-            cdc.FFSynchronizer(total, self.total),
-            cdc.FFSynchronizer(lost, self.lost),
-            cdc.FFSynchronizer(clk, self.clk),
-        ]
+        # Counters cross the clock domain gray coded, so a sample is never off by more than one count.
+        for i, (counter, output) in enumerate([(total, self.total), (lost, self.lost), (clk, self.clk)]):
+            gray = Signal.like(counter, name = f'gray_{i}')
+            gray_sync = Signal.like(counter, name = f'gray_sync_{i}')
+
+            m.d[self._cd] += gray.eq(counter ^ (counter >> 1))
+            m.submodules += cdc.FFSynchronizer(gray, gray_sync)
+
+            for bit in range(len(counter)):
+                m.d.comb += output[bit].eq(gray_sync[bit:].xor())
 
         return m
 
@@ -61,36 +67,57 @@ class Indicator(wiring.Component):
         return m
 
 class Divider(wiring.Component):
-    def __init__(self, num, den_bits, res_bits):
+    # Restoring divider producing one quotient bit per cycle.
+    # Results are available res_bits + 1 cycles after start, with done held until the next start.
+    # Quotients that don't fit in res saturate.
+    def __init__(self, num_bits, den_bits, res_bits):
         super().__init__({
-            'den': wiring.Out(den_bits),
-            'res': wiring.Out(res_bits),
+            'num': wiring.In(num_bits),
+            'den': wiring.In(den_bits),
             'start': wiring.In(1),
+            'res': wiring.Out(res_bits),
             'done': wiring.Out(1),
         })
-        self.num = num
+        self.num_bits = num_bits
         self.den_bits = den_bits
         self.res_bits = res_bits
 
     def elaborate(self, platform):
         m = Module()
 
-        acc = Signal(range(self.num + 1))
+        rem = Signal(self.num_bits)
+        den = Signal(self.den_bits + self.res_bits - 1)
+        quo = Signal(self.res_bits)
+        overflow = Signal()
+        remaining = Signal(range(self.res_bits + 1))
+
+        step = rem >= den
+        next_quo = Cat(step, quo[:-1])
 
         with m.If(self.start):
             m.d.sync += [
-                acc.eq(self.num),
-                self.res.eq(0),
+                rem.eq(self.num),
+                den.eq(self.den << (self.res_bits - 1)),
+                quo.eq(0),
+                overflow.eq((self.den == 0) | (self.num >= (self.den << self.res_bits))),
+                remaining.eq(self.res_bits),
                 self.done.eq(0),
             ]
 
-        with m.If(~self.done):
-            with m.If((acc >= self.den) & (self.res != (2**self.res_bits - 1))):
+        with m.Elif(remaining != 0):
+            m.d.sync += [
+                quo.eq(next_quo),
+                den.eq(den >> 1),
+                remaining.eq(remaining - 1),
+            ]
+
+            with m.If(step):
+                m.d.sync += rem.eq(rem - den)
+
+            with m.If(remaining == 1):
                 m.d.sync += [
-                    acc.eq(acc - self.den),
-                    self.res.eq(self.res + 1),
+                    self.res.eq(Mux(overflow, 2**self.res_bits - 1, next_quo)),
+                    self.done.eq(1),
                 ]
-            with m.Else():
-                m.d.sync += self.done.eq(1)
 
         return m
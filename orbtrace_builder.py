@@ -48,6 +48,14 @@ def main():
     parser_orbtrace.add_argument('--without-debug', action = 'store_false', dest = 'with_debug')
     parser_orbtrace.add_argument('--with-trace', action = 'store_true', help = 'Enable trace functionality')
     parser_orbtrace.add_argument('--without-trace', action = 'store_false', dest = 'with_trace')
+    parser_orbtrace.add_argument('--trace-byte-width', type = int, choices = [1, 2, 4], default = 1, help = 'Trace datapath width in bytes (default: 1)')
+    parser_orbtrace.add_argument('--with-trace-buffer', action = 'store_true', help = 'Enable trace buffer in external memory (requires --trace-byte-width 4)')
+    parser_orbtrace.add_argument('--trace-swo2x-fifo-depth', type = int, help = 'SWO pulse length FIFO depth in entries (default: 8)')
+    parser_orbtrace.add_argument('--trace-swo-fifo-depth', type = int, help = 'SWO byte FIFO depth in bytes (default: 16)')
+    parser_orbtrace.add_argument('--trace-input-fifo-depth', type = int, help = 'Parallel trace FIFO depth in frames (default: 16)')
+    parser_orbtrace.add_argument('--trace-demux-fifo-depth', type = int, help = 'Demux packet FIFO depth in bytes (default: 2048)')
+    parser_orbtrace.add_argument('--trace-history-depth', type = int, help = 'Trigger history depth in bytes (default: 4096)')
+    parser_orbtrace.add_argument('--trace-output-fifo-depth', type = int, help = 'Output FIFO depth in bytes (default: 8192)')
     parser_orbtrace.add_argument('--with-target-power', action = 'store_true', help = 'Enable target power control')
     parser_orbtrace.add_argument('--without-target-power', action = 'store_false', dest = 'with_target_power')
     parser_orbtrace.add_argument('--with-dfu', choices = ['bootloader', 'runtime'], help = 'Enable DFU support')
@@ -75,6 +83,17 @@ def main():
     if not args.soc_csv:
         args.soc_csv = Path(args.output_dir) / 'gateware' / 'csr.csv'
 
+    trace_fifo_depths = {
+        name: depth for name, depth in [
+            ('swo2x', args.trace_swo2x_fifo_depth),
+            ('swo', args.trace_swo_fifo_depth),
+            ('trace', args.trace_input_fifo_depth),
+            ('demux', args.trace_demux_fifo_depth),
+            ('trigger', args.trace_history_depth),
+            ('output', args.trace_output_fifo_depth),
+        ] if depth is not None
+    }
+
     soc = OrbSoC(
         platform = platform,
         sys_clk_freq  = int(float(args.sys_clk_freq)),
@@ -88,9 +107,18 @@ def main():
         usb_pid = args.usb_pid,
         led_default = args.led_default,
         bootloader_auto_reset = args.bootloader_auto_reset,
+        trace_byte_width = args.trace_byte_width,
+        with_trace_buffer = args.with_trace_buffer,
+        trace_fifo_depths = trace_fifo_depths,
         **soc_core_argdict(args)
     )
 
+    if args.with_trace:
+        print('Trace FIFOs (EBR usage is an estimate):')
+        for name, width, depth, ebr in soc.trace.fifo_usage:
+            print(f'  {name:<10} {width:>4} bits x {depth:>6}  {ebr:>3} EBR')
+        print(f'  {"total":<29}  {sum(ebr for *_, ebr in soc.trace.fifo_usage):>3} EBR')
+
     builder = Builder(soc, **builder_argdict(args))
 
     builder.add_software_package('liblitehyperbus', str(Path('liblitehyperbus').absolute()))
@@ -21,6 +21,20 @@ input_formats = {
     'nrz_tpiu': 0x13,
 }
 
+# Parallel and SWO captured concurrently, e.g. '4+manchester'.
+for _p in ['1', '2', '4']:
+    for _s in ['manchester', 'manchester_tpiu', 'nrz', 'nrz_tpiu']:
+        input_formats[f'{_p}+{_s}'] = 0x40 | (input_formats[_s] & 0x03) << 2 | input_formats[_p]
+
+itm_types = {
+    'hardware': 0,
+    'local_timestamp': 1,
+    'global_timestamp': 2,
+    'extension': 3,
+    'overflow': 4,
+    'sync': 5,
+}
+
 parser = argparse.ArgumentParser()
 
 parser_discovery = parser.add_argument_group('Device discovery')
@@ -30,7 +44,16 @@ parser_discovery.add_argument('--serial', help = 'Select serial number')
 
 parser_actions = parser.add_argument_group('Actions')
 parser_actions.add_argument('--input-format', choices = input_formats, help = 'Set trace input format')
-parser_actions.add_argument('--async-baudrate', type = int, help = 'Set async baudrate')
+parser_actions.add_argument('--async-baudrate', type = int, help = 'Set async baudrate (0 for auto)')
+parser_actions.add_argument('--channels', type = lambda x: [int(c, 0) for c in x.split(',')], help = 'Set enabled TPIU channels (comma separated)')
+parser_actions.add_argument('--timestamps', choices = ['off', 'on'], help = 'Enable hardware timestamps')
+parser_actions.add_argument('--compression', choices = ['off', 'on'], help = 'Enable orbflow compression')
+parser_actions.add_argument('--framing', type = lambda x: [int(v, 0) for v in x.split(',')], metavar = 'INTERVAL,THRESHOLD,IDLE', help = 'Set transfer framing')
+parser_actions.add_argument('--packetizer', type = lambda x: [int(v, 0) for v in x.split(',')], metavar = 'MAX_SIZE,TIMEOUT', help = 'Set packet framing')
+parser_actions.add_argument('--trigger', type = lambda x: [] if x == 'off' else [int(v, 0) for v in x.split(',')], metavar = 'START_CHANNEL,START_PATTERN,START_MASK,STOP_CHANNEL,STOP_PATTERN,STOP_MASK,POST[,REARM]', help = 'Set capture trigger (off to disable)')
+parser_actions.add_argument('--itm-ports', type = lambda x: [int(c, 0) for c in x.split(',')], help = 'Set enabled ITM stimulus ports (comma separated)')
+parser_actions.add_argument('--itm-types', type = lambda x: [itm_types[t] for t in x.split(',')], help = f'Set enabled ITM packet types (comma separated, from {",".join(itm_types)})')
+parser_actions.add_argument('--stats', action = 'store_true', help = 'Show trace statistics')
 parser_actions.add_argument('--vtref', type = parse_power, help = 'Set VTREF')
 parser_actions.add_argument('--vtpwr', type = parse_power, help = 'Set VTPWR')
 
@@ -79,6 +102,87 @@ class Orbtrace:
 
         self.handle.controlWrite(0x41, 0x02, 0, if_num, baudrate.to_bytes(4, 'little'))
 
+    def trace_set_channel_mask(self, channels, use_proxy = False):
+        if_num = self.proxy_if if use_proxy else self.trace_if
+        assert if_num is not None
+
+        mask = sum(1 << c for c in channels)
+
+        self.handle.controlWrite(0x41, 0x03, 0, if_num, mask.to_bytes(16, 'little'))
+
+    def trace_set_timestamp_enable(self, enable, use_proxy = False):
+        if_num = self.proxy_if if use_proxy else self.trace_if
+        assert if_num is not None
+
+        self.handle.controlWrite(0x41, 0x05, enable, if_num, b'')
+
+    def trace_set_compression_enable(self, enable, use_proxy = False):
+        if_num = self.proxy_if if use_proxy else self.trace_if
+        assert if_num is not None
+
+        self.handle.controlWrite(0x41, 0x0a, enable, if_num, b'')
+
+    def trace_set_framing(self, interval, threshold, idle, use_proxy = False):
+        if_num = self.proxy_if if use_proxy else self.trace_if
+        assert if_num is not None
+
+        data = b''.join(v.to_bytes(4, 'little') for v in [interval, threshold, idle])
+
+        self.handle.controlWrite(0x41, 0x06, 0, if_num, data)
+
+    def trace_set_packetizer(self, max_size, timeout, use_proxy = False):
+        if_num = self.proxy_if if use_proxy else self.trace_if
+        assert if_num is not None
+
+        data = b''.join(v.to_bytes(4, 'little') for v in [max_size, timeout])
+
+        self.handle.controlWrite(0x41, 0x07, 0, if_num, data)
+
+    def trace_set_trigger(self, start_channel = 0, start_pattern = 0, start_mask = 0, stop_channel = 0, stop_pattern = 0, stop_mask = 0, post = 0, rearm = False, enable = True, use_proxy = False):
+        if_num = self.proxy_if if use_proxy else self.trace_if
+        assert if_num is not None
+
+        data = bytes([enable | rearm << 1, 0, start_channel, stop_channel])
+        data += b''.join(v.to_bytes(4, 'little') for v in [start_pattern, start_mask, stop_pattern, stop_mask, post])
+
+        self.handle.controlWrite(0x41, 0x08, 0, if_num, data)
+
+    def trace_set_itm_filter(self, ports = range(32), types = range(8), channel = 1, use_proxy = False):
+        if_num = self.proxy_if if use_proxy else self.trace_if
+        assert if_num is not None
+
+        data = bytes([channel, sum(1 << t for t in types), 0, 0])
+        data += sum(1 << p for p in ports).to_bytes(4, 'little')
+
+        self.handle.controlWrite(0x41, 0x09, 0, if_num, data)
+
+    def trace_get_stats(self, use_proxy = False):
+        if_num = self.proxy_if if use_proxy else self.trace_if
+        assert if_num is not None
+
+        data = self.handle.controlRead(0xc1, 0x04, 0, if_num, 44)
+
+        fields = [
+            ('trace_frames', 4),
+            ('trace_frames_lost', 4),
+            ('swo_bytes', 4),
+            ('swo_bytes_lost', 4),
+            ('sync_losses', 4),
+            ('packets', 4),
+            ('output_bytes', 8),
+            ('fifo_max_level', 4),
+            ('fifo_depth', 4),
+            ('async_bitlen', 4),
+        ]
+
+        stats = {}
+        offset = 0
+        for name, size in fields:
+            stats[name] = int.from_bytes(data[offset:offset + size], 'little')
+            offset += size
+
+        return stats
+
     def power_set_enable(self, channel, enable):
         assert self.power_if is not None
 
@@ -122,9 +226,43 @@ with usb1.USBContext() as context:
     if args.input_format:
         orbtrace.trace_set_input_format(args.input_format, args.proxy)
 
-    if args.async_baudrate:
+    if args.async_baudrate is not None:
         orbtrace.trace_set_async_baudrate(args.async_baudrate, args.proxy)
 
+    if args.channels:
+        orbtrace.trace_set_channel_mask(args.channels, args.proxy)
+
+    if args.timestamps:
+        orbtrace.trace_set_timestamp_enable(args.timestamps == 'on', args.proxy)
+
+    if args.compression:
+        orbtrace.trace_set_compression_enable(args.compression == 'on', args.proxy)
+
+    if args.framing:
+        orbtrace.trace_set_framing(*args.framing, use_proxy = args.proxy)
+
+    if args.packetizer:
+        orbtrace.trace_set_packetizer(*args.packetizer, use_proxy = args.proxy)
+
+    if args.trigger is not None:
+        orbtrace.trace_set_trigger(*args.trigger, enable = bool(args.trigger), use_proxy = args.proxy)
+
+    if args.itm_ports is not None or args.itm_types is not None:
+        orbtrace.trace_set_itm_filter(
+            ports = args.itm_ports if args.itm_ports is not None else range(32),
+            types = args.itm_types if args.itm_types is not None else range(8),
+            use_proxy = args.proxy,
+        )
+
+    if args.stats:
+        stats = orbtrace.trace_get_stats(args.proxy)
+
+        for name, value in stats.items():
+            print(f'{name}: {value}')
+
+        if stats['async_bitlen']:
+            print(f'async_baudrate: {8_000_000_000 // stats["async_bitlen"]}')
+
     if args.vtref:
         if args.vtref in ['off', 'on']:
             orbtrace.power_set_enable(0, args.vtref == 'on')
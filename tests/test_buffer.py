@@ -0,0 +1,104 @@
+from migen import *
+from migen.sim import run_simulation
+
+from orbtrace.trace.buffer import TraceBuffer
+
+BURST_LEN = 4
+RECORD_LEN = BURST_LEN + 1
+BASE = 0x1000
+
+# 64 bytes hold three records of four words and their flags.
+RECORDS = 3
+
+def run(words, stall, interval = 2):
+    dut = TraceBuffer(BASE, 64, fifo_depth = 4, burst_len = BURST_LEN)
+
+    memory = {}
+    writes = []
+    received = []
+    levels = []
+    max_level = []
+
+    def producer():
+        for data, last in words:
+            yield dut.sink.valid.eq(1)
+            yield dut.sink.data.eq(data)
+            yield dut.sink.last.eq(last)
+            yield
+            while not (yield dut.sink.ready):
+                yield
+        yield dut.sink.valid.eq(0)
+
+    def consumer():
+        for i in range(10_000):
+            # Stalled for a while, then accepting every interval cycles.
+            ready = i >= stall and i % interval == 0
+            yield dut.source.ready.eq(ready)
+            yield
+
+            if ready and (yield dut.source.valid):
+                received.append(((yield dut.source.data), (yield dut.source.last)))
+
+            levels.append((yield dut.level.status))
+
+            if len(received) == len(words):
+                break
+
+        yield
+        max_level.append((yield dut.max_level.status))
+        levels.append((yield dut.level.status))
+
+    @passive
+    def memory_model():
+        while True:
+            yield dut.bus.ack.eq(0)
+            yield
+
+            if (yield dut.bus.cyc) and (yield dut.bus.stb):
+                adr = yield dut.bus.adr
+
+                if (yield dut.bus.we):
+                    memory[adr] = yield dut.bus.dat_w
+                    writes.append(adr)
+                else:
+                    yield dut.bus.dat_r.eq(memory[adr])
+
+                yield dut.bus.ack.eq(1)
+                yield
+
+    run_simulation(dut, [producer(), consumer(), memory_model()])
+
+    return received, writes, levels, max_level[0]
+
+def packets(n, packet_len):
+    return [(0x10000 + i, int(i % packet_len == packet_len - 1)) for i in range(n)]
+
+def test_pass_through():
+    words = packets(40, 3)
+    received, writes, levels, max_level = run(words, stall = 0, interval = 1)
+
+    assert received == words
+    assert writes == []
+    assert max(levels) == 0
+    assert max_level == 0
+
+def test_spill():
+    # Packet ends fall in the middle of records.
+    words = packets(120, 3)
+    received, writes, levels, max_level = run(words, stall = 400)
+
+    assert received == words
+
+    # Records are written whole, in bursts, and the ring wraps around.
+    assert len(writes) % RECORD_LEN == 0
+    assert len(writes) > RECORDS * RECORD_LEN
+    assert set(writes) == set(range(BASE // 4, BASE // 4 + RECORDS * RECORD_LEN))
+
+    for i in range(0, len(writes), RECORD_LEN):
+        record = writes[i:i + RECORD_LEN]
+        assert record == list(range(record[0], record[0] + RECORD_LEN))
+
+    # The buffer fills up while the output is stalled and is drained in the end.
+    assert max(levels) == RECORDS * BURST_LEN
+    assert max_level == RECORDS * BURST_LEN
+    assert levels[-1] == 0
@@ -0,0 +1,290 @@
+import pytest
+
+from types import SimpleNamespace
+
+import migen
+
+from amaranth import *
+from amaranth.lib import fifo
+from amaranth.sim import Simulator, SimulatorContext
+
+from luna.gateware.stream import StreamInterface
+
+from orbtrace.debug import cmsis_dap, dbgIF_wrapper
+
+# Stands in for the LiteX wrapper, and the migen dbgIF, which sit between the two.
+class Wrapper:
+    def from_migen(self, migen_sig):
+        return Signal(Shape(migen_sig.nbits, migen_sig.signed))
+
+def dbgif_signals():
+    return SimpleNamespace(
+        addr32  = migen.Signal(2),
+        rnw     = migen.Signal(),
+        apndp   = migen.Signal(),
+        dwrite  = migen.Signal(32),
+        dread   = migen.Signal(32),
+        perr    = migen.Signal(),
+        go      = migen.Signal(),
+        done    = migen.Signal(),
+        ack     = migen.Signal(3),
+        pinsin  = migen.Signal(16),
+        pinsout = migen.Signal(8),
+        command = migen.Signal(5),
+        dev     = migen.Signal(3),
+        is_jtag = migen.Signal(),
+    )
+
+# Stands in for the packet buffers in the SoC's stream CDC.
+def buffer(m, name, source, sink):
+    m.submodules[name] = _fifo = fifo.SyncFIFOBuffered(width = 10, depth = cmsis_dap.DAP_MAX_PACKET_COUNT * 512)
+
+    m.d.comb += [
+        _fifo.w_en.eq(source.valid),
+        _fifo.w_data.eq(Cat(source.payload, source.first, source.last)),
+        source.ready.eq(_fifo.w_rdy),
+
+        sink.valid.eq(_fifo.r_rdy),
+        Cat(sink.payload, sink.first, sink.last).eq(_fifo.r_data),
+        _fifo.r_en.eq(sink.ready),
+    ]
+
+class DUT(Elaboratable):
+    def __init__(self, buffered = False):
+        self.stream_in = StreamInterface()
+        self.stream_out = StreamInterface()
+        self.is_v2 = Signal(init = 1)
+        self.dbgif = dbgIF_wrapper.DBGIF(dbgif_signals(), Wrapper())
+        self.buffered = buffered
+
+        if buffered:
+            self.dap_in = StreamInterface()
+            self.dap_out = StreamInterface()
+        else:
+            self.dap_in = self.stream_in
+            self.dap_out = self.stream_out
+
+        self.dap = cmsis_dap.CMSIS_DAP(self.dap_in, self.dap_out, self.dbgif, self.is_v2)
+
+    def elaborate(self, platform):
+        m = Module()
+        m.domains.sync = ClockDomain()
+        m.domains.debug = ClockDomain()
+        m.submodules.dbgif = self.dbgif
+        m.submodules.dap = self.dap
+
+        if self.buffered:
+            buffer(m, 'out_buffer', self.stream_out, self.dap_out)
+            buffer(m, 'in_buffer', self.dap_in, self.stream_in)
+
+        return m
+
+def run(requests, v2 = True, latency = 4, acks = [], wait = True, buffered = False, max_cycles = 10_000):
+    dut = DUT(buffered)
+    responses = []
+    transactions = []
+    stalls = []
+    sent = []
+
+    sim = Simulator(dut)
+    sim.add_clock(1e-6)
+    sim.add_clock(0.7e-6, domain = 'debug')
+
+    @sim.add_testbench
+    async def host(ctx: SimulatorContext):
+        ctx.set(dut.is_v2, v2)
+        await ctx.tick()
+
+        for n, request in enumerate(requests):
+            ctx.set(dut.stream_out.valid, 1)
+            for i, b in enumerate(request):
+                ctx.set(dut.stream_out.payload, b)
+                ctx.set(dut.stream_out.first, i == 0)
+                ctx.set(dut.stream_out.last, i == len(request) - 1)
+                stalls.append(not ctx.get(dut.stream_out.ready))
+                await ctx.tick().until(dut.stream_out.ready == 1)
+            ctx.set(dut.stream_out.valid, 0)
+            sent.append(n)
+
+            # Wait for the response before sending the next request, unless queueing them
+            while wait and len(responses) <= n:
+                await ctx.tick()
+
+    @sim.add_testbench
+    async def host_in(ctx: SimulatorContext):
+        # Buffered responses are only read once all requests are in
+        while buffered and len(sent) < len(requests):
+            await ctx.tick()
+
+        ctx.set(dut.stream_in.ready, 1)
+
+        for _ in requests:
+            response = []
+            while len(response) < (1000 if v2 else 64):
+                payload, last = await ctx.tick().sample(dut.stream_in.payload, dut.stream_in.last).until(dut.stream_in.valid == 1)
+                response.append(payload)
+                if v2 and last:
+                    break
+            responses.append(bytes(response))
+
+    # Model of the dbgIF handshake. Transactions complete with the given acks then OK, reads
+    # return a running count.
+    @sim.add_process
+    async def dbgif(ctx: SimulatorContext):
+        reads = 0x11223344
+        pending_acks = list(acks)
+        ctx.set(dut.dbgif.dbg_done, 1)
+        ctx.set(dut.dbgif.dbg_pinsout, 0x5a)
+        while True:
+            transactions.append(await ctx.tick('debug').sample(dut.dbgif.dbg_command, dut.dbgif.dbg_rnw, dut.dbgif.dbg_dwrite).until(dut.dbgif.dbg_go == 1))
+            await ctx.tick('debug').repeat(2)
+            ctx.set(dut.dbgif.dbg_done, 0)
+            await ctx.tick('debug').until(dut.dbgif.dbg_go == 0)
+            await ctx.tick('debug').repeat(latency)
+            ctx.set(dut.dbgif.dbg_ack, pending_acks.pop(0) if pending_acks else cmsis_dap.ACK_OK)
+            ctx.set(dut.dbgif.dbg_dread, reads)
+            reads += 1
+            ctx.set(dut.dbgif.dbg_done, 1)
+
+    @sim.add_process
+    async def timeout(ctx: SimulatorContext):
+        await ctx.tick().repeat(max_cycles)
+        raise TimeoutError('Simulation timed out')
+
+    sim.run()
+
+    if buffered:
+        return responses, transactions, stalls
+
+    return responses, transactions
+
+def test_simple_commands():
+    responses, _ = run([
+        b'\x01\x00\x01',
+        b'\x02\x01',
+        b'\x05\x00\x02\x02\x06',
+        b'\x42',
+        b'\x00\xfe',
+        b'\x10\xff\xff\x00\xff\x02\x00',
+    ])
+
+    assert responses == [
+        b'\x01\x00',
+        b'\x02\x01',
+        b'\x05\x02\x01\x45\x33\x22\x11\x46\x33\x22\x11',
+        b'\xff',
+        bytes([0, 1, cmsis_dap.DAP_MAX_PACKET_COUNT]),
+        b'\x10\x5a',
+    ]
+
+@pytest.mark.parametrize('command', [cmsis_dap.DAP_ExecuteCommands, cmsis_dap.DAP_QueueCommands])
+def test_execute_commands(command):
+    responses, transactions = run([
+        bytes([command, 4]) + b'\x01\x00\x01' + b'\x02\x01' + b'\x05\x00\x01\x02' + b'\x1d\x01\x88',
+        bytes([command, 0]),
+        bytes([command, 2]) + b'\x03' + b'\x42\x00',
+        bytes([command, 2]) + b'\x03' + b'\x7f\x00',
+    ])
+
+    assert responses == [
+        b'\x7f\x04' + b'\x01\x00' + b'\x02\x01' + b'\x05\x01\x01\x45\x33\x22\x11' + b'\x1d\x00\xff',
+        b'\x7f\x00',
+        b'\x7f\x02' + b'\x03\x00' + b'\xff',
+        b'\x7f\x02' + b'\x03\x00' + b'\xff',
+    ]
+
+    assert len(transactions) == 2 + 16
+
+def test_execute_commands_v1():
+    responses, _ = run([
+        b'\x7f\x02\x01\x00\x01\x05\x00\x01\x02',
+        b'\x00\xf0',
+    ], v2 = False)
+
+    assert responses == [
+        b'\x7f\x02\x01\x00\x05\x01\x01\x44\x33\x22\x11'.ljust(64, b'\x00'),
+        b'\x00\x01\x13'.ljust(64, b'\x00'),
+    ]
+
+def test_transfer_block():
+    words = [0x01020304, 0xdeadbeef, 0xa5a5a5a5, 0x12345678]
+
+    responses, transactions = run([
+        b'\x06\x00\x04\x00\x04' + b''.join(w.to_bytes(4, 'little') for w in words),
+        b'\x06\x00\x03\x00\x06',
+    ])
+
+    assert responses == [
+        b'\x06\x04\x00\x01',
+        b'\x06\x03\x00\x01\x48\x33\x22\x11\x49\x33\x22\x11\x4a\x33\x22\x11',
+    ]
+
+    assert [(rnw, dwrite) for _, rnw, dwrite in transactions[:4]] == [(0, w) for w in words]
+
+def test_transfer_block_retry():
+    words = [0x01020304, 0xdeadbeef, 0xa5a5a5a5]
+    OK, WAIT, FAULT = cmsis_dap.ACK_OK, cmsis_dap.ACK_WAIT, cmsis_dap.ACK_ERROR
+
+    responses, transactions = run([
+        b'\x06\x00\x03\x00\x04' + b''.join(w.to_bytes(4, 'little') for w in words),
+        b'\x06\x00\x03\x00\x04' + b''.join(w.to_bytes(4, 'little') for w in words),
+        b'\x01\x00\x01',
+    ], acks = [OK, WAIT, OK, WAIT, WAIT, OK, OK, FAULT])
+
+    assert responses == [
+        b'\x06\x03\x00\x01',
+        b'\x06\x01\x00\x04',
+        b'\x01\x00',
+    ]
+
+    assert [dwrite for _, _, dwrite in transactions] == [words[0], words[1], words[1], words[2], words[2], words[2], words[0], words[1]]
+
+def test_transfer_block_fault_discards_queue():
+    OK, FAULT = cmsis_dap.ACK_OK, cmsis_dap.ACK_ERROR
+
+    responses, transactions = run([
+        b'\x06\x00\x06\x00\x06',
+        b'\x01\x00\x01',
+    ], acks = [OK, OK, OK, FAULT])
+
+    # Reads queued behind the fault never reach the debug interface
+    assert responses == [
+        b'\x06\x03\x00\x04\x44\x33\x22\x11\x45\x33\x22\x11\x46\x33\x22\x11',
+        b'\x01\x00',
+    ]
+
+    assert len(transactions) == 4
+
+def test_execute_commands_short_batch():
+    # A batch with too high a count doesn't take the next request as one of its commands
+    responses, _ = run([
+        bytes([cmsis_dap.DAP_ExecuteCommands, 3]) + b'\x01\x00\x01' + b'\x02\x01',
+        b'\x05\x00\x01\x02',
+    ], wait = False)
+
+    assert responses == [
+        b'\x7f\x03' + b'\x01\x00' + b'\x02\x01' + b'\xff',
+        b'\x05\x01\x01\x45\x33\x22\x11',
+    ]
+
+def test_queued_requests():
+    blocks = [[(0x10000 * n + i) * 0x01010101 & 0xffffffff for i in range(120)] for n in range(6)]
+
+    requests = [b'\x00\xfe']
+    requests += [b'\x06\x00\x78\x00\x04' + b''.join(w.to_bytes(4, 'little') for w in words) for words in blocks]
+    requests += [b'\x06\x00\x02\x00\x06', b'\x01\x00\x01']
+
+    assert len(requests) > cmsis_dap.DAP_MAX_PACKET_COUNT
+
+    responses, transactions, stalls = run(requests, wait = False, buffered = True, latency = 40, max_cycles = 100_000)
+
+    assert responses == [
+        bytes([0, 1, cmsis_dap.DAP_MAX_PACKET_COUNT]),
+        *[b'\x06\x78\x00\x01'] * len(blocks),
+        b'\x06\x02\x00\x01' + (0x11223344 + 720).to_bytes(4, 'little') + (0x11223345 + 720).to_bytes(4, 'little'),
+        b'\x01\x00',
+    ]
+
+    # Every word is written in order, with the host held off while the buffer is full
+    assert [dwrite for _, rnw, dwrite in transactions if not rnw] == sum(blocks, [])
+    assert any(stalls)
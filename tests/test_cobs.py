@@ -2,7 +2,7 @@ from sim_helpers import *
 
 from amaranth.sim import Simulator, SimulatorContext
 
-from orbtrace.trace.cobs import COBSEncoder
+from orbtrace.trace.cobs import COBSEncoder, WideCOBSEncoder
 from cobs.cobs import encode
 
 def test_cobs():
@@ -44,3 +44,74 @@ def test_cobs():
         raise TimeoutError('Simulation timed out')
 
     sim.run()
+
+def test_wide_cobs():
+    import random
+    rng = random.Random(0)
+
+    packets = [
+        [0],
+        [0, 0],
+        [0, 1, 0],
+        [1],
+        [1, 1],
+        [1, 0, 1],
+        [i & 0xff for i in range(0, 255)],
+        [i & 0xff for i in range(1, 255)],
+        [i & 0xff for i in range(1, 256)],
+        [i & 0xff for i in range(2, 257)],
+        [i & 0xff for i in range(3, 258)],
+        [1] * 254 + [0],
+        [1] * 254 + [2],
+        [1] * 600,
+        *([rng.choice([0, 0, 1, 2, 0xff]) for _ in range(rng.randint(1, 20))] for _ in range(50)),
+        *([rng.randint(0, 0xff) for _ in range(rng.randint(1, 600))] for _ in range(10)),
+    ]
+
+    lanes = 4
+    dut = WideCOBSEncoder(lanes)
+
+    sim = Simulator(dut)
+    sim.add_clock(1e-6)
+
+    @sim.add_testbench
+    async def input_testbench(ctx: SimulatorContext):
+        await ctx.tick()
+
+        for packet in packets:
+            words = [packet[i:i + lanes] for i in range(0, len(packet), lanes)]
+            for i, word in enumerate(words):
+                await stream_put(ctx, dut.input, {
+                    'data': word + [0] * (lanes - len(word)),
+                    'count': len(word),
+                    'last': i == len(words) - 1,
+                })
+
+            # Leave the input idle now and then to exercise the padding of partial words.
+            if rng.random() < 0.2:
+                await ctx.tick().repeat(10)
+
+    @sim.add_testbench
+    async def output_testbench(ctx: SimulatorContext):
+        received = b''
+        frame_count = 0
+
+        while frame_count < len(packets):
+            ctx.set(dut.output.ready, rng.random() < 0.8)
+            _, _, payload, valid, ready = await ctx.tick().sample(dut.output.payload, dut.output.valid, dut.output.ready)
+            if valid and ready:
+                for byte in payload.data:
+                    # Padding only ever follows a delimiter, so only count delimiters ending a frame.
+                    if byte == 0 and received and received[-1] != 0:
+                        frame_count += 1
+                    received += bytes([byte])
+
+        frames = [frame for frame in received.split(b'\0') if frame]
+        assert frames == [encode(bytes(packet)) for packet in packets]
+
+    @sim.add_process
+    async def timeout(ctx: SimulatorContext):
+        await ctx.tick().repeat(100_000)
+        raise TimeoutError('Simulation timed out')
+
+    sim.run()
@@ -0,0 +1,74 @@
+from sim_helpers import *
+
+import random
+
+from amaranth.sim import Simulator, SimulatorContext
+
+from orbtrace.trace.compress import Compressor, decompress, ESCAPE
+from orbtrace.trace.tpiu import FLAG_TIMESTAMP, FLAG_COMPRESSED
+
+def test_compressor():
+    rng = random.Random(0)
+
+    packets = [
+        [1, 2],
+        [1, *b'aaaaaaaaaaaaaaaaaaaaaaaaa'],
+        [1, *b'abababababababab'],
+        [2, ESCAPE, ESCAPE, ESCAPE, ESCAPE, ESCAPE, ESCAPE],
+        [2, *[0] * 1000],
+        [1, *[b for c in b'Hello, world!\n' * 10 for b in (0x01, c)]],
+        [3, *[b for _ in range(50) for b in (0x47, 0x10, 0x20, 0x30, 0x40)]],
+        [3, *[rng.choice([0, 1, 2, ESCAPE]) for _ in range(500)]],
+        [4, *[rng.randrange(256) for _ in range(500)]],
+        [0x81, FLAG_TIMESTAMP, 0x78, 0x56, 0x34, 0x12, *b'xyzxyzxyzxyzxyz'],
+    ]
+
+    # Sent with compression disabled, and still decoded as is.
+    uncompressed = [
+        [1, ESCAPE, 1, 2, ESCAPE, ESCAPE, 0],
+        [0x81, FLAG_TIMESTAMP, 0x78, 0x56, 0x34, ESCAPE, 3, 4],
+    ]
+
+    dut = Compressor()
+
+    sim = Simulator(dut)
+    sim.add_clock(1e-6)
+
+    @sim.add_testbench
+    async def input_testbench(ctx: SimulatorContext):
+        ctx.set(dut.enable, 1)
+        await ctx.tick()
+
+        for packet in packets:
+            await send_packet(ctx, dut.input, packet)
+
+        ctx.set(dut.enable, 0)
+
+        for packet in uncompressed:
+            await send_packet(ctx, dut.input, packet)
+
+    @sim.add_testbench
+    async def output_testbench(ctx: SimulatorContext):
+        for packet in packets:
+            compressed = await recv_packet(ctx, dut.output)
+            assert compressed[0] == packet[0] | 0x80
+            assert compressed[1] & FLAG_COMPRESSED
+            assert decompress(bytes(compressed)) == bytes(packet)
+
+            # Repetitive data shrinks, while random data only grows by its escapes.
+            if packet[1:3] in ([0, 0], [0x01, ord('H')], [0x47, 0x10]):
+                assert len(compressed) < len(packet) // 4
+            if packet[0] == 4:
+                assert len(compressed) == len(packet) + 1 + packet.count(ESCAPE)
+
+        for packet in uncompressed:
+            received = await recv_packet(ctx, dut.output)
+            assert received == packet
+            assert decompress(bytes(received)) == bytes(packet)
+
+    @sim.add_process
+    async def timeout(ctx: SimulatorContext):
+        await ctx.tick().repeat(100_000)
+        raise TimeoutError('Simulation timed out')
+
+    sim.run()
@@ -0,0 +1,152 @@
+from sim_helpers import *
+
+import random
+
+import pytest
+
+from amaranth.sim import Simulator, SimulatorContext
+
+from orbtrace.trace.core import TraceIF, TraceCore, ebr_estimate
+
+def word_bits(word, n = 16):
+    return [(word >> i) & 1 for i in range(n)]
+
+@pytest.mark.parametrize('width', [1, 2, 3])
+@pytest.mark.parametrize('edge', [0, 1])
+def test_traceif(width, edge):
+    dut = TraceIF()
+
+    sim = Simulator(dut)
+    sim.add_clock(1e-6)
+
+    bus = {1: 1, 2: 2, 3: 4}[width]
+
+    rng = random.Random(width)
+    frames = [bytes(rng.randrange(256) for _ in range(16)) for _ in range(6)]
+
+    # Starting half a clock in puts the sync on the falling edge.
+    bits = [0] * (8 * bus + edge * bus) + word_bits(0x7fffffff, 32)
+
+    for i, frame in enumerate(frames):
+        # Half syncs between frames are skipped.
+        if i % 2:
+            bits += word_bits(0x7fff)
+
+        # A partial frame followed by a new sync is dropped.
+        if i == 3:
+            bits += word_bits(0x1234) + word_bits(0x7fffffff, 32)
+
+        for j in range(0, 16, 2):
+            bits += word_bits(frame[j] | frame[j + 1] << 8)
+
+    bits += word_bits(0x7fff) * 4
+    bits += [0] * (-len(bits) % (2 * bus))
+
+    received = []
+
+    @sim.add_testbench
+    async def input_testbench(ctx: SimulatorContext):
+        ctx.set(dut.width, width)
+
+        for i in range(0, len(bits), 2 * bus):
+            ctx.set(dut.trace_a, sum(b << j for j, b in enumerate(bits[i:i + bus])))
+            ctx.set(dut.trace_b, sum(b << j for j, b in enumerate(bits[i + bus:i + 2 * bus])))
+            await ctx.tick()
+
+        await ctx.tick().repeat(4)
+
+        assert received == frames
+
+    @sim.add_process
+    async def output_process(ctx: SimulatorContext):
+        async for _, _, valid, payload in ctx.tick().sample(dut.output.valid, dut.output.payload):
+            if valid:
+                received.append(bytes(payload))
+
+    sim.run()
+
+def cobs_decode(frame):
+    res = bytearray()
+    i = 0
+
+    while i < len(frame):
+        code = frame[i]
+        res += frame[i + 1:i + code]
+        i += code
+
+        if code < 0xff and i < len(frame):
+            res.append(0)
+
+    return bytes(res)
+
+def test_trigger_max_size():
+    # A trigger history far smaller than the requested packet size.
+    dut = TraceCore(fifo_depths = {'trigger': 64})
+
+    sim = Simulator(dut)
+    for domain in ['sync', 'trace', 'swo', 'swo2x']:
+        sim.add_clock(1e-6, domain = domain)
+
+    # One long burst on channel 1, ending in the start pattern. Even bytes carry their LSB in the aux byte, so keep it clear.
+    payload = bytes([0x10 + 2 * (i % 8) for i in range(276)]) + bytes([0xde, 0xac, 0xbe, 0xee])
+    frames = [bytes([1 << 1 | 1, *payload[i:i + 14], 0]) for i in range(0, len(payload), 14)]
+
+    bits = word_bits(0x7fffffff, 32)
+
+    for frame in frames:
+        for j in range(0, 16, 2):
+            bits += word_bits(frame[j] | frame[j + 1] << 8)
+
+    output = bytearray()
+
+    @sim.add_process
+    async def input_process(ctx: SimulatorContext):
+        for i in range(0, len(bits), 8):
+            ctx.set(dut.trace_a, sum(b << j for j, b in enumerate(bits[i:i + 4])))
+            ctx.set(dut.trace_b, sum(b << j for j, b in enumerate(bits[i + 4:i + 8])))
+            await ctx.tick('trace')
+
+        # Half syncs while idle.
+        half_sync = word_bits(0x7fff)
+
+        while True:
+            for i in range(0, 16, 8):
+                ctx.set(dut.trace_a, sum(b << j for j, b in enumerate(half_sync[i:i + 4])))
+                ctx.set(dut.trace_b, sum(b << j for j, b in enumerate(half_sync[i + 4:i + 8])))
+                await ctx.tick('trace')
+
+    @sim.add_testbench
+    async def testbench(ctx: SimulatorContext):
+        ctx.set(dut.input_format, 0x03)
+        ctx.set(dut.packetizer, {'max_size': 1024, 'timeout': 200})
+        ctx.set(dut.trigger, {
+            'enable': 1,
+            'start_channel': 1,
+            'start_pattern': 0xeebeacde,
+            'start_mask': 0xffffffff,
+        })
+        ctx.set(dut.output.ready, 1)
+
+        for _ in range(2000):
+            await ctx.tick()
+
+            if ctx.get(dut.output.valid):
+                output.append(ctx.get(dut.output.payload.data))
+
+        packets = [cobs_decode(frame) for frame in output.split(b'\0') if frame]
+
+        # Packets are cut down to fit in the trigger history, so the one matching the start pattern is kept.
+        assert packets
+        assert all(len(packet) <= 64 for packet in packets)
+        assert packets[-1][0] == 1
+        assert packets[-1][-5:-1] == bytes([0xde, 0xac, 0xbe, 0xee])
+        assert payload.endswith(b''.join(packet[1:-1] for packet in packets))
+
+    sim.run()
+
+def test_ebr_estimate():
+    assert ebr_estimate(9, 32) == 0
+    assert ebr_estimate(9, 2048) == 1
+    assert ebr_estimate(9, 8192) == 4
+    assert ebr_estimate(33, 16384) == 32
+    assert ebr_estimate(128, 64) == 4
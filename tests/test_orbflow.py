@@ -0,0 +1,182 @@
+from sim_helpers import *
+
+from amaranth.sim import Simulator, SimulatorContext
+
+from orbtrace.trace import orbflow
+
+def test_loss_reporter():
+    dut = orbflow.LossReporter()
+
+    sim = Simulator(dut)
+    sim.add_clock(1e-6)
+
+    @sim.add_testbench
+    async def input_testbench(ctx: SimulatorContext):
+        await ctx.tick()
+
+        await send_packet(ctx, dut.input, [1, 2, 3])
+
+        ctx.set(dut.input.valid, 1)
+        ctx.set(dut.input.payload.data, 4)
+        ctx.set(dut.input.payload.last, 0)
+        await ctx.tick().until(dut.input.ready == 1)
+
+        # Loss in the middle of a packet is reported after it.
+        ctx.set(dut.lost, 0x1234)
+        await send_packet(ctx, dut.input, [5, 6])
+
+        await send_packet(ctx, dut.input, [7, 8])
+
+    @sim.add_testbench
+    async def output_testbench(ctx: SimulatorContext):
+        assert await recv_packet(ctx, dut.output) == [1, 2, 3]
+        assert await recv_packet(ctx, dut.output) == [4, 5, 6]
+        assert await recv_packet(ctx, dut.output) == [0, 0x34, 0x12, 0, 0]
+        assert await recv_packet(ctx, dut.output) == [7, 8]
+
+    @sim.add_process
+    async def timeout(ctx: SimulatorContext):
+        await ctx.tick().repeat(10_000)
+        raise TimeoutError('Simulation timed out')
+
+    sim.run()
+
+def test_superframer_idle_flush():
+    dut = orbflow.SuperFramer(5000, 1000, idle = 20)
+
+    sim = Simulator(dut)
+    sim.add_clock(1e-6)
+
+    cycles = [0]
+
+    @sim.add_testbench
+    async def input_testbench(ctx: SimulatorContext):
+        await ctx.tick()
+
+        await send_packet(ctx, dut.input, [1, 2, 3])
+        await send_packet(ctx, dut.input, [4, 5])
+        await ctx.tick().repeat(100)
+
+        # With a backlog downstream, only the interval flushes.
+        ctx.set(dut.downstream_empty, 0)
+        await send_packet(ctx, dut.input, [6, 7])
+
+    @sim.add_testbench
+    async def output_testbench(ctx: SimulatorContext):
+        assert await recv_packet(ctx, dut.output) == [1, 2, 3, 4, 5]
+        assert cycles[0] < 100
+
+        assert await recv_packet(ctx, dut.output) == [6, 7]
+        assert cycles[0] > 5000
+
+    @sim.add_process
+    async def counter(ctx: SimulatorContext):
+        async for _ in ctx.tick():
+            cycles[0] += 1
+
+    @sim.add_process
+    async def timeout(ctx: SimulatorContext):
+        await ctx.tick().repeat(10_000)
+        raise TimeoutError('Simulation timed out')
+
+    sim.run()
+
+def test_trigger():
+    dut = orbflow.Trigger(history = 32)
+
+    sim = Simulator(dut)
+    sim.add_clock(1e-6)
+
+    history = [[1, i, i + 1, i + 2] for i in range(0, 80, 4)]
+    start = [[2, 0x55, 0xaa], [1, 0x55, 0xaa, 0x60]]
+    post = [[1, 0x70, 0x71]]
+    stopped = [[2, 0x72], [1, 0x80]]
+
+    disabled = [False]
+
+    @sim.add_testbench
+    async def input_testbench(ctx: SimulatorContext):
+        ctx.set(dut.config, {
+            'enable': 1,
+            'start_channel': 1,
+            'start_pattern': 0xaa550000,
+            'start_mask': 0xffff0000,
+            'post': 3,
+        })
+        await ctx.tick()
+
+        for packet in history + start + post + stopped:
+            await send_packet(ctx, dut.input, packet)
+
+        await ctx.tick().repeat(100)
+
+        # Disabling passes everything through again.
+        disabled[0] = True
+        ctx.set(dut.config, {})
+        await send_packet(ctx, dut.input, [1, 0x90])
+
+    @sim.add_testbench
+    async def output_testbench(ctx: SimulatorContext):
+        # The most recent history that fits with the start of the trigger packet, and the post-trigger bytes
+        # rounded up to a packet. The pattern on channel 2 doesn't trigger.
+        for expected in history[-6:] + start + post:
+            assert await recv_packet(ctx, dut.output) == expected
+
+        # What was held back while stopped, once disabled.
+        for expected in stopped + [[1, 0x90]]:
+            assert await recv_packet(ctx, dut.output) == expected
+            assert disabled[0]
+
+    @sim.add_process
+    async def timeout(ctx: SimulatorContext):
+        await ctx.tick().repeat(10_000)
+        raise TimeoutError('Simulation timed out')
+
+    sim.run()
+
+def test_trigger_stalled():
+    dut = orbflow.Trigger(history = 32)
+
+    sim = Simulator(dut)
+    sim.add_clock(1e-6)
+
+    passed = [[1, 0x10], [1, 0x11], [1, 0x12]]
+    armed = [[1, 0x20], [1, 0xaa]]
+    stopped = [[1, 0x30], [1, 0x31], [1, 0x32], [1, 0x33]]
+
+    @sim.add_testbench
+    async def input_testbench(ctx: SimulatorContext):
+        await ctx.tick()
+
+        # Released while passing through, but still waiting for the output when the trigger is armed.
+        for packet in passed:
+            await send_packet(ctx, dut.input, packet)
+
+        ctx.set(dut.config, {
+            'enable': 1,
+            'start_channel': 1,
+            'start_pattern': 0xaa000000,
+            'start_mask': 0xff000000,
+        })
+
+        for packet in armed + stopped:
+            await send_packet(ctx, dut.input, packet)
+
+        await ctx.tick().repeat(10)
+
+        ctx.set(dut.output.ready, 1)
+        received = []
+
+        for _ in range(200):
+            if ctx.get(dut.output.valid):
+                received.append(ctx.get(dut.output.payload.data))
+            await ctx.tick()
+
+        assert received == sum(passed + armed, [])
+
+    @sim.add_process
+    async def timeout(ctx: SimulatorContext):
+        await ctx.tick().repeat(10_000)
+        raise TimeoutError('Simulation timed out')
+
+    sim.run()
@@ -1,6 +1,7 @@
 from sim_helpers import *
 
-from amaranth.lib import data
+from amaranth import *
+from amaranth.lib import data, wiring
 from amaranth.sim import Simulator, SimulatorContext
 
 from orbtrace.stream import *
@@ -34,3 +35,203 @@ def test_serializer():
         raise TimeoutError('Simulation timed out')
 
     sim.run()
+
+def test_packer():
+    dut = Packer(data.ArrayLayout(8, 4), pad = 0xaa)
+
+    sim = Simulator(dut)
+    sim.add_clock(1e-6)
+
+    @sim.add_testbench
+    async def input_testbench(ctx: SimulatorContext):
+        await ctx.tick()
+
+        await send_packet(ctx, dut.input, [1, 2, 3, 4, 5, 6])
+        await send_packet(ctx, dut.input, [7, 8, 9, 10])
+
+    @sim.add_testbench
+    async def output_testbench(ctx: SimulatorContext):
+        expected = [
+            ((1, 2, 3, 4), 0),
+            ((5, 6, 0xaa, 0xaa), 1),
+            ((7, 8, 9, 10), 1),
+        ]
+
+        for data, last in expected:
+            res = await stream_get(ctx, dut.output)
+            assert tuple(res.data) == data
+            assert res.last == last
+
+    @sim.add_process
+    async def timeout(ctx: SimulatorContext):
+        await ctx.tick().repeat(10_000)
+        raise TimeoutError('Simulation timed out')
+
+    sim.run()
+
+def test_serializer_last():
+    dut = Serializer(data.ArrayLayout(8, 3), has_last = True)
+
+    sim = Simulator(dut)
+    sim.add_clock(1e-6)
+
+    @sim.add_testbench
+    async def input_testbench(ctx: SimulatorContext):
+        await ctx.tick()
+
+        for payload in [(1, 2, 3), (4, 5, 6)]:
+            await stream_put(ctx, dut.input, payload)
+
+    @sim.add_testbench
+    async def output_testbench(ctx: SimulatorContext):
+        assert await recv_packet(ctx, dut.output) == [1, 2, 3]
+        assert await recv_packet(ctx, dut.output) == [4, 5, 6]
+
+    @sim.add_process
+    async def timeout(ctx: SimulatorContext):
+        await ctx.tick().repeat(10_000)
+        raise TimeoutError('Simulation timed out')
+
+    sim.run()
+
+def test_packet_arbiter():
+    dut = PacketArbiter(Packet(has_last = True), 2)
+
+    sim = Simulator(dut)
+    sim.add_clock(1e-6)
+
+    packets = [
+        [[1, 2, 3], [4], [5, 6]],
+        [[10, 11], [12, 13, 14]],
+    ]
+
+    for i in range(2):
+        @sim.add_testbench
+        async def input_testbench(ctx: SimulatorContext, i = i):
+            await ctx.tick()
+
+            for packet in packets[i]:
+                await send_packet(ctx, dut.input[i], packet)
+
+    @sim.add_testbench
+    async def output_testbench(ctx: SimulatorContext):
+        received = [await recv_packet(ctx, dut.output) for _ in range(5)]
+
+        # Packets are kept whole, in order per input, and both inputs get a turn.
+        for expected in packets:
+            assert [p for p in received if p[0] in sum(expected, [])] == expected
+
+        assert received[:2] in ([[1, 2, 3], [10, 11]], [[10, 11], [1, 2, 3]])
+
+    @sim.add_process
+    async def timeout(ctx: SimulatorContext):
+        await ctx.tick().repeat(10_000)
+        raise TimeoutError('Simulation timed out')
+
+    sim.run()
+
+def test_packet_fifo():
+    dut = PacketFIFO(Packet(has_last = True), 8)
+
+    sim = Simulator(dut)
+    sim.add_clock(1e-6)
+
+    @sim.add_testbench
+    async def input_testbench(ctx: SimulatorContext):
+        await ctx.tick()
+
+        for i, e in enumerate([1, 2, 3]):
+            await stream_put(ctx, dut.input, {'data': e, 'last': i == 2})
+            await ctx.tick().repeat(4)
+
+        # Larger than the FIFO, passed on once it fills up.
+        await send_packet(ctx, dut.input, list(range(10, 30)))
+
+    @sim.add_testbench
+    async def output_testbench(ctx: SimulatorContext):
+        ctx.set(dut.output.ready, 1)
+
+        # Nothing is offered until the packet is complete.
+        for _ in range(10):
+            assert not ctx.get(dut.output.valid)
+            await ctx.tick()
+
+        ctx.set(dut.output.ready, 0)
+
+        assert await recv_packet(ctx, dut.output) == [1, 2, 3]
+        assert await recv_packet(ctx, dut.output) == list(range(10, 30))
+
+    @sim.add_process
+    async def timeout(ctx: SimulatorContext):
+        await ctx.tick().repeat(10_000)
+        raise TimeoutError('Simulation timed out')
+
+    sim.run()
+
+class ArbitratedFIFOs(Elaboratable):
+    def __init__(self):
+        self.fifos = [PacketFIFO(Packet(has_last = True), 32) for _ in range(2)]
+        self.arbiter = PacketArbiter(Packet(has_last = True), 2)
+
+    def elaborate(self, platform):
+        m = Module()
+
+        m.submodules.arbiter = self.arbiter
+
+        for i, fifo in enumerate(self.fifos):
+            m.submodules[f'fifo_{i}'] = fifo
+            wiring.connect(m, fifo.output, self.arbiter.input[i])
+
+        return m
+
+def test_packet_fifo_arbiter():
+    dut = ArbitratedFIFOs()
+    fast, slow = (fifo.input for fifo in dut.fifos)
+
+    sim = Simulator(dut)
+    sim.add_clock(1e-6)
+
+    fast_packets = [list(range(i * 16, i * 16 + 16)) for i in range(12)]
+    slow_packet = list(range(200, 220))
+    stalls = []
+
+    @sim.add_testbench
+    async def fast_testbench(ctx: SimulatorContext):
+        await ctx.tick()
+
+        # Continuous frames, with a gap between packets for the arbiter to switch.
+        for packet in fast_packets:
+            ctx.set(fast.valid, 1)
+
+            for i, e in enumerate(packet):
+                ctx.set(fast.payload.data, e)
+                ctx.set(fast.payload.last, i == len(packet) - 1)
+                stalls.append(not ctx.get(fast.ready))
+                await ctx.tick()
+
+            ctx.set(fast.valid, 0)
+            await ctx.tick()
+
+    @sim.add_testbench
+    async def slow_testbench(ctx: SimulatorContext):
+        await ctx.tick()
+
+        # A packet trickling in over the whole run.
+        for i, e in enumerate(slow_packet):
+            await ctx.tick().repeat(8)
+            await stream_put(ctx, slow, {'data': e, 'last': i == len(slow_packet) - 1})
+
+    @sim.add_testbench
+    async def output_testbench(ctx: SimulatorContext):
+        received = [await recv_packet(ctx, dut.arbiter.output) for _ in range(13)]
+
+        assert [p for p in received if p != slow_packet] == fast_packets
+        assert slow_packet in received
+        assert not any(stalls)
+
+    @sim.add_process
+    async def timeout(ctx: SimulatorContext):
+        await ctx.tick().repeat(10_000)
+        raise TimeoutError('Simulation timed out')
+
+    sim.run()
@@ -1,5 +1,7 @@
 from sim_helpers import *
 
+import random
+
 from amaranth.sim import Simulator, SimulatorContext
 
 from orbtrace.trace import swo
@@ -101,3 +103,90 @@ def test_manchester_decoder():
         raise TimeoutError('Simulation timed out')
 
     sim.run()
+
+def manchester_pulses(rng, bits, half_bit, jitter):
+    # Start bit and data bits as half bit levels, each bit sending its value first.
+    halves = [1, 0] + [h for b in bits for h in (b, 1 - b)]
+    edges = [i for i in range(1, len(halves)) if halves[i] != halves[i - 1]] + [len(halves)]
+
+    # Edge times in samples, with random phase and jitter, counted in whole samples.
+    phase = rng.random()
+    times = [int(phase)] + [int(phase + e * half_bit + rng.uniform(-jitter, jitter)) for e in edges]
+
+    return [
+        {'level': 0, 'count': 50},
+        *[{'level': halves[e - 1], 'count': end - start} for e, start, end in zip(edges, times, times[1:])],
+        {'level': 0, 'count': 100},
+    ]
+
+def decode_manchester(seed, rate, jitter):
+    dut = swo.ManchesterDecoder()
+
+    sim = Simulator(dut)
+    sim.add_clock(1e-6)
+
+    rng = random.Random(seed)
+    bits = [rng.randrange(2) for _ in range(64)]
+
+    # 500 MHz sample rate.
+    pulses = manchester_pulses(rng, bits, 500e6 / rate / 2, jitter)
+    received = []
+
+    @sim.add_testbench
+    async def input_testbench(ctx: SimulatorContext):
+        for pulse in pulses:
+            await stream_put(ctx, dut.input, pulse)
+        await ctx.tick().repeat(10)
+
+    @sim.add_process
+    async def output_process(ctx: SimulatorContext):
+        ctx.set(dut.output.ready, 1)
+
+        async for _, _, valid, payload in ctx.tick().sample(dut.output.valid, dut.output.payload):
+            if valid:
+                received.append(payload.data)
+
+    sim.run()
+
+    return received[:64] == bits
+
+def test_manchester_decoder_jitter():
+    # At 55 MHz a half bit is about 4.5 samples, too short for the sync pulse alone to set the thresholds.
+    # Fixed thresholds decode about a third of these frames.
+    assert sum(decode_manchester(seed, 55e6, 3 / 16) for seed in range(10)) >= 9
+
+    # Slower rates are decoded reliably.
+    assert all(decode_manchester(seed, 12e6, 3 / 16) for seed in range(3))
+
+def test_auto_baud():
+    dut = swo.AutoBaud(window = 64)
+
+    sim = Simulator(dut)
+    sim.add_clock(1e-6)
+
+    # 37.5 samples per bit.
+    bitlen = 600
+
+    @sim.add_testbench
+    async def input_testbench(ctx: SimulatorContext):
+        await ctx.tick()
+
+        rng = random.Random(0)
+        level = 0
+        pos = 0
+
+        for _ in range(500):
+            run = rng.choice([1, 1, 1, 2, 3, 5])
+            start = pos
+            pos += run * bitlen
+            await stream_put(ctx, dut.input, {'level': level, 'count': (pos >> 4) - (start >> 4)})
+            level ^= 1
+
+            # Glitches and idle periods are ignored.
+            if rng.random() < 0.05:
+                await stream_put(ctx, dut.input, {'level': 1, 'count': rng.choice([1, 0x8000])})
+
+        assert ctx.get(dut.locked)
+        assert abs(ctx.get(dut.bitlen) - bitlen) <= 8
+
+    sim.run()
@@ -6,6 +6,49 @@ from amaranth.sim import Simulator, SimulatorContext
 
 from orbtrace.trace import tpiu
 
+def test_sync():
+    dut = tpiu.TPIUSync()
+
+    sim = Simulator(dut)
+    sim.add_clock(1e-6)
+
+    frames = [bytes(range(i * 16, (i + 1) * 16)) for i in range(4)]
+
+    @sim.add_testbench
+    async def input_testbench(ctx: SimulatorContext):
+        await ctx.tick()
+
+        stream = bytes.fromhex('12 34 56 ff ff ff 7f')
+        stream += frames[0]
+        stream += frames[1][:6] + bytes.fromhex('ff 7f') + frames[1][6:]
+        stream += frames[2] + frames[3]
+
+        ctx.set(dut.input.valid, 1)
+
+        for byte in stream:
+            ctx.set(dut.input.payload, byte)
+            _, _, ready = await ctx.tick().sample(dut.input.ready)
+
+            # No stall cycles while the output keeps up.
+            assert ready
+
+        ctx.set(dut.input.valid, 0)
+
+    @sim.add_testbench
+    async def output_testbench(ctx: SimulatorContext):
+        ctx.set(dut.output.ready, 1)
+
+        for frame in frames:
+            payload, = await ctx.tick().sample(dut.output.payload).until(dut.output.valid == 1)
+            assert bytes(payload) == frame
+
+    @sim.add_process
+    async def timeout(ctx: SimulatorContext):
+        await ctx.tick().repeat(10_000)
+        raise TimeoutError('Simulation timed out')
+
+    sim.run()
+
 def test_packetizer():
     dut = tpiu.Packetizer(timeout = 2000)
 
@@ -57,6 +100,66 @@ def test_packetizer_slow_timeout():
 
     sim.run()
 
+def test_packetizer_runtime_config():
+    dut = tpiu.Packetizer(timeout = 100_000, max_size_limit = 4096)
+
+    sim = Simulator(dut)
+    sim.add_clock(1e-6)
+
+    @sim.add_testbench
+    async def input_testbench(ctx: SimulatorContext):
+        ctx.set(dut.max_size, 2000)
+        await ctx.tick()
+
+        for i in range(2000):
+            await stream_put(ctx, dut.input, {'channel': 1, 'data': i & 0xff})
+        await ctx.tick().repeat(10)
+
+        ctx.set(dut.max_size, 1 << 20)
+        ctx.set(dut.timeout, 200)
+
+        for i in range(10):
+            await stream_put(ctx, dut.input, {'channel': 1, 'data': i})
+
+    @sim.add_testbench
+    async def output_testbench(ctx: SimulatorContext):
+        assert await recv_packet(ctx, dut.output) == [1, *((i & 0xff) for i in range(2000))]
+        assert await recv_packet(ctx, dut.output) == [1, *range(10)]
+
+    @sim.add_process
+    async def timeout(ctx: SimulatorContext):
+        await ctx.tick().repeat(20_000)
+        raise TimeoutError('Simulation timed out')
+
+    sim.run()
+
+def test_packetizer_timestamp():
+    dut = tpiu.Packetizer(timeout = 100)
+
+    sim = Simulator(dut)
+    sim.add_clock(1e-6)
+
+    @sim.add_testbench
+    async def input_testbench(ctx: SimulatorContext):
+        ctx.set(dut.timestamp_enable, 1)
+        ctx.set(dut.timestamp, 0x12345678)
+        await ctx.tick()
+
+        for i in range(4):
+            await stream_put(ctx, dut.input, {'channel': 3, 'data': i})
+            ctx.set(dut.timestamp, 0xdeadbeef)
+
+    @sim.add_testbench
+    async def output_testbench(ctx: SimulatorContext):
+        assert await recv_packet(ctx, dut.output) == [0x83, tpiu.FLAG_TIMESTAMP, 0x78, 0x56, 0x34, 0x12, 0, 1, 2, 3]
+
+    @sim.add_process
+    async def timeout(ctx: SimulatorContext):
+        await ctx.tick().repeat(10_000)
+        raise TimeoutError('Simulation timed out')
+
+    sim.run()
+
 def test_demux():
     dut = tpiu.TPIUDemux(timeout = 1000)
 
@@ -157,3 +260,111 @@ def test_demux():
         raise TimeoutError('Simulation timed out')
 
     sim.run()
+
+def test_demux_channel_mask():
+    dut = tpiu.TPIUDemux(timeout = 100)
+
+    sim = Simulator(dut)
+    sim.add_clock(1e-6)
+
+    @sim.add_testbench
+    async def input_testbench(ctx: SimulatorContext):
+        ctx.set(dut.channel_mask, 1 << 2)
+        await ctx.tick()
+
+        for channel, byte in [(1, 0x40), (2, 0x20), (1, 0x40), (3, 0x60)]:
+            await stream_put(ctx, dut.input, bytes([channel << 1 | 1, *([byte] * 14), 0]))
+
+    @sim.add_testbench
+    async def output_testbench(ctx: SimulatorContext):
+        assert await recv_packet(ctx, dut.output) == [2, *([0x20] * 14)]
+
+        ctx.set(dut.output.ready, 1)
+        for _ in range(1000):
+            assert not ctx.get(dut.output.valid)
+            await ctx.tick()
+
+    @sim.add_process
+    async def timeout(ctx: SimulatorContext):
+        await ctx.tick().repeat(10_000)
+        raise TimeoutError('Simulation timed out')
+
+    sim.run()
+
+def test_demux_channel_offset():
+    dut = tpiu.TPIUDemux(timeout = 100, channel_offset = 0x40)
+
+    sim = Simulator(dut)
+    sim.add_clock(1e-6)
+
+    @sim.add_testbench
+    async def input_testbench(ctx: SimulatorContext):
+        await ctx.tick()
+
+        # Channel 0x45 doesn't fit after the offset and is dropped.
+        for channel, byte in [(2, 0x20), (0x45, 0x40), (3, 0x60)]:
+            await stream_put(ctx, dut.input, bytes([channel << 1 | 1, *([byte] * 14), 0]))
+
+    @sim.add_testbench
+    async def output_testbench(ctx: SimulatorContext):
+        assert await recv_packet(ctx, dut.output) == [0x42, *([0x20] * 14)]
+        assert await recv_packet(ctx, dut.output) == [0x43, *([0x60] * 14)]
+
+        ctx.set(dut.output.ready, 1)
+        for _ in range(1000):
+            assert not ctx.get(dut.output.valid)
+            await ctx.tick()
+
+    @sim.add_process
+    async def timeout(ctx: SimulatorContext):
+        await ctx.tick().repeat(10_000)
+        raise TimeoutError('Simulation timed out')
+
+    sim.run()
+
+def test_itm_filter():
+    dut = tpiu.ITMFilter()
+
+    sim = Simulator(dut)
+    sim.add_clock(1e-6)
+
+    packets = [
+        (1, [0x19, 0x42], False),                   # Stimulus port 3
+        (1, [0x01, 0x11], True),                    # Stimulus port 0
+        (1, [0x0b, 0xaa, 0xbb, 0xcc, 0xdd], True),  # Stimulus port 1, four bytes
+        (1, [0x45, 0x99], False),                   # Hardware source
+        (2, [0x19, 0x45], True),                    # Not on the ITM channel
+        (1, [0xc0, 0x81, 0x01], True),              # Local timestamp
+        (1, [0x70], True),                          # Overflow
+        (1, [0x00, 0x00, 0x80], False),             # Sync
+        (1, [0x94, 0x85, 0x03], True),              # Global timestamp
+        (1, [0x08], True),                          # Extension
+        (1, [0x8c, 0x19], True),                    # Extension with SH set
+    ]
+
+    @sim.add_testbench
+    async def input_testbench(ctx: SimulatorContext):
+        ctx.set(dut.config.ports, 0xffffffff & ~(1 << 3))
+        ctx.set(dut.config.types, 0xff & ~(1 << tpiu.ITM_HARDWARE | 1 << tpiu.ITM_SYNC))
+        await ctx.tick()
+
+        for channel, packet, _ in packets:
+            for byte in packet:
+                await stream_put(ctx, dut.input, {'channel': channel, 'data': byte})
+
+    @sim.add_testbench
+    async def output_testbench(ctx: SimulatorContext):
+        for channel, packet, keep in packets:
+            if not keep:
+                continue
+
+            for byte in packet:
+                res = await stream_get(ctx, dut.output)
+                assert (res.channel, res.data) == (channel, byte)
+
+    @sim.add_process
+    async def timeout(ctx: SimulatorContext):
+        await ctx.tick().repeat(10_000)
+        raise TimeoutError('Simulation timed out')
+
+    sim.run()
@@ -0,0 +1,84 @@
+from amaranth import *
+from amaranth.sim import Simulator, SimulatorContext
+
+from usb_protocol.types import USBRequestType, USBRequestRecipient
+
+from orbtrace.trace.usb_handler import TraceUSBHandler
+
+class DUT(Elaboratable):
+    def __init__(self):
+        self.handler = TraceUSBHandler(1, 2)
+
+    def elaborate(self, platform):
+        m = Module()
+        m.domains.usb = ClockDomain()
+        m.submodules.handler = self.handler
+        return m
+
+def run(requests):
+    dut = DUT()
+    handler = dut.handler
+    interface = handler.interface
+    results = []
+
+    sim = Simulator(dut)
+    sim.add_clock(1e-6, domain = 'usb')
+
+    @sim.add_testbench
+    async def testbench(ctx: SimulatorContext):
+        for request, length, payload in requests:
+            ctx.set(interface.setup.recipient, USBRequestRecipient.INTERFACE)
+            ctx.set(interface.setup.type, USBRequestType.VENDOR)
+            ctx.set(interface.setup.request, request)
+            ctx.set(interface.setup.index, 1)
+            ctx.set(interface.setup.length, length)
+            ctx.set(interface.setup.received, 1)
+            await ctx.tick('usb')
+            ctx.set(interface.setup.received, 0)
+            await ctx.tick('usb').repeat(2)
+
+            for b in payload:
+                ctx.set(interface.rx.valid, 1)
+                ctx.set(interface.rx.next, 1)
+                ctx.set(interface.rx.payload, b)
+                await ctx.tick('usb')
+            ctx.set(interface.rx.valid, 0)
+            ctx.set(interface.rx.next, 0)
+
+            stalled = False
+            strobed = False
+
+            if payload:
+                ctx.set(interface.rx_ready_for_response, 1)
+                stalled |= ctx.get(interface.handshakes_out.stall)
+                await ctx.tick('usb')
+                ctx.set(interface.rx_ready_for_response, 0)
+
+            if not stalled:
+                ctx.set(interface.status_requested, 1)
+                stalled |= ctx.get(interface.handshakes_out.stall)
+                strobed = ctx.get(handler.register_strobe)
+                await ctx.tick('usb')
+                ctx.set(interface.status_requested, 0)
+
+            await ctx.tick('usb').repeat(2)
+            results.append((stalled, strobed, ctx.get(handler.packetizer.as_value())))
+
+    sim.run()
+
+    return results
+
+def value(max_size, timeout):
+    return max_size | timeout << 32
+
+def test_set_register():
+    results = run([
+        (0x07, 8, (100).to_bytes(4, 'little') + (200).to_bytes(4, 'little')),
+        # Short and long writes are stalled and leave the value as it was.
+        (0x07, 4, (300).to_bytes(4, 'little')),
+        (0x07, 9, bytes(9)),
+        (0x07, 0, b''),
+    ])
+
+    assert results[0] == (False, True, value(100, 200))
+    assert results[1:] == [(True, False, value(100, 200))] * 3
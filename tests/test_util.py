@@ -0,0 +1,77 @@
+from sim_helpers import *
+
+import random
+
+from amaranth.lib import stream
+from amaranth.sim import Simulator, SimulatorContext
+
+from orbtrace.trace import util
+
+def test_monitor():
+    input = stream.Signature(8).create()
+    dut = util.Monitor(input, 'sync', 32)
+
+    sim = Simulator(dut)
+    sim.add_clock(1e-6)
+
+    @sim.add_testbench
+    async def testbench(ctx: SimulatorContext):
+        ctx.set(input.valid, 1)
+        ctx.set(input.ready, 1)
+        await ctx.tick().repeat(300)
+
+        ctx.set(input.ready, 0)
+        await ctx.tick().repeat(100)
+
+        ctx.set(input.valid, 0)
+        await ctx.tick().repeat(10)
+
+        assert ctx.get(dut.total) == 400
+        assert ctx.get(dut.lost) == 100
+
+    sim.run()
+
+def divide(dut, vectors):
+    results = []
+
+    sim = Simulator(dut)
+    sim.add_clock(1e-6)
+
+    @sim.add_testbench
+    async def testbench(ctx: SimulatorContext):
+        for num, den in vectors:
+            ctx.set(dut.num, num)
+            ctx.set(dut.den, den)
+            ctx.set(dut.start, 1)
+            await ctx.tick()
+            ctx.set(dut.start, 0)
+
+            res, = await ctx.tick().sample(dut.res).until(dut.done == 1)
+            results.append(res)
+
+    sim.run()
+
+    return results
+
+def test_divider():
+    dut = util.Divider(32, 32, 32)
+
+    rng = random.Random(0)
+
+    vectors = [
+        (0, 1), (1, 1), (2**32 - 1, 1), (2**32 - 1, 2**32 - 1), (2**32 - 2, 2**32 - 1),
+        (1, 2**32 - 1), (2**31, 3), (12345, 0),
+    ]
+
+    # Log-uniform operands to cover the whole range of quotient lengths.
+    for _ in range(500):
+        vectors.append((rng.getrandbits(rng.randint(1, 32)), rng.getrandbits(rng.randint(1, 32))))
+
+    assert divide(dut, vectors) == [num // den if den else 2**32 - 1 for num, den in vectors]
+
+def test_divider_saturate():
+    dut = util.Divider(34, 32, 20)
+
+    dens = [1, 7629, 7630, 115200, 2_000_000, 2**32 - 1]
+
+    assert divide(dut, [(8_000_000_000, den) for den in dens]) == [min(8_000_000_000 // den, 2**20 - 1) for den in dens]